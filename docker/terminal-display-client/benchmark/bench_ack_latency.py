@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""ACK latency benchmark of terminal_display_client.py under heavy API load.
+
+Starts the display client as a separate process against a fake Terminal
+System API with long /events and /agent/measurements histories and a fake
+display on a pseudo terminal that acknowledges every command at once, once
+with the API polling in the serial process and once with api_process = yes.
+
+The display client waits 0.1 s after each ACK before it sends the next
+command. The time between two commands beyond that is how long the client
+took to handle the ACK and build the next command; it grows when collecting
+the page contents holds the GIL. Commands sent twice in a row are resends
+after an ACK timeout.
+
+Usage:
+    python benchmark/bench_ack_latency.py [--duration SEC] [--history N]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from fake_display import FakeDisplay
+from fake_terminal_system import FakeAPIServer, FakeTerminalSystem
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLIENT = os.path.join(ROOT, "usr", "bin", "terminal_display_client.py")
+LIB = os.path.join(ROOT, "usr", "local", "lib")
+
+# Sleep of CommandSender after each ACK.
+ACK_INTERVAL = 0.1
+
+CONFIG = """[general]
+serial_path = {serial_path}
+reset = no
+api_url = {api_url}
+log_level = info
+api_process = {api_process}
+
+[m5stack]
+volume = 0
+time_zone = 9
+"""
+
+
+def run_client(api_url, api_process, duration):
+    display = FakeDisplay().start()
+    with tempfile.NamedTemporaryFile("w", suffix=".conf", delete=False) as f:
+        f.write(
+            CONFIG.format(
+                serial_path=display.port, api_url=api_url, api_process=api_process
+            )
+        )
+        config_file = f.name
+
+    env = dict(os.environ)
+    env["PYTHONPATH"] = LIB
+    try:
+        proc = subprocess.Popen(
+            [sys.executable, CLIENT, "-f", config_file],
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            # Skip the startup, it sends the whole list screen.
+            display.wait_for(b'"setup_end"', 60)
+            start = time.monotonic()
+            time.sleep(duration)
+        finally:
+            proc.terminate()
+            proc.wait()
+    finally:
+        display.stop()
+        os.unlink(config_file)
+
+    return [(ts, command) for ts, command in display.commands if ts >= start]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--history", type=int, default=20000)
+    parser.add_argument("--device-connectors", type=int, default=8)
+    args = parser.parse_args()
+
+    system = FakeTerminalSystem(
+        device_connectors=args.device_connectors, history_limit=args.history
+    )
+    for _ in range(args.history):
+        system.tick()
+    server = FakeAPIServer(system).start()
+
+    # Keep the contents changing so that every cycle collects and draws.
+    stopped = threading.Event()
+
+    def tick():
+        while not stopped.wait(0.2):
+            system.tick()
+
+    threading.Thread(target=tick, daemon=True).start()
+
+    try:
+        for api_process in ("no", "yes"):
+            commands = run_client(server.base_url, api_process, args.duration)
+            gaps = [
+                (b[0] - a[0] - ACK_INTERVAL) * 1000
+                for a, b in zip(commands, commands[1:])
+            ]
+            resends = sum(a[1] == b[1] for a, b in zip(commands, commands[1:]))
+            if len(gaps) < 2:
+                print(f"api_process = {api_process}: not enough commands")
+                continue
+            quantiles = statistics.quantiles(gaps, n=100)
+            print(
+                f"api_process = {api_process}: {len(commands)} commands, "
+                f"latency p50 {quantiles[49]:.1f} ms, p99 {quantiles[98]:.1f} ms, "
+                f"max {max(gaps):.1f} ms, resends {resends}"
+            )
+    finally:
+        stopped.set()
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
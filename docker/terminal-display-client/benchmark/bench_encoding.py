@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""Byte count of the display protocol per command encoding.
+
+Runs the startup and the refresh cycles of terminal_display_client.py
+in-process against FakeAPIClient, with device connectors replaced regularly
+so that pages are redrawn, and counts the bytes sent to the display with
+each command encoding. The serial link runs at 115200 baud, i.e. about
+11.5 bytes per millisecond.
+
+Usage:
+    python benchmark/bench_encoding.py [-n CYCLES] [--device-connectors N]
+"""
+
+import argparse
+
+from fake_client import ROOT, load_client, make_client
+from fake_terminal_system import FakeTerminalSystem
+
+BYTES_PER_SEC = 115200 / 10
+
+
+def run(root, encoding_name, cycles, device_connectors, churn_every):
+    system = FakeTerminalSystem(
+        device_connectors=device_connectors, churn_every=churn_every
+    )
+    module = load_client(root, system)
+    client = make_client(module)
+    sender = client._cmd_sender
+    encoding = {
+        module.TextEncoding.NAME: module.TextEncoding,
+        module.BinaryEncoding.NAME: module.BinaryEncoding,
+    }[encoding_name]
+    sender.set_encoding(encoding())
+
+    api_response = module.ApiResponse(client._backend)
+    screens = client._build_screens(api_response)
+    startup = (sender.commands, sender.bytes_sent)
+
+    for _ in range(cycles):
+        system.tick()
+        client._refresh_cycle(api_response, *screens)
+
+    return startup, (sender.commands - startup[0], sender.bytes_sent - startup[1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--root", default=ROOT, help="terminal-display-client dir")
+    parser.add_argument("-n", "--cycles", type=int, default=1000)
+    parser.add_argument("--device-connectors", type=int, default=8)
+    parser.add_argument("--churn-every", type=int, default=10)
+    args = parser.parse_args()
+
+    results = {}
+    for name in ("text", "bin1"):
+        results[name] = run(
+            args.root, name, args.cycles, args.device_connectors, args.churn_every
+        )
+
+    for label, index in (("startup", 0), (f"{args.cycles} cycles", 1)):
+        text_bytes = results["text"][index][1]
+        for name, result in results.items():
+            commands, sent = result[index]
+            print(
+                f"{label:12s} {name:5s} {commands:6d} commands {sent:8d} B "
+                f"({sent / max(commands, 1):5.1f} B/command, "
+                f"{sent / BYTES_PER_SEC:6.2f} s on the wire, "
+                f"{sent / text_bytes:4.0%} of text)"
+            )
+
+
+if __name__ == "__main__":
+    main()
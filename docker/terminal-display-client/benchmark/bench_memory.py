@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""Memory benchmark of the display client refresh cycle.
+
+Runs the refresh cycle of terminal_display_client.py (collect the page
+contents from the API responses and update the screens) in-process against
+FakeAPIClient and a fake serial link, and reports with tracemalloc the most memory held above the baseline while
+rendering a cycle, i.e. the objects the cycle allocates.
+
+Fetching the API responses is not part of the measurement. With --rebuild
+the collector results are not reused, as if every section had changed.
+
+To compare two revisions, run it against another checkout:
+
+    git worktree add /tmp/before HEAD~1
+    python benchmark/bench_memory.py --root /tmp/before/docker/terminal-display-client
+    python benchmark/bench_memory.py
+
+Usage:
+    python benchmark/bench_memory.py [--root DIR] [-n CYCLES] [--rebuild]
+"""
+
+import argparse
+import statistics
+import tracemalloc
+
+from fake_client import ROOT, load_client, make_client
+from fake_terminal_system import FakeTerminalSystem
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--root", default=ROOT, help="terminal-display-client dir")
+    parser.add_argument("-n", "--cycles", type=int, default=200)
+    parser.add_argument("--device-connectors", type=int, default=4)
+    parser.add_argument("--rebuild", action="store_true")
+    args = parser.parse_args()
+
+    system = FakeTerminalSystem(device_connectors=args.device_connectors)
+    module = load_client(args.root, system)
+    widget = module.widget
+
+    client = make_client(module)
+
+    # Same steps as _send_thread(), without the startup commands.
+    api_response = module.ApiResponse(client._backend)
+    api_response.update()
+    main_screen = widget.MainScreen(client._cmd_sender)
+    list_screen = widget.ListScreen(client._cmd_sender)
+    top_page = widget.Page(widget.PageOptions("Top"))
+    list_screen.append_page(
+        top_page, client._collect("_collect_top_page_items", api_response)
+    )
+    for name in module.LIST_SCREEN_COLLECTORS:
+        for page, items in client._collect(name, api_response):
+            list_screen.append_page(page, items)
+    list_screen.build()
+
+    def render():
+        main_screen.update(
+            client._collect("_collect_main_screen_content", api_response)
+        )
+        list_screen.update_page(
+            top_page, client._collect("_collect_top_page_items", api_response)
+        )
+        for name in module.LIST_SCREEN_COLLECTORS:
+            for page, items in client._collect(name, api_response):
+                list_screen.update_page(page, items)
+        list_screen.delete_unupdated_page_items()
+
+    tracemalloc.start()
+    peaks = []
+    for i in range(args.cycles + 10):
+        system.tick()
+        api_response.update()
+        if args.rebuild:
+            client._collector_cache.clear()
+
+        base, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        render()
+        _, peak = tracemalloc.get_traced_memory()
+
+        # The first cycles fill the caches.
+        if i >= 10:
+            peaks.append(peak - base)
+    tracemalloc.stop()
+
+    print(f"root: {args.root}")
+    print(f"cycles: {args.cycles}, commands: {client._cmd_sender.commands}")
+    print(
+        f"peak: median {statistics.median(peaks) / 1024:.1f} KiB, "
+        f"max {max(peaks) / 1024:.1f} KiB per cycle"
+    )
+
+
+if __name__ == "__main__":
+    main()
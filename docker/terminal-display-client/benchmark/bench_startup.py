@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""Startup benchmark for terminal_display_client.py.
+
+Starts the display client as a separate process against a fake Terminal
+System API and a fake display on a pseudo terminal, and measures the time
+from process start to the first frame, i.e. the first main screen icon
+command received by the display.
+
+NOTE: The time before the process starts, i.e. creating and starting the
+container up to its entrypoint, is not included.
+
+It also prints the slowest imports of the client reported by
+``python -X importtime``.
+
+Usage:
+    python benchmark/bench_startup.py [-n RUNS]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from fake_display import FakeDisplay
+from fake_terminal_system import FakeAPIServer, FakeTerminalSystem
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLIENT = os.path.join(ROOT, "usr", "bin", "terminal_display_client.py")
+LIB = os.path.join(ROOT, "usr", "local", "lib")
+
+CONFIG = """[general]
+serial_path = {serial_path}
+reset = no
+api_url = {api_url}
+log_level = info
+
+[m5stack]
+volume = 0
+time_zone = 9
+"""
+
+
+def env():
+    e = dict(os.environ)
+    e["PYTHONPATH"] = LIB
+    return e
+
+
+def measure_first_frame(api_url, timeout):
+    display = FakeDisplay().start()
+    with tempfile.NamedTemporaryFile("w", suffix=".conf", delete=False) as f:
+        f.write(CONFIG.format(serial_path=display.port, api_url=api_url))
+        config_file = f.name
+
+    try:
+        start = time.monotonic()
+        proc = subprocess.Popen(
+            [sys.executable, CLIENT, "-f", config_file],
+            env=env(),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            first_command = display.wait_for(b'"', timeout)
+            first_frame = display.wait_for(b'"mode":', timeout)
+        finally:
+            proc.terminate()
+            proc.wait()
+    finally:
+        display.stop()
+        os.unlink(config_file)
+
+    if first_frame is None:
+        raise RuntimeError("no frame received from the display client")
+    return first_command - start, first_frame - start
+
+
+def import_profile(top):
+    code = (
+        "import importlib.util\n"
+        f"spec = importlib.util.spec_from_file_location('client', {CLIENT!r})\n"
+        "spec.loader.exec_module(importlib.util.module_from_spec(spec))\n"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        env=env(),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    imports = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if name.strip() == "site":
+            # Everything up to here is interpreter startup, not the client.
+            imports = []
+            continue
+        if cumulative.strip().isdigit():
+            imports.append((int(cumulative), name.rstrip()))
+    # Top-level imports only, i.e. the ones the client itself pays for.
+    top_level = [(us, name) for us, name in imports if not name.startswith("  ")]
+    total = sum(us for us, _ in top_level)
+    return total, sorted(imports, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    total, slowest = import_profile(args.top)
+    print(f"imports: {total / 1000:.1f} ms total")
+    for us, name in slowest:
+        print(f"  {us / 1000:8.1f} ms {name}")
+
+    server = FakeAPIServer(FakeTerminalSystem()).start()
+    try:
+        first_commands = []
+        first_frames = []
+        for _ in range(args.runs):
+            first_command, first_frame = measure_first_frame(
+                server.base_url, args.timeout
+            )
+            first_commands.append(first_command)
+            first_frames.append(first_frame)
+    finally:
+        server.stop()
+
+    for label, values in (
+        ("first command", first_commands),
+        ("first frame", first_frames),
+    ):
+        print(
+            f"{label}: median {statistics.median(values) * 1000:.0f} ms, "
+            f"min {min(values) * 1000:.0f} ms, max {max(values) * 1000:.0f} ms "
+            f"({len(values)} runs)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""Run terminal_display_client.py in-process for the benchmarks.
+
+load_client() imports the client of a checkout with its Terminal System API
+client replaced by FakeAPIClient and its serial link replaced by a fake one
+that acknowledges every command at once.
+"""
+
+import importlib.util
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from fake_terminal_system import FakeAPIClient
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONFIG = """[general]
+serial_path = /dev/null
+reset = no
+api_url = http://fake/api
+log_level = info
+
+[m5stack]
+volume = 0
+time_zone = 9
+"""
+
+
+def fake_command_sender(cmd):
+    """Return a CommandSender class of the terminal_display_command module cmd
+    that writes to a fake serial link instead of the display."""
+
+    class FakeCommandSender(cmd.CommandSender):
+        def __init__(self, serial_option=None, tz=None):
+            self._lock = threading.Lock()
+            self._cmd_id = 0
+            self._tz = tz
+            self._encoding = getattr(cmd, "TEXT_ENCODING", None)
+            self._link_down = False
+            self._last_ack = time.monotonic()
+            if hasattr(cmd, "ErrorReporter"):
+                self._error_reporter = cmd.ErrorReporter(self)
+            self.commands = 0
+            self.bytes_sent = 0
+
+        def _send_command(self, command, *fields):
+            if self._encoding is None:
+                # A checkout from before the command encodings.
+                data = (command + "@" + str(self._cmd_id)).encode()
+            else:
+                data = self._encode(command, fields)
+            self._cmd_id = (self._cmd_id + 1) % 10
+            self.commands += 1
+            self.bytes_sent += len(data)
+            return True
+
+        def reset(self):
+            pass
+
+    return FakeCommandSender
+
+
+def load_client(root, system):
+    """Import the client module of the checkout root against system."""
+    sys.path.insert(0, os.path.join(root, "usr", "local", "lib"))
+    import terminal_display_backend as bk
+    import terminal_display_command as cmd
+
+    bk.TerminalSystemAPIClient = lambda base_uri: FakeAPIClient(system, base_uri)
+
+    spec = importlib.util.spec_from_file_location(
+        "terminal_display_client",
+        os.path.join(root, "usr", "bin", "terminal_display_client.py"),
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.CommandSender = fake_command_sender(cmd)
+    module.CommandReceiver = lambda serial_option: None
+    return module
+
+
+def make_client(module):
+    with tempfile.NamedTemporaryFile("w", suffix=".conf") as f:
+        f.write(CONFIG)
+        f.flush()
+        return module.TerminalDisplayClient(f.name)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""Fake terminal display (M5Stack) on a pseudo terminal for the benchmarks.
+
+The display client opens FakeDisplay.port like the real /dev/ttyM5Stack.
+Every command is answered with an ACK frame and recorded with the time it
+arrived. With encodings, it announces them in reply to "version" and also
+accepts binary frames (recorded as the opcode byte followed by the fields).
+With baudrates, it announces those too; the pseudo terminal has no baud
+rate, so "set_baud" is only acknowledged.
+"""
+
+import os
+import re
+import select
+import threading
+import time
+import tty
+
+# A text command ends with "@<cmd_id>".
+TEXT_COMMAND_RE = re.compile(rb"(.*?)@(\d)", re.DOTALL)
+# A binary frame starts with STX and the length of the rest (uint16 BE).
+STX = 0x02
+
+
+class FakeDisplay:
+    def __init__(self, ack_delay=0.0, encodings=None, baudrates=None):
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._master)
+        self.port = os.ttyname(self._slave)
+        self._ack_delay = ack_delay
+        # e.g. ("text", "bin1")
+        self._encodings = encodings
+        # e.g. (115200, 921600)
+        self._baudrates = baudrates
+        self._buf = bytearray()
+        self._lock = threading.Condition()
+        self._stopped = False
+        # (monotonic time, command bytes)
+        self.commands = []
+        self.bytes_received = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped = True
+        self._thread.join(timeout=1)
+        os.close(self._master)
+        os.close(self._slave)
+
+    def send(self, frame: bytes):
+        """Send a frame (without the trailing CRLF) to the client."""
+        os.write(self._master, frame + b"\r\n")
+
+    def wait_for(self, pattern: bytes, timeout=None):
+        """Wait for a command containing pattern and return its arrival time."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            index = 0
+            while True:
+                for ts, command in self.commands[index:]:
+                    if pattern in command:
+                        return ts
+                index = len(self.commands)
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._lock.wait(remaining)
+
+    def _run(self):
+        while not self._stopped:
+            readable, _, _ = select.select([self._master], [], [], 0.1)
+            if not readable:
+                continue
+            try:
+                data = os.read(self._master, 4096)
+            except OSError:
+                return
+            now = time.monotonic()
+            self.bytes_received += len(data)
+            self._buf += data
+
+            commands = []
+            while True:
+                if self._buf[:1] == bytes((STX,)):
+                    if len(self._buf) < 3:
+                        break
+                    end = 3 + int.from_bytes(self._buf[1:3], "big")
+                    if len(self._buf) < end:
+                        break
+                    # Without cmd_id.
+                    commands.append(bytes(self._buf[4:end]))
+                    del self._buf[:end]
+                    continue
+                match = TEXT_COMMAND_RE.match(self._buf)
+                if not match:
+                    break
+                commands.append(match.group(1))
+                del self._buf[: match.end()]
+
+            if commands:
+                with self._lock:
+                    self.commands.extend((now, command) for command in commands)
+                    self._lock.notify_all()
+                for command in commands:
+                    if self._encodings and command == b'"version"':
+                        self.send(
+                            b'"encodings":"' + ",".join(self._encodings).encode() + b'"'
+                        )
+                    if self._baudrates and command == b'"version"':
+                        self.send(
+                            b'"baudrates":"'
+                            + ",".join(map(str, self._baudrates)).encode()
+                            + b'"'
+                        )
+                    if self._ack_delay:
+                        time.sleep(self._ack_delay)
+                    self.send(b'"ack"')
@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""Fake Terminal System API for the benchmarks.
+
+FakeTerminalSystem generates the JSON documents served by the Terminal System
+API. It can be used in-process through FakeAPIClient, which has the same
+methods as terminal_display_backend.TerminalSystemAPIClient, or over HTTP
+through FakeAPIServer.
+"""
+
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+from urllib.parse import urlsplit
+
+import requests
+
+
+class FakeTerminalSystem:
+    def __init__(self, device_connectors=4, churn_every=0, history_limit=0):
+        self._device_connectors = device_connectors
+        # Replace one device connector with a new one every churn_every cycles.
+        self._churn_every = churn_every
+        # /events and /agent/measurements grow by one entry per cycle up to
+        # history_limit entries, like on a terminal that has been running long.
+        self._history_limit = history_limit
+        # Every request fails with 503 while this is False.
+        self.available = True
+        self._cycle = 0
+        self._lock = threading.Lock()
+
+    def tick(self):
+        with self._lock:
+            self._cycle += 1
+
+    def _now(self):
+        return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    def _history(self):
+        return max(1, min(self._cycle, self._history_limit))
+
+    def _dc_ids(self):
+        generation = self._cycle // self._churn_every if self._churn_every else 0
+        return [
+            f"dc-{i}-{generation if i == 0 else 0}"
+            for i in range(self._device_connectors)
+        ]
+
+    def get(self, path):
+        with self._lock:
+            return self._get(path)
+
+    def _get(self, path):
+        now = self._now()
+        dc_ids = self._dc_ids()
+
+        if path == "/terminal_system":
+            return {"os_version": "1.1.2"}
+        if path == "/terminal_system/identification":
+            return {"computer_name": "fake-terminal"}
+        if path.startswith("/network/route/"):
+            return {"nic_name": "wwan0"}
+        if path == "/network_devices":
+            return [
+                {
+                    "device_name": "cdc-wdm0",
+                    "device_type": "modem",
+                    "nic_name": "wwan0",
+                    "ip_address": "10.0.0.2",
+                    "gateway": "10.0.0.1",
+                },
+                {
+                    "device_name": "eth0",
+                    "device_type": "ethernet",
+                    "nic_name": "eth0",
+                    "ip_address": "",
+                    "gateway": "",
+                },
+            ]
+        if path == "/network_connections":
+            return [
+                {
+                    "connection_type": "gsm",
+                    "display_name": "LTE",
+                    "device_name": "cdc-wdm0",
+                    "enabled": True,
+                    "gsm_settings": {"apn": "fake.apn"},
+                },
+                {
+                    "connection_type": "ethernet",
+                    "display_name": "LAN",
+                    "device_name": "eth0",
+                    "enabled": True,
+                },
+            ]
+        if path == "/terminal_system/metrics":
+            return {
+                "mmcli": [
+                    {
+                        "sim": {"properties": {"operator-name": "FAKE"}},
+                        "signal": {"lte": {"rssi": str(-70 - self._cycle % 5)}},
+                        "generic": {"current-modes": "allowed: 4g; preferred: 4g"},
+                    }
+                ],
+                "top": [
+                    {
+                        "cpu_idle": 80.0 - self._cycle % 10,
+                        "cpu_wait": 1.0,
+                        "load_1m": 0.5,
+                        "mem_total": 4096,
+                        "mem_used": 1024,
+                    }
+                ],
+                "data_partition": {"total": 64 * 1024**3, "available": 32 * 1024**3},
+                "gps": {"nmea": {"fix": "3D fix"}},
+            }
+        if path == "/agent/connection":
+            return {"server_url": "https://localhost/"}
+        if path == "/agent/upstreams":
+            return [
+                {
+                    "id": "up0",
+                    "enabled": True,
+                    "persist_realtime_data": True,
+                    "deferred_upload": True,
+                    "qos": "unreliable",
+                }
+            ]
+        if path == "/agent/upstreams/-/state":
+            return [{"id": "up0", "code": "connected", "update_time": now}]
+        if path == "/agent/downstreams":
+            return [
+                {
+                    "id": "down0",
+                    "enabled": True,
+                    "dest_ids": ["dest0"],
+                    "filters": [],
+                }
+            ]
+        if path == "/agent/downstreams/-/state":
+            return [{"id": "down0", "code": "connected", "update_time": now}]
+        if path == "/agent/deferred_upload":
+            return {
+                "priority": "same_as_realtime",
+                "auto_delete": False,
+                "auto_delete_threshold": 1024,
+            }
+        if path == "/agent/deferred_upload/state":
+            return {"code": "quiet", "update_time": now, "bitrate": 8000}
+        if path == "/agent/measurements":
+            return [
+                {
+                    "uuid": f"meas-{i}",
+                    "pending_data_size": (
+                        1024 * 1024 * (1 + self._cycle % 3) if i == 0 else 0
+                    ),
+                }
+                for i in range(self._history())
+            ]
+        if path in (
+            "/agent/device_connectors_upstream",
+            "/agent/device_connectors_downstream",
+        ):
+            return []
+        if path in (
+            "/agent/device_connectors_upstream/-/state",
+            "/agent/device_connectors_downstream/-/state",
+        ):
+            return [
+                {"id": f"{dc_id}-ipc", "code": "connected", "update_time": now}
+                for dc_id in dc_ids
+            ]
+        if path == "/device_connectors":
+            return [
+                {
+                    "id": dc_id,
+                    "service_id": ("GPS", "CAN", "Camera", "Analog")[i % 4],
+                    "upstream_ipc_ids": [f"{dc_id}-ipc"],
+                    "downstream_ipc_ids": [],
+                    "service_substitutions": [
+                        "DC_DEVICE_PATH=/dev/fake" + str(i),
+                        "DC_BAUDRATE=500000",
+                    ],
+                }
+                for i, dc_id in enumerate(dc_ids)
+            ]
+        if path == "/device_connector_services":
+            return [
+                {
+                    "service_id": service_id,
+                    "substitution_variables": [
+                        {"key": "DC_DEVICE_PATH", "default": "/dev/null"},
+                        {
+                            "key": "DC_BAUDRATE",
+                            "default": "115200",
+                            "display_strings_i18n": [{"unit": "bps"}],
+                        },
+                    ],
+                }
+                for service_id in ("GPS", "CAN", "Camera", "Analog")
+            ]
+        if path == "/events":
+            return [
+                {"description": f"fake {i}", "level": "WARN", "create_time": now}
+                for i in range(self._history())
+            ]
+        if path == "/docker/composes/measurement":
+            return {"boot_after": "system"}
+        return None
+
+
+class FakeAPIClient:
+    """In-process replacement for TerminalSystemAPIClient."""
+
+    def __init__(self, system: FakeTerminalSystem, base_url="http://fake/api"):
+        self.base_url = base_url
+        self._system = system
+
+    def _get(self, path):
+        if not self._system.available:
+            return self._response(503, {"error": "unavailable"})
+        return self._response(200, self._system.get(path))
+
+    def _response(self, status_code, obj):
+        resp = requests.Response()
+        resp.status_code = status_code
+        resp._content = json.dumps(obj).encode()
+        return resp
+
+    def get_terminal_system(self):
+        return self._get("/terminal_system")
+
+    def get_terminal_system_identification(self):
+        return self._get("/terminal_system/identification")
+
+    def get_network_route(self, ip):
+        return self._get("/network/route/" + ip)
+
+    def get_network_devices(self):
+        return self._get("/network_devices")
+
+    def get_network_connections(self):
+        return self._get("/network_connections")
+
+    def get_terminal_system_metrics(self):
+        return self._get("/terminal_system/metrics")
+
+    def get_connection(self):
+        return self._get("/agent/connection")
+
+    def list_upstream(self):
+        return self._get("/agent/upstreams")
+
+    def list_upstream_state(self):
+        return self._get("/agent/upstreams/-/state")
+
+    def list_downstream(self):
+        return self._get("/agent/downstreams")
+
+    def list_downstream_state(self):
+        return self._get("/agent/downstreams/-/state")
+
+    def get_deferred_upload(self):
+        return self._get("/agent/deferred_upload")
+
+    def get_deferred_upload_state(self):
+        return self._get("/agent/deferred_upload/state")
+
+    def list_measurements(self):
+        return self._get("/agent/measurements")
+
+    def list_device_connectors_for_upstream(self):
+        return self._get("/agent/device_connectors_upstream")
+
+    def list_device_connector_state_for_upstream(self):
+        return self._get("/agent/device_connectors_upstream/-/state")
+
+    def list_device_connectors_for_downstream(self):
+        return self._get("/agent/device_connectors_downstream")
+
+    def list_device_connector_state_for_downstream(self):
+        return self._get("/agent/device_connectors_downstream/-/state")
+
+    def list_device_connectors(self):
+        return self._get("/device_connectors")
+
+    def list_device_connector_services(self):
+        return self._get("/device_connector_services")
+
+    def list_events(self):
+        return self._get("/events")
+
+    def get_compose_measurement(self):
+        return self._get("/docker/composes/measurement")
+
+    def patch_compose_measurement(self, auto_start: bool):
+        return self._response(200, {})
+
+    def start_compose_measurement(self):
+        return self._response(204, None)
+
+    def stop_compose_measurement(self):
+        return self._response(204, None)
+
+
+class FakeAPIServer:
+    """Serve FakeTerminalSystem over HTTP on 127.0.0.1."""
+
+    def __init__(self, system: FakeTerminalSystem, port=0):
+        self._system = system
+        system_ = system
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                path = urlsplit(self.path).path
+                if path.startswith("/api"):
+                    path = path[len("/api") :]
+                obj = system_.get(path)
+                if not system_.available:
+                    self._send(503, {"error": "unavailable"})
+                elif obj is None:
+                    self._send(404, {"error": "not found"})
+                else:
+                    self._send(200, obj)
+
+            def do_POST(self):
+                self._send(204, None)
+
+            def do_PATCH(self):
+                self._send(200, {})
+
+            def _send(self, status_code, obj):
+                body = b"" if obj is None else json.dumps(obj).encode()
+                self.send_response(status_code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/api"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Fake Terminal System API")
+    parser.add_argument("-p", "--port", type=int, default=8081)
+    args = parser.parse_args()
+
+    fake_system = FakeTerminalSystem()
+    server = FakeAPIServer(fake_system, args.port).start()
+    print(server.base_url, flush=True)
+    try:
+        while True:
+            time.sleep(1)
+            fake_system.tick()
+    except KeyboardInterrupt:
+        server.stop()
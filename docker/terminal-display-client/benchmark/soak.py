@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""Soak test of the display client refresh cycle.
+
+Runs the refresh cycle of terminal_display_client.py in-process for a long
+time against FakeAPIClient and a fake serial link. Device connectors are
+replaced regularly and /events and /agent/measurements grow, like on a
+terminal that has been running for months.
+
+Every --sample-every cycles it samples the RSS, the memory traced by
+tracemalloc and the mean cycle time. At the end it compares the last samples
+with the first ones taken after the warm-up, prints the allocators that grew
+most, and exits with status 1 if any of them grew past its threshold.
+
+Usage:
+    python benchmark/soak.py [-n CYCLES] [--duration SEC] [options]
+"""
+
+import argparse
+import statistics
+import sys
+import time
+import tracemalloc
+
+from fake_client import ROOT, load_client, make_client
+from fake_terminal_system import FakeTerminalSystem
+
+
+def rss_kib():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def take_snapshot():
+    return tracemalloc.take_snapshot().filter_traces(
+        (
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--root", default=ROOT, help="terminal-display-client dir")
+    parser.add_argument("-n", "--cycles", type=int, default=1_000_000)
+    parser.add_argument("--duration", type=float, help="stop after SEC seconds")
+    parser.add_argument("--warmup", type=int, default=5000)
+    parser.add_argument("--sample-every", type=int, default=10000)
+    parser.add_argument("--device-connectors", type=int, default=4)
+    parser.add_argument("--churn-every", type=int, default=100)
+    parser.add_argument("--history-limit", type=int, default=500)
+    parser.add_argument("--top", type=int, default=5)
+    parser.add_argument(
+        "--max-rss-growth", type=float, default=8.0, help="MiB (default: 8)"
+    )
+    parser.add_argument(
+        "--max-traced-growth", type=float, default=512.0, help="KiB (default: 512)"
+    )
+    parser.add_argument(
+        "--max-cycle-drift",
+        type=float,
+        default=1.5,
+        help="ratio of the last to the first cycle time (default: 1.5)",
+    )
+    args = parser.parse_args()
+
+    system = FakeTerminalSystem(
+        device_connectors=args.device_connectors,
+        churn_every=args.churn_every,
+        history_limit=args.history_limit,
+    )
+    module = load_client(args.root, system)
+    client = make_client(module)
+    sender = client._cmd_sender
+
+    tracemalloc.start()
+    api_response = module.ApiResponse(client._backend)
+    screens = client._build_screens(api_response)
+
+    samples = []
+    baseline_snapshot = None
+    cycle_time = 0.0
+    window = 0
+    start = time.monotonic()
+    for i in range(1, args.cycles + 1):
+        system.tick()
+        t = time.perf_counter()
+        client._refresh_cycle(api_response, *screens)
+        cycle_time += time.perf_counter() - t
+        window += 1
+
+        if i < args.warmup:
+            continue
+        if i == args.warmup:
+            baseline_snapshot = take_snapshot()
+            cycle_time = 0.0
+            window = 0
+            continue
+        if (i - args.warmup) % args.sample_every and i != args.cycles:
+            continue
+
+        sample = {
+            "cycle": i,
+            "elapsed": time.monotonic() - start,
+            "rss": rss_kib(),
+            "traced": tracemalloc.get_traced_memory()[0] / 1024,
+            "cycle_us": cycle_time / window * 1e6,
+        }
+        samples.append(sample)
+        print(
+            f"cycle {i:9d} {sample['elapsed']:8.0f} s "
+            f"rss {sample['rss']:7d} KiB traced {sample['traced']:8.1f} KiB "
+            f"cycle {sample['cycle_us']:7.0f} us "
+            f"commands {sender.commands} ({sender.bytes_sent} B)",
+            flush=True,
+        )
+        cycle_time = 0.0
+        window = 0
+
+        if args.duration and time.monotonic() - start >= args.duration:
+            break
+
+    if len(samples) < 2:
+        print("not enough samples; increase --cycles or lower --sample-every")
+        return 2
+
+    print(f"\ntop {args.top} allocators by growth since the warm-up:")
+    for stat in take_snapshot().compare_to(baseline_snapshot, "lineno")[: args.top]:
+        print(f"  {stat}")
+    tracemalloc.stop()
+
+    first = samples[: max(1, len(samples) // 4)]
+    last = samples[-max(1, len(samples) // 4) :]
+    rss_growth = (samples[-1]["rss"] - samples[0]["rss"]) / 1024
+    traced_growth = samples[-1]["traced"] - samples[0]["traced"]
+    drift = statistics.median(s["cycle_us"] for s in last) / statistics.median(
+        s["cycle_us"] for s in first
+    )
+
+    failed = False
+    for label, value, limit, unit in (
+        ("rss growth", rss_growth, args.max_rss_growth, "MiB"),
+        ("traced growth", traced_growth, args.max_traced_growth, "KiB"),
+        ("cycle time drift", drift, args.max_cycle_drift, "x"),
+    ):
+        ok = value <= limit
+        failed |= not ok
+        print(
+            f"{label}: {value:.2f} {unit} (limit {limit:.2f} {unit}) "
+            f"{'OK' if ok else 'FAIL'}"
+        )
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
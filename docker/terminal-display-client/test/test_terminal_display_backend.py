@@ -1,8 +1,16 @@
+import argparse
+import contextlib
 from datetime import datetime
+import io
+import json
 import requests
+import subprocess
+import sys
 import tempfile
 import terminal_display_backend as bk
+import terminal_display_snapshot as snapshot
 import unittest
+from unittest import mock
 
 
 class MockTerminalSystemAPIClient:
@@ -818,6 +826,358 @@ class TestTerminalDisplayBackend(unittest.TestCase):
             actual = backend._utc_rfc3339_to_datetime(test["ts"])
             self.assertEqual(actual, test["expect"])
 
+    def test_get_metrics_trend(self):
+        backend = bk.TerminalDisplayBackend(MockTerminalSystemAPIClient(None), 60)
+        actual, ok = backend.get_metrics_trend()
+        self.assertTrue(ok)
+        self.assertEqual(
+            actual,
+            {
+                "cpu_usage": None,
+                "memory_used": None,
+                "rssi": None,
+                "pending_data_size": None,
+            },
+        )
+
+    def test_metric_ring_buffer(self):
+        tests = [
+            {
+                "samples": [],
+                "expect": None,
+            },
+            {
+                "samples": [(100.0, 5.0)],
+                "expect": {
+                    "min": 5.0,
+                    "avg": 5.0,
+                    "max": 5.0,
+                    "slope": 0.0,
+                    "samples": 1,
+                },
+            },
+            {
+                # rising 1.0 per 30 sec
+                "samples": [(40.0, 1.0), (70.0, 2.0), (100.0, 3.0)],
+                "expect": {
+                    "min": 1.0,
+                    "avg": 2.0,
+                    "max": 3.0,
+                    "slope": 2.0,
+                    "samples": 3,
+                },
+            },
+            {
+                # out of window
+                "samples": [(0.0, 100.0), (70.0, -2.0), (100.0, -4.0)],
+                "expect": {
+                    "min": -4.0,
+                    "avg": -3.0,
+                    "max": -2.0,
+                    "slope": -4.0,
+                    "samples": 2,
+                },
+            },
+            {
+                # overwritten by wrap-around
+                "samples": [(91.0, 9.0), (92.0, 1.0), (93.0, 1.0), (94.0, 1.0)],
+                "expect": {
+                    "min": 1.0,
+                    "avg": 1.0,
+                    "max": 1.0,
+                    "slope": 0.0,
+                    "samples": 3,
+                },
+            },
+        ]
+
+        for test in tests:
+            buf = bk.MetricRingBuffer(3, 60)
+            for ts, value in test["samples"]:
+                buf.append(value, ts)
+            actual = buf.stats(100.0)
+            if actual is not None:
+                actual["slope"] = round(actual["slope"], 6)
+            self.assertEqual(actual, test["expect"])
+
+    def test_drain_rate_estimator(self):
+        tests = [
+            {
+                "samples": [],
+                "expect": (None, None),
+            },
+            {
+                "samples": [(0.0, 1000)],
+                "expect": (None, None),
+            },
+            {
+                "samples": [(0.0, 0)],
+                "expect": (None, 0.0),
+            },
+            {
+                "samples": [(0.0, 1000), (10.0, 900), (20.0, 800)],
+                "expect": (10.0, 80.0),
+            },
+            {
+                # filling up
+                "samples": [(0.0, 1000), (10.0, 1100)],
+                "expect": (-10.0, None),
+            },
+            {
+                # ignore samples with the same timestamp
+                "samples": [(0.0, 1000), (10.0, 900), (10.0, 100)],
+                "expect": (10.0, 10.0),
+            },
+        ]
+
+        for test in tests:
+            estimator = bk.DrainRateEstimator(60)
+            for ts, size in test["samples"]:
+                estimator.update(size, ts)
+            actual = (estimator.drain_rate, estimator.time_to_empty())
+            self.assertEqual(actual, test["expect"])
+
+    def test_circuit_breaker(self):
+        now = [0.0]
+        breaker = bk.CircuitBreaker(
+            "/test",
+            failure_threshold=2,
+            base_delay_sec=1.0,
+            max_delay_sec=4.0,
+            jitter=0.0,
+            clock=lambda: now[0],
+        )
+
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, bk.CircuitBreaker.CLOSED)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, bk.CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+        self.assertEqual(breaker.stats()["retry_in"], 1.0)
+
+        # failed trial, the delay doubles
+        now[0] = 1.0
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, bk.CircuitBreaker.HALF_OPEN)
+        self.assertFalse(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, bk.CircuitBreaker.OPEN)
+        self.assertEqual(breaker.stats()["retry_in"], 2.0)
+
+        # capped at max_delay_sec
+        for delay in (2.0, 4.0, 4.0):
+            now[0] += delay
+            self.assertTrue(breaker.allow())
+            breaker.record_failure()
+        self.assertEqual(breaker.stats()["retry_in"], 4.0)
+        self.assertEqual(breaker.stats()["rejected"], 2)
+
+        now[0] += 4.0
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.stats()["state"], bk.CircuitBreaker.CLOSED)
+        self.assertEqual(breaker.stats()["opens"], 0)
+
+    def test_api_client_circuit_breaker(self):
+        api_client = bk.TerminalSystemAPIClient("http://localhost/api")
+        calls = []
+
+        def request(method, url, **kwargs):
+            calls.append(url)
+            if url.endswith("/device_connectors"):
+                raise requests.ConnectionError("refused")
+            return self.__new_response(500, "")
+
+        api_client._session.request = request
+
+        actual = [
+            api_client.get_terminal_system_metrics().status_code for _ in range(5)
+        ]
+        self.assertEqual(actual, [500, 500, 500, 503, 503])
+        for _ in range(5):
+            self.assertEqual(api_client.list_device_connectors().status_code, 503)
+
+        # requests stop after 3 failures in a row
+        self.assertEqual(len(calls), 6)
+        actual = api_client.circuit_breakers()
+        self.assertEqual(actual["/device_connectors"]["state"], "open")
+        self.assertEqual(actual["/terminal_system/metrics"]["state"], "open")
+        self.assertEqual(actual["/terminal_system/metrics"]["rejected"], 2)
+
+    def test_get_stream_circuit_breaker_open(self):
+        api_client = bk.TerminalSystemAPIClient("http://localhost/api")
+        calls = []
+
+        def request(method, url, **kwargs):
+            calls.append(url)
+            if url.endswith("/docker/composes/measurement"):
+                return self.__new_response(500, "")
+            return self.__new_response(200, "[]")
+
+        api_client._session.request = request
+        backend = bk.TerminalDisplayBackend(api_client)
+
+        expect = ({"auto_start": False, "state": "none", "update_time": None}, True)
+        for _ in range(3):
+            self.assertEqual(backend.get_stream(), expect)
+        self.assertEqual(
+            api_client.circuit_breakers()["/docker/composes/measurement"]["state"],
+            "open",
+        )
+
+        # the synthetic 503 of the open breaker has no JSON body
+        calls.clear()
+        self.assertEqual(backend.get_stream(), expect)
+        self.assertFalse([url for url in calls if url.endswith("/measurement")])
+
+    def test_api_client_timeout(self):
+        api_client = bk.TerminalSystemAPIClient("http://localhost/api")
+        timeouts = []
+
+        def request(method, url, timeout=None, **kwargs):
+            timeouts.append(timeout)
+            raise requests.Timeout("read timed out")
+
+        api_client._session.request = request
+
+        # a request that gets no answer fails like a refused one
+        self.assertEqual(api_client.get_terminal_system_metrics().status_code, 503)
+        self.assertEqual(timeouts, [bk.TerminalSystemAPIClient.REQUEST_TIMEOUT_SEC])
+
+    def test_cli_snapshot(self):
+        args = argparse.Namespace(no_snapshot=False, socket="", max_age=30.0)
+        ctx = bk._CliContext(args)
+        getters = ["get_stream", "get_daemon_state", "get_network_state"]
+        tests = [
+            {
+                # a section the display client has kept after failing to get
+                # it is too old
+                "response": {
+                    "ok": True,
+                    "age": 1.0,
+                    "sections": {"stream": {"a": 1}, "daemon": {"b": 2}, "network": {}},
+                    "ages": {"stream": 1.0, "daemon": 300.0, "network": None},
+                },
+                "expect": {"get_stream": {"a": 1}},
+            },
+            {
+                # without ages, the age of the snapshot
+                "response": {
+                    "ok": True,
+                    "age": 1.0,
+                    "sections": {"stream": {"a": 1}, "daemon": {"b": 2}},
+                },
+                "expect": {"get_stream": {"a": 1}, "get_daemon_state": {"b": 2}},
+            },
+            {
+                "response": {
+                    "ok": True,
+                    "age": 300.0,
+                    "sections": {"stream": {"a": 1}, "daemon": {"b": 2}},
+                },
+                "expect": {},
+            },
+            {
+                "response": None,
+                "expect": {},
+            },
+        ]
+
+        for test in tests:
+            with mock.patch.object(snapshot, "query", return_value=test["response"]):
+                self.assertEqual(ctx.snapshot(getters), test["expect"])
+
+    def test_cli_split_result(self):
+        tests = [
+            {"ret": ({"a": 1}, True), "expect": ({"a": 1}, True)},
+            {"ret": (None, False), "expect": (None, False)},
+            {"ret": True, "expect": (None, True)},
+            {"ret": False, "expect": (None, False)},
+            {"ret": {"a": 1}, "expect": ({"a": 1}, True)},
+            {"ret": [{"a": 1}], "expect": ([{"a": 1}], True)},
+            # a tuple that is not (obj, ok) is a result
+            {"ret": (1, 2), "expect": ((1, 2), True)},
+        ]
+
+        for test in tests:
+            self.assertEqual(bk._split_result(test["ret"]), test["expect"])
+
+    def test_cli_main(self):
+        backend = mock.Mock()
+        for name in bk.CLI_GETTERS:
+            getattr(backend, name).return_value = ({"getter": name}, True)
+        backend.get_events.return_value = [{"level": "WARN"}]
+        backend.get_network_state.return_value = (None, False)
+        backend.get_hardware_info.side_effect = requests.ConnectionError("down")
+        backend.enable_auto_start.return_value = True
+
+        lines = self.__run_cli_main(backend, ["--json", "get_stream"])
+        self.assertEqual(lines, [{"ok": True, "result": {"getter": "get_stream"}}])
+
+        lines = self.__run_cli_main(backend, ["--json", "enable_auto_start"])
+        self.assertEqual(lines, [{"ok": True, "result": None}])
+
+        lines = self.__run_cli_main(backend, ["--json", "get_events"])
+        self.assertEqual(lines, [{"ok": True, "result": [{"level": "WARN"}]}])
+
+        lines = self.__run_cli_main(backend, ["all"])
+        self.assertEqual(len(lines), 1)
+        results = lines[0]["results"]
+        self.assertEqual(list(results), list(bk.CLI_GETTERS))
+        self.assertEqual(results["get_stream"]["result"], {"getter": "get_stream"})
+        self.assertEqual(results["get_stream"]["source"], "api")
+        self.assertEqual(results["get_events"]["result"], [{"level": "WARN"}])
+        self.assertFalse(results["get_network_state"]["ok"])
+        self.assertFalse(results["get_hardware_info"]["ok"])
+        self.assertEqual(results["get_hardware_info"]["error"], "down")
+
+        # one NDJSON record per getter and cycle
+        lines = self.__run_cli_main(
+            backend,
+            ["watch", "get_stream", "get_network_state", "-i", "0", "-n", "3"],
+        )
+        self.assertEqual(
+            [(line["cycle"], line["getter"], line["ok"]) for line in lines],
+            [
+                (0, "get_stream", True),
+                (0, "get_network_state", False),
+                (1, "get_stream", True),
+                (1, "get_network_state", False),
+                (2, "get_stream", True),
+                (2, "get_network_state", False),
+            ],
+        )
+
+        lines = self.__run_cli_main(backend, ["watch", "-i", "0", "-n", "1"])
+        self.assertEqual([line["getter"] for line in lines], list(bk.CLI_GETTERS))
+
+    def test_preload_requests(self):
+        # importing the module does not import requests, preload_requests()
+        # does in the background
+        code = (
+            "import sys, threading, terminal_display_backend as bk\n"
+            "assert 'requests' not in sys.modules\n"
+            "bk.preload_requests()\n"
+            "for thread in threading.enumerate():\n"
+            "    if thread.name == 'preload':\n"
+            "        thread.join()\n"
+            "assert 'requests' in sys.modules\n"
+        )
+        subprocess.run([sys.executable, "-c", code], check=True)
+
+    def __run_cli_main(self, backend, argv):
+        out = io.StringIO()
+        with mock.patch.object(bk, "TerminalSystemAPIClient"), mock.patch.object(
+            bk, "TerminalDisplayBackend", return_value=backend
+        ), mock.patch.object(
+            sys, "argv", ["terminal_display_backend", "--no-snapshot"] + argv
+        ), contextlib.redirect_stdout(
+            out
+        ):
+            bk.main()
+        return [json.loads(line) for line in out.getvalue().splitlines()]
+
     def __new_response(self, status_code, content):
         resp = requests.Response()
         resp.status_code = status_code
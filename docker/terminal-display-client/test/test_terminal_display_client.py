@@ -0,0 +1,698 @@
+import copy
+import importlib.util
+import os
+import re
+import threading
+import time
+import unittest
+from unittest import mock
+
+import terminal_display_widget as widget
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+spec = importlib.util.spec_from_file_location(
+    "terminal_display_client",
+    os.path.join(ROOT, "usr", "bin", "terminal_display_client.py"),
+)
+tdc = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(tdc)
+
+
+def old_get_substitution_string(
+    service_substitutions, substitution_variables, search_key, with_unit=True
+):
+    # _get_substitution_string() before the substitution index
+    config_value = None
+    default_value = None
+
+    if service_substitutions:
+        for service_substitution in service_substitutions:
+            match = re.search(f"^{search_key}=(.*)", service_substitution)
+            if match:
+                config_value = match.group(1)
+                break
+
+    if config_value:
+        value = config_value
+    else:
+        for substitution_variable in substitution_variables:
+            variable_key = substitution_variable.get("key")
+            if search_key == variable_key:
+                default = substitution_variable.get("default")
+                if default:
+                    default_value = default
+                break
+
+        if default_value:
+            value = default_value
+        else:
+            return ""
+
+    if with_unit:
+        for substitution_variable in substitution_variables:
+            variable_key = substitution_variable.get("key")
+            if search_key == variable_key:
+                display_strings_i18n = substitution_variable.get("display_strings_i18n")
+                if display_strings_i18n:
+                    unit = display_strings_i18n[0].get("unit", "")
+                    if unit:
+                        value = f"{value} {unit}"
+                    break
+
+    return value
+
+
+def variable(key, default=None, unit=None):
+    substitution_variable = {"key": key, "default": default}
+    if unit is not None:
+        substitution_variable["display_strings_i18n"] = [{"unit": unit}]
+    return substitution_variable
+
+
+class FakeApiResponse:
+    def __init__(self, device_connectors):
+        self._device_connectors = device_connectors
+
+    def device_connectors(self):
+        return self._device_connectors
+
+
+class FakeBackend:
+    """Backend whose getters answer from responses. An endpoint missing from
+    responses fails."""
+
+    def __init__(self, responses):
+        self.responses = responses
+
+    def get(self, endpoint):
+        if endpoint not in self.responses:
+            return None, False
+        return copy.deepcopy(self.responses[endpoint]), True
+
+
+class FakeActionBackend:
+    """Backend for ActionJob. post() waits for release, then answers from
+    posts. get("stream") answers from streams in turn, the last one for
+    good."""
+
+    def __init__(self, posts, streams):
+        self.posts = posts
+        self.streams = list(streams)
+        self.posted = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def post(self, endpoint):
+        self.release.wait()
+        self.posted.append(endpoint)
+        result = self.posts[endpoint]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def get(self, endpoint):
+        if len(self.streams) > 1:
+            return self.streams.pop(0), True
+        return self.streams[0], True
+
+
+class FakeConnection:
+    """One end of a Pipe. recv() returns updates in order, then fails like
+    a pipe to a process that has exited."""
+
+    def __init__(self, updates=()):
+        self.updates = list(updates)
+        self.requests = 0
+
+    def send(self, obj):
+        self.requests += 1
+
+    def recv(self):
+        if not self.updates:
+            raise EOFError
+        return self.updates.pop(0)
+
+    def close(self):
+        pass
+
+
+class FakeProcess:
+    def __init__(self, target, args, name, daemon):
+        self.pid = 1
+        self.exitcode = None
+
+    def start(self):
+        pass
+
+    def join(self, timeout=None):
+        self.exitcode = 1
+
+
+class FakeContext:
+    """multiprocessing context whose processes send runs[i] in turn."""
+
+    def __init__(self, runs):
+        self.runs = list(runs)
+        self.conns = []
+
+    def Pipe(self):
+        conn = FakeConnection(self.runs.pop(0))
+        self.conns.append(conn)
+        return conn, FakeConnection()
+
+    def Process(self, **kwargs):
+        return FakeProcess(**kwargs)
+
+
+def main_only():
+    return tdc.ScreenUpdate(main_screen_content=widget.MainScreenContent())
+
+
+class TestClient(unittest.TestCase):
+    def make_client(self):
+        client = tdc.TerminalDisplayClient.__new__(tdc.TerminalDisplayClient)
+        client._service_page_items_cache = {}
+        client._service_page_items_cache_next = {}
+        client._collector_cache = {}
+        return client
+
+    def test_api_response_keep_last_good(self):
+        clock = [0.0]
+        patcher = mock.patch.object(tdc.time, "monotonic", lambda: clock[0])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        backend = FakeBackend({"stream": {"status": "running"}})
+        api_response = tdc.ApiResponse(backend, stale_after_sec=60)
+        api_response.update(["stream", "daemon"])
+        self.assertEqual(api_response.stream(), {"status": "running"})
+        # never fetched successfully
+        self.assertEqual(api_response.daemon(), {})
+        self.assertIsNone(api_response.age("daemon"))
+        versions = api_response.versions(["stream", "daemon", "stale"])
+
+        # a failed fetch keeps the last good response and its version
+        del backend.responses["stream"]
+        clock[0] += 60
+        api_response.update(["stream", "daemon"])
+        self.assertEqual(api_response.stream(), {"status": "running"})
+        self.assertEqual(api_response.age("stream"), 60)
+        self.assertEqual(api_response.stale(), ())
+        self.assertEqual(api_response.versions(["stream", "daemon", "stale"]), versions)
+
+        # older than stale_after_sec
+        clock[0] += 1
+        api_response.update(["stream", "daemon"])
+        self.assertEqual(api_response.stream(), {"status": "running"})
+        self.assertEqual(api_response.stale(), ("stream",))
+        self.assertEqual(
+            api_response.versions(["stream", "daemon", "stale"]),
+            versions[:2] + (versions[2] + 1,),
+        )
+        api_response.update(["stream", "daemon"])
+        self.assertEqual(
+            api_response.versions(["stream", "daemon", "stale"]),
+            versions[:2] + (versions[2] + 1,),
+        )
+
+        # back: up to date, with the same content
+        backend.responses["stream"] = {"status": "running"}
+        api_response.update(["stream", "daemon"])
+        self.assertEqual(api_response.stale(), ())
+        self.assertEqual(api_response.age("stream"), 0)
+        self.assertEqual(
+            api_response.versions(["stream", "daemon", "stale"]),
+            versions[:2] + (versions[2] + 2,),
+        )
+
+    def test_screen_update_apply(self):
+        main_screen_content = widget.MainScreenContent()
+        a_items = widget.PageItems()
+        b_items = widget.PageItems()
+        model = tdc.ScreenUpdate()
+        model.apply(
+            tdc.ScreenUpdate(
+                main_screen_content=main_screen_content,
+                titles=("Top", "A", "B"),
+                pages={"Top": widget.PageItems(), "A": a_items, "B": b_items},
+            )
+        )
+
+        # unchanged contents are left out of an update
+        top_items = widget.PageItems()
+        model.apply(tdc.ScreenUpdate(pages={"Top": top_items}))
+        self.assertIs(model.main_screen_content, main_screen_content)
+        self.assertEqual(model.titles, ("Top", "A", "B"))
+        self.assertIs(model.pages["Top"], top_items)
+        self.assertIs(model.pages["A"], a_items)
+
+        # new titles drop the pages that are gone
+        c_items = widget.PageItems()
+        model.apply(tdc.ScreenUpdate(titles=("Top", "B", "C"), pages={"C": c_items}))
+        self.assertEqual(model.titles, ("Top", "B", "C"))
+        self.assertEqual(model.pages, {"Top": top_items, "B": b_items, "C": c_items})
+
+    def test_collector_process_restart(self):
+        patcher = mock.patch.object(tdc.time, "sleep")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        first = main_only()
+        second = main_only()
+        # the first process exits after its first update
+        context = FakeContext([[first], [second]])
+        collector = tdc.CollectorProcess("")
+        collector._context = context
+        collector.start()
+
+        collector.request()
+        self.assertIs(collector.receive(), first)
+        collector.request()
+        # restarted and asked again
+        self.assertIs(collector.receive(), second)
+        self.assertEqual([conn.requests for conn in context.conns], [2, 1])
+
+    def test_build_screens_from_process_restart(self):
+        patcher = mock.patch.object(tdc.time, "sleep")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        full = tdc.ScreenUpdate(titles=("Top",), pages={"Top": widget.PageItems()})
+        context = FakeContext([[main_only()], [main_only(), full]])
+        client = self.make_client()
+        client._collector_process = tdc.CollectorProcess("")
+        client._collector_process._context = context
+        client._cmd_sender = mock.Mock()
+        client._beep_scheduler = mock.Mock()
+        client._queue_state = tdc.QueueState.NOT_INITIALIZED
+
+        model = tdc.ScreenUpdate()
+        _, _, pages = client._build_screens_from_process(model)
+        self.assertEqual(list(pages), ["Top"])
+
+    def test_api_response_fetch_timeout(self):
+        release = threading.Event()
+        calls = []
+
+        class HangingBackend(FakeBackend):
+            def get(self, endpoint):
+                calls.append(endpoint)
+                if endpoint == "stream":
+                    release.wait()
+                return super().get(endpoint)
+
+        backend = HangingBackend({"stream": {}, "daemon": {"state": "running"}})
+        api_response = tdc.ApiResponse(backend, fetch_timeout_sec=0.05)
+        self.addCleanup(release.set)
+
+        api_response.update(["stream", "daemon"])
+        # nothing else is fetched while the abandoned fetch runs
+        self.assertEqual(calls, ["stream"])
+        self.assertEqual(api_response.daemon(), {})
+
+        release.set()
+        for _ in range(100):
+            if not api_response._fetch_worker.busy():
+                break
+            time.sleep(0.01)
+        api_response.update(["stream", "daemon"])
+        self.assertEqual(calls, ["stream", "stream", "daemon"])
+        self.assertEqual(api_response.daemon(), {"state": "running"})
+
+    def test_backend_get_bad_response(self):
+        import requests
+
+        def request(method, url, **kwargs):
+            resp = requests.Response()
+            resp.status_code = 200
+            resp._content = b"<html>"
+            return resp
+
+        backend = tdc.Backend("http://localhost/api")
+        backend.api_client._session.request = request
+        with self.assertLogs(level="ERROR"):
+            self.assertEqual(backend.get("stream"), (None, False))
+
+        # and the fetch goes on with the other endpoints
+        api_response = tdc.ApiResponse(backend)
+        with self.assertLogs(level="ERROR"):
+            api_response.update(["stream", "daemon"])
+        self.assertEqual(api_response.stream(), {})
+
+    def test_action_job(self):
+        patcher = mock.patch.object(tdc.ActionJob, "POLL_SEC", 0.01)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        restart = ("stop_agent_streamer", "start_agent_streamer")
+        tests = [
+            {
+                # the stream state follows
+                "posts": {"stop_agent_streamer": True, "start_agent_streamer": True},
+                "streams": [
+                    {"state": "none"},
+                    {"state": "none"},
+                    {"state": "connected"},
+                ],
+                "expect": True,
+                "posted": list(restart),
+            },
+            {
+                # start after a failed stop, and fail without waiting
+                "posts": {"stop_agent_streamer": False, "start_agent_streamer": True},
+                "streams": [{"state": "connected"}],
+                "expect": False,
+                "posted": list(restart),
+            },
+            {
+                # the stream state does not follow
+                "posts": {"stop_agent_streamer": True, "start_agent_streamer": True},
+                "streams": [{"state": "none"}],
+                "timeout": 0.05,
+                "expect": False,
+                "posted": list(restart),
+            },
+            {
+                # an error fails the job at once
+                "posts": {"stop_agent_streamer": RuntimeError("broken")},
+                "streams": [{"state": "connected"}],
+                "expect": False,
+                "posted": ["stop_agent_streamer"],
+            },
+        ]
+
+        for test in tests:
+            backend = FakeActionBackend(test["posts"], test["streams"])
+            job = tdc.ActionJob(
+                "restart",
+                backend,
+                restart,
+                lambda stream: stream["state"] != "none",
+                widget.MainScreenIconValueMode.MEASURE_ON,
+            )
+            job.TIMEOUT_SEC = test.get("timeout", 5)
+            with self.assertLogs(level="INFO"):
+                job.start()
+                job._thread.join(2)
+            self.assertFalse(job.running())
+            self.assertEqual(job.result, test["expect"])
+            self.assertEqual(backend.posted, test["posted"])
+
+    def test_action_job_ignore_button(self):
+        backend = FakeActionBackend(
+            {"stop_agent_streamer": True, "start_agent_streamer": True},
+            [{"state": "connected"}],
+        )
+        backend.release.clear()
+        self.addCleanup(backend.release.set)
+        patcher = mock.patch.object(tdc, "Backend", return_value=backend)
+        Backend = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        client = self.make_client()
+        client._base_uri = "http://localhost/api"
+        client._recover_flg = False
+        client._restart_service_flg = False
+        client._action_job = None
+        client._action_job_shown = True
+        client._main_screen = None
+        client._beep_scheduler = mock.Mock()
+
+        with self.assertLogs(level="INFO") as logs:
+            client._restart_service_flg = True
+            client._poll_action_job()
+            job = client._action_job
+            # pressed again while the job runs
+            client._restart_service_flg = True
+            client._poll_action_job()
+            self.assertIs(client._action_job, job)
+            self.assertFalse(client._restart_service_flg)
+            self.assertIn("ignore the button", logs.output[-1])
+
+            backend.release.set()
+            job._thread.join(2)
+            client._poll_action_job()
+        self.assertTrue(job.result)
+        client._beep_scheduler.notify.assert_called_once_with(
+            "action", tdc.BEEP_ACTION_SUCCEEDED
+        )
+        # a job of its own, not the backend of the fetch worker
+        Backend.assert_called_once_with("http://localhost/api")
+
+    def test_trend_page_contents(self):
+        client = self.make_client()
+
+        def collect(cpu_usage, pending_data_size):
+            api_response = mock.Mock()
+            api_response.metrics_trend.return_value = {
+                "cpu_usage": cpu_usage,
+                "rssi": None,
+                "pending_data_size": pending_data_size,
+            }
+            return {
+                page.get_title(): [(item.key, item.value) for item in items]
+                for page, items in client._collect_trend_page_contents(api_response)
+            }
+
+        cpu = {"min": 3.2, "avg": 21.37, "max": 88.9, "slope": 0.42}
+        queue = {"min": 0, "avg": 1234567.8, "max": 2345678, "slope": 20480.5}
+        first = collect(cpu, queue)
+        self.assertEqual(
+            first["Trend CPU"],
+            [("Min", "5%"), ("Avg", "20%"), ("Max", "90%"), ("Trend", "flat")],
+        )
+        self.assertEqual(
+            first["Trend Queue"],
+            [
+                ("Min", "0 Byte"),
+                ("Avg", "1.1 MB"),
+                ("Max", "2.2 MB"),
+                ("Trend", "+19.5 KB/min"),
+            ],
+        )
+        self.assertEqual(
+            first["Trend RSSI"],
+            [("Min", "none"), ("Avg", "none"), ("Max", "none"), ("Trend", "none")],
+        )
+
+        # a drift from one cycle to the next does not change the pages
+        cpu = {"min": 3.2, "avg": 21.91, "max": 88.9, "slope": 0.57}
+        queue = {"min": 0, "avg": 1236001.2, "max": 2345678, "slope": 20201.3}
+        self.assertEqual(collect(cpu, queue), first)
+
+        cpu = {"min": 3.2, "avg": 23.1, "max": 88.9, "slope": 2.6}
+        self.assertEqual(
+            collect(cpu, queue)["Trend CPU"],
+            [("Min", "5%"), ("Avg", "25%"), ("Max", "90%"), ("Trend", "+5%/min")],
+        )
+
+    def test_collect(self):
+        clock = [0.0]
+        patcher = mock.patch.object(tdc.time, "monotonic", lambda: clock[0])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        client = self.make_client()
+        collector = mock.Mock(side_effect=lambda api_response: object())
+        client._collect_network_page_contents = collector
+        name = "_collect_network_page_contents"
+        backend = FakeBackend(
+            {
+                "network": {"current_device": {}, "update_time": "00:00:00"},
+                "hardware_info": {"hostname": "terminal"},
+            }
+        )
+        api_response = tdc.ApiResponse(backend, stale_after_sec=60)
+        api_response.update(["network", "hardware_info"])
+
+        tests = [
+            {
+                "description": "first run",
+                "change": lambda: None,
+                "rerun": True,
+            },
+            {
+                "description": "nothing changed",
+                "change": lambda: None,
+                "rerun": False,
+            },
+            {
+                "description": "a section the collector does not read",
+                "change": lambda: backend.responses["hardware_info"].update(
+                    hostname="renamed"
+                ),
+                "rerun": False,
+            },
+            {
+                "description": "only the update_time stamp",
+                "change": lambda: backend.responses["network"].update(
+                    update_time="00:00:01"
+                ),
+                "rerun": False,
+            },
+            {
+                "description": "the content of network",
+                "change": lambda: backend.responses["network"].update(
+                    devices=[{"device_name": "eth0"}]
+                ),
+                "rerun": True,
+            },
+        ]
+
+        result = None
+        for test in tests:
+            test["change"]()
+            api_response.update(["network", "hardware_info"])
+            collector.reset_mock()
+            previous, result = result, client._collect(name, api_response)
+            self.assertEqual(collector.called, test["rerun"], test["description"])
+            if not test["rerun"]:
+                self.assertIs(result, previous, test["description"])
+
+        # The main screen also depends on "stale", bumped when a section it
+        # reads gets stale, without a change of content.
+        main_screen = mock.Mock(side_effect=lambda api_response: object())
+        client._collect_main_screen_content = main_screen
+        backend.responses["stream"] = {"status": "running"}
+        api_response.update()
+        client._collect("_collect_main_screen_content", api_response)
+
+        # the stream section fails from now on
+        del backend.responses["stream"]
+        clock[0] += 30
+        api_response.update()
+        main_screen.reset_mock()
+        client._collect("_collect_main_screen_content", api_response)
+        main_screen.assert_not_called()
+
+        clock[0] += 31
+        api_response.update()
+        self.assertEqual(api_response.stale(), ("stream",))
+        client._collect("_collect_main_screen_content", api_response)
+        main_screen.assert_called_once_with(api_response)
+
+    def test_get_substitution_string(self):
+        client = self.make_client()
+        tests = [
+            {
+                # config value with the unit of the variable
+                "service_substitutions": ["DC_BAUDRATE=500000"],
+                "substitution_variables": [variable("DC_BAUDRATE", "250000", "bps")],
+            },
+            {
+                # empty config value: the default
+                "service_substitutions": ["DC_BAUDRATE="],
+                "substitution_variables": [variable("DC_BAUDRATE", "250000", "bps")],
+            },
+            {
+                # the first config value, its first line
+                "service_substitutions": [
+                    "DC_FDX=1",
+                    "DC_FD=on\nsecond line",
+                    "DC_FD=off",
+                    "DC_MIXER_ARGS=a=b",
+                ],
+                "substitution_variables": [],
+            },
+            {
+                # the default of the first variable, even if it is empty
+                "service_substitutions": None,
+                "substitution_variables": [
+                    variable("DC_FPS", "", "fps"),
+                    variable("DC_FPS", "30", "fps"),
+                    variable("DC_WIDTH", "1920", "px"),
+                ],
+            },
+            {
+                # the unit of the first variable with display strings, even
+                # if it is empty
+                "service_substitutions": ["DC_FPS=15", "DC_WIDTH=640"],
+                "substitution_variables": [
+                    variable("DC_FPS", "30"),
+                    variable("DC_FPS", "60", "fps"),
+                    variable("DC_FPS", "90", "Hz"),
+                    variable("DC_WIDTH", "1920", ""),
+                    variable("DC_WIDTH", "1920", "px"),
+                ],
+            },
+            {
+                "service_substitutions": ["OTHER=1", "invalid"],
+                "substitution_variables": [variable("OTHER")],
+            },
+        ]
+        keys = ["DC_BAUDRATE", "DC_FD", "DC_FPS", "DC_WIDTH", "DC_MIXER_ARGS", "DC_X"]
+
+        for test in tests:
+            index = client._build_substitution_index(
+                test["service_substitutions"], test["substitution_variables"]
+            )
+            for key in keys:
+                for with_unit in (True, False):
+                    self.assertEqual(
+                        client._get_substitution_string(index, key, with_unit),
+                        old_get_substitution_string(
+                            test["service_substitutions"],
+                            test["substitution_variables"],
+                            key,
+                            with_unit,
+                        ),
+                        (test, key, with_unit),
+                    )
+
+    def test_service_page_items_cache(self):
+        client = self.make_client()
+        dcs = [
+            {
+                "id": "dc-0",
+                "service_id": "CAN",
+                "service_substitutions": ["DC_BAUDRATE=500000"],
+                "substitution_variables": [variable("DC_BAUDRATE", unit="bps")],
+            },
+            {
+                "id": "dc-1",
+                "service_id": "GPS",
+                "service_substitutions": ["DC_DEVICE_PATH=/dev/ttyACM0"],
+                "substitution_variables": [],
+            },
+        ]
+
+        def items(contents):
+            return {page.get_title(): list(page_items) for page, page_items in contents}
+
+        first = items(
+            client._collect_device_connector_page_contents(FakeApiResponse(dcs))
+        )
+        self.assertEqual(
+            [(item.key, item.value) for item in first["Device Connector dc-0"]],
+            [("Baudrate", "500000 bps")],
+        )
+
+        # same content in a new response: the cached items
+        dcs = copy.deepcopy(dcs)
+        second = items(
+            client._collect_device_connector_page_contents(FakeApiResponse(dcs))
+        )
+        for title in first:
+            self.assertEqual(len(second[title]), len(first[title]))
+            for actual, expect in zip(second[title], first[title]):
+                self.assertIs(actual, expect)
+
+        # a changed variable is collected again
+        dcs[0]["substitution_variables"] = [variable("DC_BAUDRATE", unit="kbps")]
+        third = items(
+            client._collect_device_connector_page_contents(FakeApiResponse(dcs))
+        )
+        self.assertEqual(
+            [(item.key, item.value) for item in third["Device Connector dc-0"]],
+            [("Baudrate", "500000 kbps")],
+        )
+
+        # a removed device connector is evicted
+        client._collect_device_connector_page_contents(FakeApiResponse(dcs[:1]))
+        self.assertEqual(
+            list(client._service_page_items_cache),
+            [("CAN", ("DC_BAUDRATE=500000",))],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,359 @@
+import terminal_display_command as cmd
+import threading
+import unittest
+from unittest import mock
+
+
+class FakeLink:
+    """Serial link to a display that acknowledges what it can read.
+
+    Time only passes in sleep(). The ACK arrives while the sender waits for
+    it, after ack_delay seconds."""
+
+    def __init__(self, display_switches=True):
+        self.baudrate = 115200
+        self.display_baudrate = 115200
+        self.display_switches = display_switches
+        self.connected = True
+        self.can_reopen = True
+        # set when the port fails to write, e.g. unplugged
+        self.error = None
+        self.ack_delay = 0.01
+        self.now = 0.0
+        self.writes = []
+        self.sender = None
+        self._ack_at = None
+
+    def set_baudrate(self, baudrate):
+        self.baudrate = baudrate
+
+    def reopen(self):
+        self.writes.append("reopen")
+        if not self.can_reopen:
+            return False
+        self.connected = True
+        self.error = None
+        self.baudrate = 115200
+        return True
+
+    def write_error(self):
+        return self.error
+
+    def write(self, data):
+        self.writes.append((self.baudrate, data))
+        if not self.connected or self.baudrate != self.display_baudrate:
+            return
+        if self._ack_at is None:
+            self._ack_at = self.now + self.ack_delay
+        if data.startswith(b'"set_baud"') and self.display_switches:
+            self.display_baudrate = int(data.split(b'"')[3])
+
+    def sleep(self, sec):
+        self.now += sec
+        if self._ack_at is not None and self.now >= self._ack_at:
+            self._ack_at = None
+            self.sender.receive_ok()
+
+
+class TestCommand(unittest.TestCase):
+    def make_sender(self, link):
+        with mock.patch.object(cmd.serial, "Serial", return_value=link):
+            sender = cmd.CommandSender(cmd.serial.SerialOption("", 115200, None), None)
+        link.sender = sender
+
+        for name, fake in (("sleep", link.sleep), ("monotonic", lambda: link.now)):
+            patcher = mock.patch.object(cmd.time, name, side_effect=fake)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        return sender
+
+    def test_text_encoding(self):
+        encoding = cmd.TextEncoding()
+        tests = [
+            {
+                "command": (cmd.Opcode.SET_KEY, (3, "RSSI", "-71", "green")),
+                "expect": b'"setkey":{"page":"3","key":"RSSI","value":"-71","color":"green"}@4',
+            },
+            {
+                "command": (cmd.Opcode.ICON, ("mode", 4)),
+                "expect": b'"mode":"4"@4',
+            },
+            {
+                "command": (cmd.Opcode.BEEP, (50, 1, 3)),
+                "expect": b'"beep":{"dur":"50","tone":"1","cnt":"3"}@4',
+            },
+            {
+                "command": (cmd.Opcode.PING, ()),
+                "expect": b'"ping"@4',
+            },
+        ]
+
+        for test in tests:
+            opcode, fields = test["command"]
+            self.assertEqual(encoding.encode(4, opcode, fields), test["expect"])
+
+    def test_binary_encoding(self):
+        encoding = cmd.BinaryEncoding()
+        tests = [
+            {
+                "command": (cmd.Opcode.SET_KEY, (3, "RSSI", "-71", "green")),
+                "expect": b"\x02\x00\x0d\x04\x0a\x03\x04RSSI\x03-71\x00",
+            },
+            {
+                "command": (cmd.Opcode.ICON, ("mode", 4)),
+                "expect": b"\x02\x00\x04\x04\x0c\x00\x04",
+            },
+            {
+                "command": (cmd.Opcode.BEEP, (500, 1, 5)),
+                "expect": b"\x02\x00\x06\x04\x0f\x01\xf4\x01\x05",
+            },
+            {
+                "command": (cmd.Opcode.PING, ()),
+                "expect": b"\x02\x00\x02\x04\x02",
+            },
+            # not representable: sent as text
+            {
+                "command": (cmd.Opcode.SET_KEY, (3, "RSSI", "-71", "pink")),
+                "expect": None,
+            },
+            {
+                "command": (cmd.Opcode.SET_PAGE_NUM, (256,)),
+                "expect": None,
+            },
+        ]
+
+        for test in tests:
+            opcode, fields = test["command"]
+            self.assertEqual(encoding.encode(4, opcode, fields), test["expect"])
+
+        # strings are cut at a character boundary
+        data = encoding.encode(0, cmd.Opcode.ERROR, ("12:00:00", "あ" * 100))
+        self.assertEqual(data[14], 255 // 3 * 3)
+        self.assertEqual(data[15:].decode(), "あ" * 85)
+
+    @mock.patch.object(cmd.serial, "Serial")
+    def test_command_sender_encoding(self, Serial):
+        sender = cmd.CommandSender(cmd.serial.SerialOption("", 115200, None), None)
+        Serial.return_value.write_error.return_value = None
+        # ACK from the display
+        Serial.return_value.write.side_effect = lambda data: threading.Timer(
+            0.01, sender.receive_ok
+        ).start()
+
+        sender.ping()
+        sender.set_encoding(cmd.BinaryEncoding())
+        sender.ping()
+        sender.set_key(0, "key", "value", "pink")
+
+        self.assertEqual(
+            [c.args[0] for c in Serial.return_value.write.call_args_list],
+            [
+                b'"ping"@0',
+                b"\x02\x00\x02\x01\x02",
+                b'"setkey":{"page":"0","key":"key","value":"value","color":"pink"}@2',
+            ],
+        )
+
+    def test_set_baudrate(self):
+        tests = [
+            {
+                "display_switches": True,
+                "expect": True,
+                "writes": [
+                    (115200, b'"set_baud":"921600"@0'),
+                    (921600, b'"ping"@1'),
+                    (921600, b'"ping"@2'),
+                ],
+            },
+            # the display does not follow: back to 115200
+            {
+                "display_switches": False,
+                "expect": False,
+                "writes": [
+                    (115200, b'"set_baud":"921600"@0'),
+                    (921600, b'"ping"@1'),
+                    (921600, b'"ping"@1'),
+                    (115200, b'"ping"@1'),
+                    (115200, b'"ping"@2'),
+                ],
+            },
+        ]
+
+        for test in tests:
+            link = FakeLink(test["display_switches"])
+            sender = self.make_sender(link)
+            self.assertEqual(sender.set_baudrate(921600), test["expect"])
+            sender.ping()
+            self.assertEqual(link.writes, test["writes"])
+
+    def test_baudrate_fall_back(self):
+        link = FakeLink()
+        sender = self.make_sender(link)
+        self.assertTrue(sender.set_baudrate(921600))
+        # the display went back to 115200, e.g. after a reset
+        link.display_baudrate = 115200
+        self.assertTrue(sender.ping())
+
+        self.assertEqual(
+            link.writes[2:],
+            [(921600, b'"ping"@2')] * 3 + [(115200, b'"ping"@2')],
+        )
+
+    def test_ack_timeout(self):
+        link = FakeLink()
+        sender = self.make_sender(link)
+        self.assertEqual(sender.ack_timeout(), sender.MAX_ACK_TIMEOUT)
+
+        for _ in range(10):
+            sender.ping()
+        self.assertEqual(sender.ack_timeout(), sender.MIN_ACK_TIMEOUT)
+        self.assertAlmostEqual(sender.idle_time(), 0.1)
+
+        link.ack_delay = 0.9
+        for _ in range(30):
+            sender.ping()
+        self.assertGreater(sender.ack_timeout(), 0.9)
+        self.assertLess(sender.ack_timeout(), sender.MAX_ACK_TIMEOUT)
+
+        # a slower ACK than the timeout is resent, but not taken as a sample
+        link.ack_delay = 2.5
+        before = sender.ack_timeout()
+        sender.ping()
+        self.assertEqual(link.writes[-1], link.writes[-2])
+        self.assertEqual(sender.ack_timeout(), before)
+
+    def test_command_interval(self):
+        link = FakeLink()
+        # whether the lock is held in the pause after each ACK
+        locked = []
+        sleep = link.sleep
+
+        def record(sec):
+            if sec == cmd.CommandSender.COMMAND_INTERVAL_SEC:
+                locked.append(sender._lock.locked())
+            sleep(sec)
+
+        link.sleep = record
+        sender = self.make_sender(link)
+        sender.ping()
+        sender.ping()
+        self.assertEqual(locked, [False, False])
+
+    def test_reconnect(self):
+        link = FakeLink()
+        sender = self.make_sender(link)
+
+        # e.g. the USB serial adapter has been unplugged and plugged again
+        link.connected = False
+        self.assertTrue(sender.ping())
+        self.assertEqual(
+            link.writes, [(115200, b'"ping"@0')] * 3 + ["reopen", (115200, b'"ping"@0')]
+        )
+        self.assertFalse(sender.link_down())
+
+        # a failed write is not resent, not even at a lower baud rate
+        link.writes.clear()
+        self.assertTrue(sender.set_baudrate(921600))
+        link.writes.clear()
+        link.error = OSError(5, "Input/output error")
+        link.connected = False
+        link.display_baudrate = 115200
+        self.assertTrue(sender.ping())
+        self.assertEqual(
+            link.writes, [(921600, b'"ping"@3'), "reopen", (115200, b'"ping"@3')]
+        )
+
+        link.connected = False
+        link.can_reopen = False
+        with self.assertRaises(SystemExit):
+            sender.ping()
+        self.assertTrue(sender.link_down())
+
+    def test_error_reporter(self):
+        clock = [0.0]
+        sender = mock.Mock()
+        sender.idle_time.return_value = 1.0
+        reporter = cmd.ErrorReporter(sender)
+        patcher = mock.patch.object(cmd.time, "monotonic", lambda: clock[0])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        def sent():
+            messages = []
+            while True:
+                message, _ = reporter._next_report()
+                if message is None:
+                    return messages
+                messages.append(message)
+
+        # a flapping item: the first reports go at once, the rest are counted
+        messages = []
+        with mock.patch.object(cmd.threading, "Thread"):
+            for i in range(12):
+                reporter.report("CAN", f"CAN: disconnected {i}")
+                messages += sent()
+                clock[0] += 1
+            reporter.report("GPS", "GPS: no fix")
+        messages += sent()
+        self.assertEqual(
+            messages, ["CAN: disconnected 0", "CAN: disconnected 1", "GPS: no fix"]
+        )
+
+        _, wait = reporter._next_report()
+        clock[0] += wait
+        self.assertEqual(sent(), ["CAN: disconnected 11 x10 in 28s"])
+
+        # waits for a gap in the screen updates
+        with mock.patch.object(cmd.threading, "Thread"):
+            reporter.report("GPS", "GPS: no fix")
+        sender.idle_time.return_value = 0.0
+        self.assertEqual(sent(), [])
+        clock[0] += reporter.MAX_DELAY_SEC
+        self.assertEqual(sent(), ["GPS: no fix"])
+
+        # bounded
+        with mock.patch.object(cmd.threading, "Thread"):
+            for i in range(20):
+                reporter.report(f"dc{i}", f"dc{i}: error")
+        clock[0] += reporter.MAX_DELAY_SEC
+        self.assertEqual(
+            sent(), [f"dc{i}: error" for i in range(20 - reporter.MAX_PENDING, 20)]
+        )
+
+    def test_beep_scheduler(self):
+        clock = [0.0]
+        scheduler = cmd.BeepScheduler(mock.Mock())
+        patcher = mock.patch.object(cmd.time, "monotonic", lambda: clock[0])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        def played():
+            beeps = []
+            while True:
+                pattern, _ = scheduler._next_beep()
+                if pattern is None:
+                    return beeps
+                beeps.append(pattern)
+
+        done = cmd.BeepPattern(5, 500, 1)
+        uploading = cmd.BeepPattern(1, 30, 1, repeat_sec=10)
+        with mock.patch.object(cmd.threading, "Thread"):
+            # the same state every cycle
+            for _ in range(3):
+                scheduler.notify("done", done)
+                scheduler.set_repeating("uploading", uploading)
+        self.assertEqual(played(), [done, uploading])
+
+        clock[0] += 5
+        self.assertEqual(played(), [])
+        self.assertEqual(scheduler._next_beep(), (None, 5))
+        clock[0] += 5
+        self.assertEqual(played(), [uploading])
+
+        scheduler.set_repeating("uploading", None)
+        clock[0] += 10
+        self.assertEqual(scheduler._next_beep(), (None, None))
+
+
+if __name__ == "__main__":
+    unittest.main()
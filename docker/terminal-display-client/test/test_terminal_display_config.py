@@ -0,0 +1,86 @@
+import configparser
+import errno
+import os
+import tempfile
+import terminal_display_config as tdconfig
+import unittest
+from unittest import mock
+
+
+class TestConfig(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.dir = tmpdir.name
+        self.path = os.path.join(self.dir, "terminal-display.conf")
+        with open(self.path, "w") as f:
+            f.write("[m5stack]\nvolume = 0\n")
+
+        self.config = configparser.ConfigParser()
+        self.config.read(self.path)
+
+    def read_volume(self):
+        config = configparser.ConfigParser()
+        config.read(self.path)
+        return config.get("m5stack", "volume")
+
+    def test_config_persister(self):
+        persister = tdconfig.ConfigPersister(self.config, self.path, debounce_sec=60)
+
+        with mock.patch.object(tdconfig.threading, "Thread") as Thread:
+            for volume in "1231":
+                persister.set("m5stack", "volume", volume)
+        # one writer thread, and nothing written yet
+        self.assertEqual(Thread.return_value.start.call_count, 1)
+        self.assertEqual(self.config.get("m5stack", "volume"), "1")
+        self.assertEqual(self.read_volume(), "0")
+
+        self.assertTrue(persister.flush())
+        self.assertEqual(self.read_volume(), "1")
+        self.assertEqual(os.listdir(self.dir), ["terminal-display.conf"])
+
+    def test_config_persister_debounce(self):
+        persister = tdconfig.ConfigPersister(self.config, self.path, debounce_sec=0.1)
+        with mock.patch.object(tdconfig, "write_atomic") as write_atomic:
+            for volume in "123":
+                persister.set("m5stack", "volume", volume)
+            persister._thread.join(0.5)
+        self.assertEqual(write_atomic.call_count, 1)
+        self.assertIn("volume = 3", write_atomic.call_args.args[1])
+
+    def test_write_atomic_bind_mount(self):
+        # e.g. the config file is bind-mounted into the container
+        busy = OSError(errno.EBUSY, "Device or resource busy")
+        with mock.patch.object(tdconfig.os, "replace", side_effect=busy):
+            tdconfig.write_atomic(self.path, "[m5stack]\nvolume = 2\n")
+        self.assertEqual(self.read_volume(), "2")
+        self.assertEqual(os.listdir(self.dir), ["terminal-display.conf"])
+
+    def test_write_atomic_bind_mount_power_loss(self):
+        # the new content is kept next to the file until it is rewritten
+        busy = OSError(errno.EBUSY, "Device or resource busy")
+        io_error = OSError(errno.EIO, "Input/output error")
+        with mock.patch.object(tdconfig.os, "replace", side_effect=busy):
+            with mock.patch.object(tdconfig.os, "fsync", side_effect=[None, io_error]):
+                with self.assertRaises(OSError):
+                    tdconfig.write_atomic(self.path, "[m5stack]\nvolume = 2\n")
+        with open(os.path.join(self.dir, ".terminal-display.conf.tmp")) as f:
+            self.assertEqual(f.read(), "[m5stack]\nvolume = 2\n")
+
+    def test_write_atomic_read_only_directory(self):
+        read_only = OSError(errno.EROFS, "Read-only file system")
+        write_synced = tdconfig._write_synced
+
+        def _write_synced(path, text):
+            if path.endswith(".tmp"):
+                raise read_only
+            write_synced(path, text)
+
+        with mock.patch.object(tdconfig, "_write_synced", _write_synced):
+            tdconfig.write_atomic(self.path, "[m5stack]\nvolume = 2\n")
+        self.assertEqual(self.read_volume(), "2")
+        self.assertEqual(os.listdir(self.dir), ["terminal-display.conf"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import pstats
+import tempfile
+import terminal_display_profile as profile
+import threading
+import unittest
+from unittest import mock
+
+
+def busy_wait(stop):
+    while not stop.is_set():
+        stop.wait(0.001)
+
+
+class TestProfile(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.dir = tmpdir.name
+
+    def test_stack_sampler(self):
+        stop = threading.Event()
+        thread = threading.Thread(target=busy_wait, args=(stop,), name="busy")
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(stop.set)
+
+        sampler = profile.StackSampler()
+        for _ in range(3):
+            sampler.sample()
+        path = os.path.join(self.dir, "stacks.collapsed")
+        sampler.write(path)
+
+        with open(path) as f:
+            lines = f.read().splitlines()
+        busy = [line for line in lines if line.startswith("busy;")]
+        self.assertTrue(busy)
+        stack, count = busy[0].rsplit(" ", 1)
+        self.assertIn(";busy_wait (test_terminal_display_profile.py:10);", stack)
+        self.assertEqual(int(count), 3)
+
+    def test_profiler_cprofile(self):
+        clock = [0.0]
+        profiler = profile.Profiler("client", self.dir, duration=10)
+        with mock.patch.object(profile.time, "monotonic", lambda: clock[0]):
+            profiler.start_profile()
+            sorted(range(1000))
+            profiler.check()
+            self.assertEqual(os.listdir(self.dir), [])
+
+            clock[0] += 10
+            profiler.check()
+
+        (name,) = os.listdir(self.dir)
+        self.assertTrue(name.startswith(f"client-{os.getpid()}-"))
+        self.assertTrue(name.endswith(".pstats"))
+        stats = pstats.Stats(os.path.join(self.dir, name))
+        self.assertIn(
+            "<built-in method builtins.sorted>",
+            [function for _, _, function in stats.stats],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,166 @@
+from collections import deque
+import threading
+import terminal_display_serial as tds
+import unittest
+from unittest import mock
+
+
+class MockSerialPort:
+    def __init__(self, *args, **kwargs):
+        self.writes = []
+        self.out_waiting = 0
+        self.write_started = threading.Event()
+        self.write_release = threading.Event()
+        self.write_release.set()
+        # chunks returned by read(), one per call
+        self.reads = deque()
+        self.baudrate = 115200
+        self.input_flushed = 0
+        self.closed = False
+
+    @property
+    def in_waiting(self):
+        return len(self.reads[0]) if self.reads else 0
+
+    def read(self, size=1):
+        if not self.reads:
+            return b""
+        chunk = self.reads.popleft()
+        if size < len(chunk):
+            self.reads.appendleft(chunk[size:])
+            chunk = chunk[:size]
+        return chunk
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        self.input_flushed += 1
+
+    def close(self):
+        self.closed = True
+
+    def write(self, data):
+        self.write_started.set()
+        self.write_release.wait()
+        self.writes.append(data)
+        return len(data)
+
+
+class TestSerial(unittest.TestCase):
+    def setUp(self):
+        tds.SingletonMeta._instances.pop(tds.Serial, None)
+        patcher = mock.patch.object(tds.serial, "Serial", MockSerialPort)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(tds.SingletonMeta._instances.pop, tds.Serial, None)
+        self.ser = tds.Serial(tds.SerialOption("/dev/null", 115200, None))
+        self.port = self.ser._ser
+
+    def test_write(self):
+        self.ser.write(b'"ping"@0')
+        self.assertTrue(self.ser.flush(timeout=1))
+        self.assertEqual(self.port.writes, [b'"ping"@0'])
+
+    def test_write_coalesce(self):
+        # Hold the first write() in the driver so the following commands
+        # are queued behind it.
+        self.port.write_release.clear()
+        self.ser.write(b'"ping"@0')
+        self.assertTrue(self.port.write_started.wait(timeout=1))
+
+        self.ser.write(b'"init"@1')
+        self.ser.write(b'"version"@2')
+        self.port.write_release.set()
+
+        self.assertTrue(self.ser.flush(timeout=1))
+        self.assertEqual(self.port.writes, [b'"ping"@0', b'"init"@1"version"@2'])
+
+    def test_flush_timeout(self):
+        self.port.write_release.clear()
+        self.ser.write(b'"ping"@0')
+        self.assertFalse(self.ser.flush(timeout=0.05))
+        self.port.write_release.set()
+        self.assertTrue(self.ser.flush(timeout=1))
+
+    def test_write_error(self):
+        self.port.write = mock.Mock(side_effect=OSError(5, "Input/output error"))
+        self.ser.write(b'"ping"@0')
+        self.assertTrue(self.ser.flush(timeout=1))
+        self.assertIsInstance(self.ser.write_error(), OSError)
+
+        # the writer goes on with the reopened port
+        self.assertTrue(self.ser.reopen())
+        self.assertIsNone(self.ser.write_error())
+        self.ser.write(b'"ping"@0')
+        self.assertTrue(self.ser.flush(timeout=1))
+        self.assertEqual(self.ser._ser.writes, [b'"ping"@0'])
+
+    def test_readline(self):
+        tests = [
+            {
+                "reads": [b'"ack"\r\n'],
+                "expect": [b'"ack"\r\n'],
+            },
+            {
+                # several frames in one read
+                "reads": [b'"ack"\r\n"volume":"1"\r\n"ack"\r\n'],
+                "expect": [b'"ack"\r\n', b'"volume":"1"\r\n', b'"ack"\r\n'],
+            },
+            {
+                # frames split across reads, including the delimiter
+                "reads": [b'"a', b'ck"\r', b'\n"ack', b'"\r\n'],
+                "expect": [b'"ack"\r\n', b'"ack"\r\n'],
+            },
+            {
+                # garbage without a delimiter is dropped
+                "reads": [b"\xff" * 2000, b'"ack"\r\n'],
+                "expect": [b'"ack"\r\n'],
+            },
+        ]
+
+        for test in tests:
+            self.ser._read_buf.clear()
+            self.port.reads.extend(test["reads"])
+            actual = []
+            while True:
+                frame = self.ser.readline()
+                if not frame:
+                    break
+                actual.append(frame)
+            self.assertEqual(actual, test["expect"])
+
+    def test_set_baudrate(self):
+        self.ser.write(b'"set_baud":"921600"@0')
+        self.port.reads.append(b'"ac')
+        self.assertEqual(self.ser.readline(), b"")
+
+        self.ser.set_baudrate(921600)
+        self.assertEqual(self.port.writes, [b'"set_baud":"921600"@0'])
+        self.assertEqual(self.port.baudrate, 921600)
+        self.assertEqual(self.port.input_flushed, 1)
+
+        # the partial frame from before the switch is dropped
+        self.port.reads.append(b'"ack"\r\n')
+        self.assertEqual(self.ser.readline(), b'"ack"\r\n')
+
+    def test_reopen(self):
+        self.ser.set_baudrate(921600)
+        self.port.reads.append(b'"ac')
+        self.assertEqual(self.ser.readline(), b"")
+
+        self.assertTrue(self.ser.reopen())
+        self.assertTrue(self.port.closed)
+        port = self.ser._ser
+        self.assertIsNot(port, self.port)
+        self.assertEqual(port.baudrate, 115200)
+
+        port.reads.append(b'"ack"\r\n')
+        self.assertEqual(self.ser.readline(), b'"ack"\r\n')
+
+        with mock.patch.object(tds.serial, "Serial", side_effect=OSError("gone")):
+            self.assertFalse(self.ser.reopen())
+
+
+if __name__ == "__main__":
+    unittest.main()
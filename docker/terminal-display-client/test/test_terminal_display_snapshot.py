@@ -0,0 +1,85 @@
+from datetime import datetime
+import os
+import tempfile
+import terminal_display_snapshot as snapshot
+import unittest
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.path = os.path.join(tmpdir.name, "snapshot.sock")
+
+    def test_query(self):
+        server = snapshot.SnapshotServer(self.path)
+        server.start()
+        self.addCleanup(server.stop)
+
+        actual = snapshot.query("get stream", self.path)
+        self.assertEqual(
+            actual, {"ok": True, "sections": {"stream": None}, "ages": {"stream": None}}
+        )
+
+        server.publish(
+            {
+                "stream": {"state": "connected", "update_time": datetime(2000, 1, 1)},
+                "daemon": {},
+            }
+        )
+
+        tests = [
+            {
+                "request": "get stream",
+                "expect": {
+                    "stream": {
+                        "state": "connected",
+                        "update_time": "2000-01-01T00:00:00",
+                    }
+                },
+            },
+            {
+                "request": "get",
+                "expect": {
+                    "stream": {
+                        "state": "connected",
+                        "update_time": "2000-01-01T00:00:00",
+                    },
+                    "daemon": {},
+                },
+            },
+            {
+                "request": "get daemon network",
+                "expect": {"daemon": {}, "network": None},
+            },
+        ]
+
+        for test in tests:
+            actual = snapshot.query(test["request"], self.path)
+            self.assertTrue(actual["ok"])
+            self.assertLess(actual["age"], 10)
+            self.assertEqual(actual["sections"], test["expect"])
+
+        # the age of each section since it was last fetched successfully
+        server.publish({"stream": {}, "daemon": {}}, {"stream": 100, "daemon": None})
+        actual = snapshot.query("get stream daemon network", self.path)
+        self.assertLess(actual["age"], 10)
+        self.assertAlmostEqual(actual["ages"]["stream"], 100, delta=10)
+        self.assertEqual(actual["ages"]["daemon"], None)
+        self.assertEqual(actual["ages"]["network"], None)
+
+        actual = snapshot.query("list", self.path)
+        self.assertEqual(actual["names"], ["stream", "daemon"])
+
+        actual = snapshot.query("trace", self.path)
+        self.assertIn("traceEvents", actual["trace"])
+
+        actual = snapshot.query("unknown", self.path)
+        self.assertFalse(actual["ok"])
+
+    def test_query_no_server(self):
+        self.assertIsNone(snapshot.query("get", self.path))
+
+
+if __name__ == "__main__":
+    unittest.main()
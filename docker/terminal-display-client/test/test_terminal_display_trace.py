@@ -0,0 +1,63 @@
+import json
+import os
+import tempfile
+import terminal_display_trace as trace
+import threading
+import unittest
+
+
+class TestTrace(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(trace.enable, 0)
+
+    def test_disabled(self):
+        trace.enable(0)
+        with trace.span("get", "backend", endpoint="stream"):
+            pass
+        self.assertFalse(trace.enabled())
+        self.assertEqual(
+            [e for e in trace.chrome_trace()["traceEvents"] if e["ph"] == "X"], []
+        )
+
+    def test_chrome_trace(self):
+        trace.enable(3)
+        for i in range(5):
+            with trace.span("get", "backend", endpoint=f"e{i}"):
+                with trace.span("GET", "http"):
+                    pass
+
+        events = trace.chrome_trace()["traceEvents"]
+        spans = [event for event in events if event["ph"] == "X"]
+        # the latest 3, inner spans end first
+        self.assertEqual(
+            [(event["name"], event["args"]) for event in spans],
+            [
+                ("get", {"endpoint": "e3"}),
+                ("GET", {}),
+                ("get", {"endpoint": "e4"}),
+            ],
+        )
+        inner, outer = spans[1], spans[2]
+        self.assertLessEqual(outer["ts"], inner["ts"])
+        self.assertGreaterEqual(outer["ts"] + outer["dur"], inner["ts"] + inner["dur"])
+        self.assertEqual(outer["tid"], threading.get_ident())
+        self.assertIn(
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": {"name": threading.current_thread().name},
+            },
+            events,
+        )
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "trace", "client.trace.json")
+            trace.dump(path)
+            with open(path) as f:
+                self.assertEqual(len(json.load(f)["traceEvents"]), len(events))
+
+
+if __name__ == "__main__":
+    unittest.main()
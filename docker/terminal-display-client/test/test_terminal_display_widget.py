@@ -0,0 +1,157 @@
+import terminal_display_widget as widget
+import unittest
+from unittest import mock
+
+
+def page_items(*values):
+    items = widget.PageItems()
+    for i, value in enumerate(values):
+        items.append(widget.PageItem(f"key{i}", value))
+    return items
+
+
+class TestWidget(unittest.TestCase):
+    def test_page_update(self):
+        cmd_send = mock.Mock()
+        page = widget.Page(widget.PageOptions("Test"))
+
+        items = page_items("a", "b")
+        page.update(cmd_send, items)
+        self.assertEqual(cmd_send.set_key.call_count, 2)
+
+        # same object, and same content in a new object
+        page.update(cmd_send, items)
+        page.update(cmd_send, page_items("a", "b"))
+        self.assertEqual(cmd_send.set_key.call_count, 2)
+
+        # the drawn copy is not shared with the client
+        items.page_items[0].value = "x"
+        page.update(cmd_send, page_items("a", "b"))
+        self.assertEqual(cmd_send.set_key.call_count, 2)
+
+        page.update(cmd_send, page_items("a"))
+        self.assertEqual(cmd_send.set_key.call_count, 3)
+        page.update(cmd_send, page_items("a", "c", "d"))
+        self.assertEqual(cmd_send.set_key.call_count, 6)
+
+        # redrawn after clear
+        page.clear(cmd_send)
+        page.update(cmd_send, page_items("a", "c", "d"))
+        self.assertEqual(cmd_send.set_key.call_count, 9)
+
+    def test_page_error_reported_flags(self):
+        cmd_send = mock.Mock()
+        page = widget.Page(widget.PageOptions("Test"))
+
+        for i in range(10):
+            items = widget.PageItems()
+            items.append(
+                widget.PageItem(f"dc{i}", "error", widget.ListScreenValueColorEnum.RED)
+            )
+            page.update(cmd_send, items)
+
+        self.assertEqual(cmd_send.report_error.call_count, 10)
+        self.assertEqual(page.error_reported_flags, {"dc9": True})
+
+    def test_list_screen_visible_page(self):
+        cmd_send = mock.Mock()
+        list_screen = widget.ListScreen(cmd_send)
+        pages = [widget.Page(widget.PageOptions(f"Page{i}")) for i in range(6)]
+        for page in pages:
+            list_screen.append_page(page, page_items("a"))
+        list_screen.build()
+        cmd_send.reset_mock()
+
+        def drawn():
+            return [call.args[0] for call in cmd_send.edit_end.call_args_list]
+
+        # unknown visible page: every page is drawn at once
+        for page in pages:
+            list_screen.update_page(page, page_items("b"))
+        self.assertEqual(drawn(), [0, 1, 2, 3, 4, 5])
+
+        # only the visible page and its neighbors are drawn at once
+        cmd_send.reset_mock()
+        list_screen.set_visible_page(0)
+        for page in pages:
+            list_screen.update_page(page, page_items("c"))
+        self.assertEqual(drawn(), [0, 1, 5])
+
+        # the others are drawn lazily
+        list_screen.delete_unupdated_page_items()
+        list_screen.refresh(lazy_pages=1)
+        self.assertEqual(drawn(), [0, 1, 5, 2])
+
+        # or when navigated to
+        list_screen.set_visible_page(3)
+        list_screen.refresh(lazy_pages=0)
+        self.assertEqual(drawn(), [0, 1, 5, 2, 3, 4])
+
+        # a vanished page is cleared once
+        cmd_send.reset_mock()
+        for _ in range(3):
+            for page in pages[:3]:
+                list_screen.update_page(page, page_items("c"))
+            list_screen.delete_unupdated_page_items()
+            list_screen.refresh(lazy_pages=0)
+        self.assertEqual(
+            [call.args[0] for call in cmd_send.clr_page.call_args_list], [3, 4]
+        )
+
+    def test_main_screen_update(self):
+        cmd_send = mock.Mock()
+        main_screen = widget.MainScreen(cmd_send)
+
+        def content(gps, can):
+            content = widget.MainScreenContent()
+            for icon_type, value in (
+                (widget.MainScreenIconType.GPS, gps),
+                (widget.MainScreenIconType.CAN, can),
+            ):
+                content.append(
+                    widget.MainScreenIcon(icon_type, value, widget.PageItem("k", "v"))
+                )
+            return content
+
+        main_screen.update(content(1, 1))
+        self.assertEqual(cmd_send.icon.call_count, 2)
+
+        main_screen.update(content(1, 1))
+        self.assertEqual(cmd_send.icon.call_count, 2)
+
+        # only the changed icon is sent
+        main_screen.update(content(1, 2))
+        cmd_send.icon.assert_called_with(widget.MainScreenIconType.CAN.value, 2)
+        self.assertEqual(cmd_send.icon.call_count, 3)
+
+        # an override is shown at once and kept over the collected value
+        gps = widget.MainScreenIconType.GPS
+        main_screen.set_override(gps, 5)
+        cmd_send.icon.assert_called_with(gps.value, 5)
+        main_screen.update(content(3, 2))
+        self.assertEqual(cmd_send.icon.call_count, 4)
+
+        main_screen.clear_override(gps)
+        cmd_send.icon.assert_called_with(gps.value, 3)
+        self.assertEqual(cmd_send.icon.call_count, 5)
+
+        # stale: NONE, but an override is still shown
+        main_screen.set_override(gps, 5)
+        main_screen.set_stale(True)
+        cmd_send.icon.assert_called_with(widget.MainScreenIconType.CAN.value, 0)
+        stale = content(3, 2)
+        stale.stale = True
+        main_screen.set_stale(False)
+        main_screen.update(stale)
+        main_screen.clear_override(gps)
+        cmd_send.icon.assert_called_with(gps.value, 0)
+
+        main_screen.update(content(3, 2))
+        self.assertEqual(
+            [call.args for call in cmd_send.icon.call_args_list[-2:]],
+            [(gps.value, 3), (widget.MainScreenIconType.CAN.value, 2)],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,39 +3,99 @@ __version__ = "1.7.0"
 
 import time
 import threading
+import multiprocessing
 import re
+from dataclasses import dataclass, field
 from enum import Enum, auto
-from stat import *
 from datetime import timedelta, timezone
-from optparse import OptionParser
 import configparser as ConfigParser
 import logging
-from distutils.util import strtobool
 import os
+import sys
+import traceback
 import atexit
 
 import terminal_display_backend as bk
 from terminal_display_command import *
 import terminal_display_widget as widget
 import terminal_display_serial as serial
+import terminal_display_snapshot as snapshot
+import terminal_display_config
+import terminal_display_profile as profile
+import terminal_display_trace as trace
 
 
 DEFAULT_CONFIG_FILE = "terminal-display.cfg"
 FW_VERSION_FILE_PATH = "/run/terminal-display/firmware_version"
+# Every firmware talks at this rate after a reset.
+DEFAULT_BAUDRATE = 115200
+# The display times out after 10 seconds without a command. Ping it when it
+# has not acknowledged anything for this long.
+KEEPALIVE_SEC = 5
+# How often the watchdog checks that the refresh cycles go on.
+WATCHDOG_INTERVAL_SEC = 1
+# At most one trace of a slow refresh cycle is written per this many seconds.
+SLOW_CYCLE_TRACE_INTERVAL_SEC = 60
+# Beeps played while the list screen shows an error, while deferred data is
+# uploaded, once it has all been uploaded, and after a button action. The
+# first two repeat at the pace of the former beep thread (a beep, 1 sec, then
+# 0.5 sec until it checked again).
+BEEP_REPEAT_SEC = 1.5
+BEEP_ERROR = BeepPattern(2, 50, 2, repeat_sec=BEEP_REPEAT_SEC)
+BEEP_DEFERRED_UPLOADING = BeepPattern(1, 30, 1, repeat_sec=BEEP_REPEAT_SEC)
+BEEP_UPLOAD_COMPLETE = BeepPattern(5, 500, 1)
+BEEP_ACTION_SUCCEEDED = BeepPattern(3, 50, 1)
+BEEP_ACTION_FAILED = BeepPattern(3, 50, 2)
 LOGGING_FORMAT_INFO = "[%(levelname)s] %(message)s"
 LOGGING_FORMAT_DEBUG = "[%(levelname)s] %(funcName)s():%(lineno)d :%(message)s"
 
 
 @atexit.register
 def remove_version_file():
+    # NOTE: The collector process imports this module too. The file belongs
+    # to the process that talks to the display.
+    if multiprocessing.parent_process() is not None:
+        return
     if os.path.exists(FW_VERSION_FILE_PATH):
         os.remove(FW_VERSION_FILE_PATH)
 
 
+def strtobool(val):
+    # Same as the removed distutils.util.strtobool
+    val = val.lower()
+    if val in ("y", "yes", "t", "true", "on", "1"):
+        return 1
+    elif val in ("n", "no", "f", "false", "off", "0"):
+        return 0
+    else:
+        raise ValueError(f"invalid truth value {val!r}")
+
+
+def round_to_step(value, step):
+    return round(value / step) * step
+
+
+def round_significant(value, digits=2):
+    return float(f"{value:.{digits}g}")
+
+
+def process_uptime():
+    """Seconds since this process (PID 1 of the container) was started."""
+    try:
+        with open("/proc/self/stat") as f:
+            # The command name may contain spaces, skip past it.
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, IndexError, ValueError):
+        return None
+
+
 class Backend:
-    def __init__(self, base_uri):
+    def __init__(self, base_uri, metrics_window_sec=600):
         self.api_client = bk.TerminalSystemAPIClient(base_uri)
-        self.backend = bk.TerminalDisplayBackend(self.api_client)
+        self.backend = bk.TerminalDisplayBackend(self.api_client, metrics_window_sec)
         self.get_funcs = {
             "connection": self._get_connection,
             "stream": self._get_stream,
@@ -49,6 +109,7 @@ class Backend:
             "camera_state": self._get_camera_state,
             "gps_state": self._get_gps_state,
             "hardware_info": self._get_hardware_info,
+            "metrics_trend": self._get_metrics_trend,
         }
         self.post_funcs = {
             "start_agent_streamer": self._post_start_agent_streamer,
@@ -56,7 +117,16 @@ class Backend:
         }
 
     def get(self, endpoint):
-        obj, success = self.get_funcs[endpoint]()
+        import requests
+
+        # NOTE: An unexpected answer of the API (e.g. a body that is not JSON)
+        # fails the get instead of killing the thread that asked for it.
+        try:
+            with trace.span("get", "backend", endpoint=endpoint):
+                obj, success = self.get_funcs[endpoint]()
+        except (requests.RequestException, ValueError) as e:
+            logging.error(f"get {endpoint}: {e!r}")
+            obj, success = None, False
         if not success:
             logging.error(f"get {endpoint} failed")
         return obj, success
@@ -103,6 +173,13 @@ class Backend:
     def _get_hardware_info(self):
         return self.backend.get_hardware_info()
 
+    def _get_metrics_trend(self):
+        return self.backend.get_metrics_trend()
+
+    def circuit_breakers(self):
+        circuit_breakers, _ = self.backend.get_circuit_breakers()
+        return circuit_breakers
+
     def _post_start_agent_streamer(self):
         return self.backend.start_agent_streamer()
 
@@ -110,10 +187,72 @@ class Backend:
         return self.backend.stop_agent_streamer()
 
 
+class FetchWorker:
+    """Runs the getters of ApiResponse in a thread of its own, one at a time,
+    so that a fetch that hangs can be given up on.
+
+    NOTE: A fetch given up on goes on in the background, and busy() is true
+    until it has returned. No other fetch may be started meanwhile; the
+    backend (its ring buffers and requests session) is not thread safe.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        # (func, arg, result list, done event) of the call to run
+        self._request = None
+        self._busy = False
+        threading.Thread(target=self._run, name="fetch", daemon=True).start()
+
+    def call(self, func, arg, timeout):
+        """func(arg), or TimeoutError after timeout seconds."""
+        result = []
+        done = threading.Event()
+        with self._cond:
+            if self._busy:
+                raise RuntimeError("a fetch is still running")
+            self._busy = True
+            self._request = (func, arg, result, done)
+            self._cond.notify()
+        if not done.wait(timeout):
+            raise TimeoutError
+        value, error = result[0]
+        if error is not None:
+            raise error
+        return value
+
+    def busy(self):
+        return self._busy
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._request is not None)
+                func, arg, result, done = self._request
+                self._request = None
+            try:
+                result.append((func(arg), None))
+            except Exception as e:
+                result.append((None, e))
+            self._busy = False
+            done.set()
+
+
 class ApiResponse:
-    def __init__(self, backend):
+    def __init__(self, backend, stale_after_sec=60, fetch_timeout_sec=None):
         self._backend = backend
         self._responses = dict()
+        # Incremented every time the content of a section changes.
+        self._versions = dict()
+        # NOTE: A section whose getter fails keeps its last good response, so
+        # that a transient API error does not clear and redraw its pages.
+        # It is marked stale once it is older than stale_after_sec.
+        self._stale_after_sec = stale_after_sec
+        self._update_times = dict()
+        self._stale = ()
+        # NOTE: A fetch that takes longer than fetch_timeout_sec is abandoned
+        # and counts as failed. Every fetch fails until it has returned.
+        self._fetch_timeout_sec = fetch_timeout_sec
+        self._fetch_worker = None
         self._endpoint_list: dict = {
             "connection": "connection",
             "stream": "stream",
@@ -127,13 +266,87 @@ class ApiResponse:
             "can_state": "can_state",
             "camera_state": "camera_state",
             "hardware_info": "hardware_info",
+            "metrics_trend": "metrics_trend",
         }
 
-    def update(self):
-        for endpoint in self._endpoint_list:
-            self._responses[endpoint], success = self._backend.get(endpoint)
-            if not success:
-                self._responses[endpoint] = {}
+    def update(self, endpoints=None):
+        if endpoints is None:
+            endpoints = self._endpoint_list
+        for endpoint in endpoints:
+            response, success = self._get(endpoint)
+            if success:
+                self._update_times[endpoint] = time.monotonic()
+            elif endpoint in self._update_times:
+                continue
+            else:
+                response = {}
+            if not self._same_content(self._responses.get(endpoint), response):
+                self._versions[endpoint] = self._versions.get(endpoint, 0) + 1
+            self._responses[endpoint] = response
+
+        now = time.monotonic()
+        stale = tuple(
+            endpoint
+            for endpoint, update_time in self._update_times.items()
+            if now - update_time > self._stale_after_sec
+        )
+        if stale != self._stale:
+            if stale:
+                logging.warning("stale api responses: %s", ", ".join(stale))
+            else:
+                logging.info("api responses are up to date")
+            self._stale = stale
+            self._versions["stale"] = self._versions.get("stale", 0) + 1
+
+    def _get(self, endpoint):
+        if not self._fetch_timeout_sec:
+            return self._backend.get(endpoint)
+
+        if self._fetch_worker is None:
+            self._fetch_worker = FetchWorker()
+        if self._fetch_worker.busy():
+            # A fetch given up on has not returned yet.
+            return None, False
+        try:
+            return self._fetch_worker.call(
+                self._backend.get, endpoint, self._fetch_timeout_sec
+            )
+        except TimeoutError:
+            logging.error(
+                f"get {endpoint} abandoned after {self._fetch_timeout_sec} sec. "
+                "no fetch until it returns"
+            )
+            return None, False
+
+    def _same_content(self, old, new):
+        # NOTE: Some getters stamp their response with the time it was fetched.
+        # The collectors do not display it, so it is not a change of content.
+        if isinstance(old, dict) and isinstance(new, dict):
+            return len(old) == len(new) and all(
+                key == "update_time" or (key in new and new[key] == value)
+                for key, value in old.items()
+            )
+        return old == new
+
+    def versions(self, endpoints):
+        return tuple(self._versions.get(endpoint, 0) for endpoint in endpoints)
+
+    def endpoints(self):
+        return list(self._endpoint_list)
+
+    def sections(self):
+        return dict(self._responses)
+
+    def age(self, endpoint):
+        """Seconds since the last successful update, or None if never."""
+        update_time = self._update_times.get(endpoint)
+        if update_time is None:
+            return None
+        return time.monotonic() - update_time
+
+    def stale(self):
+        """Sections older than stale_after_sec."""
+        return self._stale
 
     def connection(self):
         return self._responses.get("connection")
@@ -171,6 +384,129 @@ class ApiResponse:
     def hardware_info(self):
         return self._responses.get("hardware_info")
 
+    def metrics_trend(self):
+        return self._responses.get("metrics_trend")
+
+
+# Sections read by the main screen. They are fetched first at startup so
+# the main screen can be drawn before the rest of the API has been polled.
+MAIN_SCREEN_ENDPOINTS = (
+    "stream",
+    "daemon",
+    "network",
+    "gps_state",
+    "can_state",
+    "camera_state",
+)
+
+# Sections read by each collector. A collector is only re-run when one of
+# them has changed since its last run.
+COLLECTOR_ENDPOINTS = {
+    "_collect_main_screen_content": MAIN_SCREEN_ENDPOINTS + ("stale",),
+    "_collect_top_page_items": MAIN_SCREEN_ENDPOINTS + ("stale",),
+    "_collect_network_page_contents": ("network",),
+    "_collect_agent_page_contents": (
+        "upstreams",
+        "downstreams",
+        "deferred_upload",
+        "daemon",
+    ),
+    "_collect_device_connector_page_contents": ("device_connectors",),
+    "_collect_hardware_info_page_contents": ("hardware_info",),
+    "_collect_trend_page_contents": ("metrics_trend",),
+}
+
+# Collectors of the list screen pages after the Top page, in page order.
+LIST_SCREEN_COLLECTORS = (
+    "_collect_network_page_contents",
+    "_collect_agent_page_contents",
+    "_collect_device_connector_page_contents",
+    "_collect_hardware_info_page_contents",
+    "_collect_trend_page_contents",
+)
+
+
+@dataclass(slots=True)
+class ScreenUpdate:
+    """What changed on the screens since the previous ScreenUpdate.
+
+    Sent by the collector process, see CollectorProcess. Unchanged contents
+    are left out (None, or missing from pages)."""
+
+    main_screen_content: widget.MainScreenContent = None
+    # Titles of all the list pages, in order.
+    titles: tuple = None
+    # title -> PageItems
+    pages: dict = field(default_factory=dict)
+
+    def apply(self, update: "ScreenUpdate"):
+        """Merge a later update into this one."""
+        if update.main_screen_content is not None:
+            self.main_screen_content = update.main_screen_content
+        if update.titles is not None:
+            self.titles = update.titles
+            self.pages = {
+                title: items
+                for title, items in self.pages.items()
+                if title in update.titles
+            }
+        self.pages.update(update.pages)
+
+
+class ActionJob:
+    """A measurement start/stop requested with the display buttons.
+
+    Runs the API posts in a thread of its own, then polls the stream state
+    until it shows that the action took effect (converged(stream) is true)
+    or TIMEOUT_SEC has passed. mode is the Mode icon value it heads for."""
+
+    TIMEOUT_SEC = 120
+    POLL_SEC = 2
+
+    def __init__(self, name, backend, endpoints, converged, mode):
+        self.name = name
+        self.mode = mode
+        self._backend = backend
+        self._endpoints = endpoints
+        self._converged = converged
+        self._started = None
+        # None while the job runs, then whether it succeeded.
+        self.result = None
+        self._thread = threading.Thread(target=self._run, name="action", daemon=True)
+
+    def start(self):
+        self._started = time.monotonic()
+        self._thread.start()
+
+    def running(self):
+        return self._thread.is_alive()
+
+    def elapsed(self):
+        return time.monotonic() - self._started
+
+    def _run(self):
+        try:
+            self.result = self._post_and_wait()
+        except Exception:
+            logging.exception(f"{self.name} failed")
+            self.result = False
+
+    def _post_and_wait(self):
+        # NOTE: Post every endpoint even if one fails, e.g. start after a
+        # failed stop.
+        results = [self._backend.post(endpoint) for endpoint in self._endpoints]
+        logging.info(f"{self.name}: posted {self._endpoints} = {results}")
+        if not all(results):
+            return False
+
+        while self.elapsed() < self.TIMEOUT_SEC:
+            stream, success = self._backend.get("stream")
+            if success and self._converged(stream):
+                return True
+            time.sleep(self.POLL_SEC)
+        logging.error(f"{self.name}: the stream state did not follow")
+        return False
+
 
 class QueueState(Enum):
     NOT_INITIALIZED = auto()
@@ -179,7 +515,10 @@ class QueueState(Enum):
 
 
 class TerminalDisplayClient:
-    def __init__(self, config_file):
+    def __init__(self, config_file, collector_only=False):
+        # While the serial port is opened and the ESP32 is reset.
+        bk.preload_requests()
+
         try:
             self._config_file = config_file
             self._config = ConfigParser.ConfigParser()
@@ -187,6 +526,11 @@ class TerminalDisplayClient:
         except:
             logging.error("can't open setting file:" + self._config_file)
             exit()
+        # Settings changed on the display, saved in the background.
+        self._config_persister = terminal_display_config.ConfigPersister(
+            self._config, self._config_file
+        )
+        atexit.register(self._config_persister.flush)
 
         try:
             log_level = self._config.get("general", "log_level")
@@ -197,77 +541,155 @@ class TerminalDisplayClient:
         except:
             logging.error("can't read debug flag. set to Enable debug log")
 
-        # setup serial port
-        try:
-            serial_path = self._config.get("general", "serial_path")
-            reset = self._config.get("general", "reset")
-            logging.info("reset esp32:{}".format(reset))
-            logging.info("open serial:{}".format(serial_path))
-        except:
-            logging.error("can't read setting file:" + self._config_file)
+        # The collector process does not talk to the display.
+        if not collector_only:
+            # setup serial port
+            try:
+                serial_path = self._config.get("general", "serial_path")
+                reset = self._config.get("general", "reset")
+                logging.info("reset esp32:{}".format(reset))
+                logging.info("open serial:{}".format(serial_path))
+            except:
+                logging.error("can't read setting file:" + self._config_file)
 
-        try:
-            tz = self._config.get("m5stack", "time_zone")
-            tz = timezone(timedelta(hours=int(tz)))
-            serial_option = serial.SerialOption(serial_path, 115200, None)
-            self._cmd_sender = CommandSender(serial_option, tz)
-            self._cmd_receiver = CommandReceiver(serial_option)
-            if reset == "yes":
-                self._cmd_sender.reset()
-        except:
-            logging.error("Can not open serial device")
-            logging.error("exit()")
-            exit()
+            try:
+                tz = self._config.get("m5stack", "time_zone")
+                tz = timezone(timedelta(hours=int(tz)))
+                serial_option = serial.SerialOption(serial_path, DEFAULT_BAUDRATE, None)
+                self._cmd_sender = CommandSender(serial_option, tz)
+                self._cmd_receiver = CommandReceiver(serial_option)
+                if reset == "yes":
+                    self._cmd_sender.reset()
+            except:
+                logging.error("Can not open serial device")
+                logging.error("exit()")
+                exit()
 
         base_uri = self._config.get("general", "api_url")
+        trend_window_min = self._config.getint(
+            "general", "trend_window_min", fallback=10
+        )
 
-        self._backend = Backend(base_uri)
+        self._base_uri = base_uri
+        self._backend = Backend(base_uri, trend_window_min * 60)
+        self._stale_after_sec = self._config.getint(
+            "general", "stale_after_sec", fallback=60
+        )
+        self._fetch_timeout_sec = self._config.getfloat(
+            "general", "fetch_timeout_sec", fallback=30
+        )
+        # The main screen icons are shown as NONE when no refresh cycle has
+        # completed for this long, see _watchdog_thread().
+        self._watchdog_sec = self._config.getfloat(
+            "general", "watchdog_sec", fallback=60
+        )
+
+        # Poll the API and collect the page contents in a child process.
+        api_process = self._config.getboolean("general", "api_process", fallback=False)
+        if api_process and not collector_only:
+            self._collector_process = CollectorProcess(self._config_file)
+        else:
+            self._collector_process = None
+
+        # NOTE: The snapshot is served by the process that polls the API.
+        snapshot_socket = self._config.get("general", "snapshot_socket", fallback="")
+        if snapshot_socket and api_process == collector_only:
+            self._snapshot_server = snapshot.SnapshotServer(snapshot_socket)
+        else:
+            self._snapshot_server = None
         self._recover_flg = False
         self._restart_service_flg = False
-        self._beep_flag_error = False
-        self._beep_flag_deferred_uploading = False
-        self._beep_flag_deferred_upload_complete = False
+        # The last ActionJob, and whether its result has been shown (or it
+        # has timed out). See _poll_action_job().
+        self._action_job = None
+        self._action_job_shown = True
+        # Set once the main screen is drawn, for the progress of ActionJob and
+        # the watchdog.
+        self._main_screen = None
+        # When the screens were last refreshed, None until they are built.
+        # See _watchdog_thread().
+        self._cycle_done_at = None
+        # Page shown on the display (-1: main screen), None until reported.
+        self._visible_page = None
+        # Command encodings and baud rates announced by the display in reply
+        # to "version".
+        self._display_encodings = ()
+        self._display_baudrates = ()
+        # Beeps for the state changes found in _notify_beeps().
+        if not collector_only:
+            self._beep_scheduler = BeepScheduler(self._cmd_sender)
         self._queue_state = QueueState.NOT_INITIALIZED
+        self._service_page_items_cache = {}
+        self._service_page_items_cache_next = {}
+        self._collector_cache = {}
+
+        # Profiling on demand, see terminal_display_profile.
+        self._profiler = profile.Profiler(
+            "collector" if collector_only else "client",
+            self._config.get(
+                "general", "profile_dir", fallback=profile.DEFAULT_PROFILE_DIR
+            ),
+            self._config.getint(
+                "general", "profile_sec", fallback=profile.DEFAULT_PROFILE_SEC
+            ),
+        )
+
+        # Spans of the refresh cycle, see terminal_display_trace. A cycle that
+        # takes trace_slow_cycle_sec or longer is written to profile_dir.
+        trace.enable(self._config.getint("general", "trace_spans", fallback=0))
+        self._trace_slow_cycle_sec = self._config.getfloat(
+            "general", "trace_slow_cycle_sec", fallback=0
+        )
+        self._slow_cycle_traced = None
 
         self._th_list = list()
-        th = threading.Thread(target=self._recv_thread, daemon=True)
+        th = threading.Thread(target=self._recv_thread, name="recv", daemon=True)
         self._th_list.append(th)
-        th = threading.Thread(target=self._ping_thread, daemon=True)
+        th = threading.Thread(target=self._ping_thread, name="ping", daemon=True)
         self._th_list.append(th)
-        th = threading.Thread(target=self._api_thread, daemon=True)
+        th = threading.Thread(target=self._api_thread, name="api", daemon=True)
         self._th_list.append(th)
-        th = threading.Thread(target=self._beep_thread, daemon=True)
+        th = threading.Thread(
+            target=self._watchdog_thread, name="watchdog", daemon=True
+        )
         self._th_list.append(th)
 
-    def _beep_thread(self):
-        volume = self._config.get("m5stack", "volume")
-        logging.info("volume :" + volume)
-        self._cmd_sender.set_vol(volume)
-
-        logging.info("Start beep_thread()")
+    def _watchdog_thread(self):
+        logging.info("Start watchdog_thread()")
+        # NOTE: A refresh cycle can hang, e.g. on a fetch that gets no answer.
+        # The icons would keep showing the last state meanwhile, so they are
+        # shown as NONE until the cycles go on. Pings and beeps have threads
+        # of their own and are not held up.
+        stale = False
         while True:
-            if self._beep_flag_error:
-                self._cmd_sender.beep(2, 50, 2)
-                self._beep_flag_error = False
-                time.sleep(1)
-
-            if self._beep_flag_deferred_uploading:
-                self._cmd_sender.beep(1, 30, 1)
-                time.sleep(1)
-
-            if self._beep_flag_deferred_upload_complete:
-                self._cmd_sender.beep(5, 500, 1)
-                self._beep_flag_deferred_upload_complete = False
-                time.sleep(1)
+            time.sleep(WATCHDOG_INTERVAL_SEC)
+            if self._cycle_done_at is None:
+                continue
+            age = time.monotonic() - self._cycle_done_at
+            if (age > self._watchdog_sec) == stale:
+                continue
 
-            time.sleep(0.5)
+            stale = not stale
+            if stale:
+                frame = sys._current_frames().get(threading.main_thread().ident)
+                logging.error(
+                    f"no refresh for {age:.0f} sec. the send thread is at:\n"
+                    + "".join(traceback.format_stack(frame)[-5:])
+                )
+            else:
+                logging.info("refresh cycles go on again")
+            self._main_screen.set_stale(stale)
 
     def _ping_thread(self):
         logging.info("Start ping_thread()")
         while True:
+            # NOTE: Every ACK shows that the link is up, so only a quiet link
+            # is pinged. A failed ping marks the link down (see _send_thread).
+            idle = self._cmd_sender.idle_time()
+            if idle < KEEPALIVE_SEC:
+                time.sleep(KEEPALIVE_SEC - idle)
+                continue
             self._cmd_sender.ping()
-            # Timeout is 10 seconds
-            time.sleep(5)
 
     def _collect_main_screen_content_mode(self, stream, daemon):
         page_item = widget.PageItem(
@@ -527,6 +949,10 @@ class TerminalDisplayClient:
         camera = self._collect_main_screen_content_camera(api_response.camera_state())
 
         content = widget.MainScreenContent()
+        # The icons would show the last good response.
+        content.stale = any(
+            endpoint in MAIN_SCREEN_ENDPOINTS for endpoint in api_response.stale()
+        )
         content.append(mode)
         content.append(queue)
         content.append(network)
@@ -554,6 +980,14 @@ class TerminalDisplayClient:
         page_items.append(can.page_item)
         page_items.append(camera.page_item)
 
+        # Pages are showing the last good response of these sections.
+        stale = api_response.stale()
+        if stale:
+            value = stale[0] if len(stale) == 1 else f"{len(stale)} sections"
+            page_items.append(
+                widget.PageItem("Stale", value, widget.ListScreenValueColorEnum.ORANGE)
+            )
+
         return page_items
 
     def _collect_network_page_contents(self, api_response: ApiResponse):
@@ -666,6 +1100,7 @@ class TerminalDisplayClient:
         upstreams = api_response.upstreams()
         downstreams = api_response.downstreams()
         deferred_upload = api_response.deferred_upload()
+        daemon = api_response.daemon()
 
         for upstream in upstreams:
             id = upstream.get("id")
@@ -806,121 +1241,123 @@ class TerminalDisplayClient:
                     "Threshold", "{:.1f} GB".format(auto_delete_threshold / 1024)
                 )
             )
+            if daemon:
+                page_items.append(
+                    self._time_to_empty_to_page_item(daemon.get("time_to_empty"))
+                )
 
             agent_page_contents.append((page, page_items))
 
         return agent_page_contents
 
-    def _get_substitution_string(
-        self, service_substitutions, substitution_variables, search_key, with_unit=True
-    ) -> str:
-        config_value = None
-        default_value = None
-
-        # search config value
-        if service_substitutions:
-            for service_substitution in service_substitutions:
-                match = re.search(f"^{search_key}=(.*)", service_substitution)
-                if match:
-                    config_value = match.group(1)
-                    break
-
-        if config_value:
-            value = config_value
+    def _time_to_empty_to_page_item(self, time_to_empty) -> widget.PageItem:
+        if time_to_empty is None:
+            return widget.PageItem(
+                "ETA", "none", widget.ListScreenValueColorEnum.DARKGREY
+            )
+
+        # NOTE: Coarse steps keep the page from being redrawn every cycle.
+        sec = int(time_to_empty)
+        if sec == 0:
+            value = "empty"
+        elif sec < 60:
+            value = "{}s".format(max(sec // 10 * 10, 10))
+        elif sec < 60 * 60:
+            value = "{}m".format(sec // 60)
+        elif sec < 100 * 60 * 60:
+            value = "{}h{:02d}m".format(sec // 3600, sec % 3600 // 60)
         else:
-            # search default value
-            for substitution_variable in substitution_variables:
-                variable_key = substitution_variable.get("key")
-                if search_key == variable_key:
-                    default = substitution_variable.get("default")
-                    if default:
-                        default_value = default
-                    break
-
-            if default_value:
-                value = default_value
+            value = ">99h"
+
+        return widget.PageItem("ETA", value)
+
+    def _build_substitution_index(self, service_substitutions, substitution_variables):
+        """Map each substitution key to (config value, default value, unit)."""
+        index = {}
+
+        # config value: the first "KEY=value" entry
+        config_values = {}
+        for service_substitution in service_substitutions or []:
+            key, sep, value = service_substitution.partition("=")
+            if sep and key not in config_values:
+                config_values[key] = value.split("\n", 1)[0]
+
+        for substitution_variable in substitution_variables or []:
+            key = substitution_variable.get("key")
+            if key in index:
+                config_value, default_value, unit = index[key]
             else:
-                return ""
-
-        if with_unit:
-            for substitution_variable in substitution_variables:
-                variable_key = substitution_variable.get("key")
-                if search_key == variable_key:
-                    display_strings_i18n = substitution_variable.get(
-                        "display_strings_i18n"
-                    )
-                    if display_strings_i18n:
-                        # FIXME: support locale
-                        unit = display_strings_i18n[0].get("unit", "")
-                        if unit:
-                            value = f"{value} {unit}"
-                        break
+                config_value = config_values.get(key)
+                # default value: the first variable with the key
+                default_value = substitution_variable.get("default")
+                unit = None
+
+            # unit: the first variable with the key and display strings
+            if unit is None:
+                display_strings_i18n = substitution_variable.get("display_strings_i18n")
+                if display_strings_i18n:
+                    # FIXME: support locale
+                    unit = display_strings_i18n[0].get("unit", "")
+
+            index[key] = (config_value, default_value, unit)
+
+        for key, config_value in config_values.items():
+            if key not in index:
+                index[key] = (config_value, None, None)
+
+        return index
+
+    def _get_substitution_string(self, substitution_index, search_key, with_unit=True):
+        config_value, default_value, unit = substitution_index.get(
+            search_key, (None, None, None)
+        )
+
+        value = config_value or default_value
+        if not value:
+            return ""
+
+        if with_unit and unit:
+            value = f"{value} {unit}"
 
         return value
 
     def _collect_service_specific_page_items(
         self, service_id, service_substitutions, substitution_variables
     ):
-        service_specific_page_items: widget.PageItems = list()
+        # NOTE: substitution_variables (a list of dicts) is compared instead
+        # of being part of the key. Making it hashable (e.g. its repr) costs
+        # more than collecting the page items again.
+        key = (service_id, tuple(service_substitutions or ()))
+        cached = self._service_page_items_cache.get(key)
+        if cached is not None and cached[0] == substitution_variables:
+            self._service_page_items_cache_next[key] = cached
+            return cached[1]
 
-        device_path = self._get_substitution_string(
-            service_substitutions, substitution_variables, "DC_DEVICE_PATH"
-        )
-        input_send_rate = self._get_substitution_string(
-            service_substitutions, substitution_variables, "DC_INPUT_SEND_RATE"
-        )
-        output_enabled = self._get_substitution_string(
-            service_substitutions, substitution_variables, "DC_OUTPUT_ENABLED"
-        )
-        output_frequency = self._get_substitution_string(
-            service_substitutions, substitution_variables, "DC_OUTPUT_FREQUENCY"
-        )
-        baudrate = self._get_substitution_string(
-            service_substitutions, substitution_variables, "DC_BAUDRATE"
-        )
-        listenonly = self._get_substitution_string(
-            service_substitutions, substitution_variables, "DC_LISTENONLY"
-        )
-        interface = self._get_substitution_string(
-            service_substitutions, substitution_variables, "DC_INTERFACE"
-        )
-        fd = self._get_substitution_string(
-            service_substitutions, substitution_variables, "DC_FD"
-        )
-        dbitrate = self._get_substitution_string(
-            service_substitutions, substitution_variables, "DC_DBITRATE"
-        )
-        fps = self._get_substitution_string(
-            service_substitutions, substitution_variables, "DC_FPS"
-        )
-        width = self._get_substitution_string(
-            service_substitutions, substitution_variables, "DC_WIDTH", with_unit=False
-        )
-        height = self._get_substitution_string(
-            service_substitutions, substitution_variables, "DC_HEIGHT", with_unit=False
-        )
-        bitrate = self._get_substitution_string(
-            service_substitutions, substitution_variables, "DC_BITRATE"
-        )
-        audio_format = self._get_substitution_string(
-            service_substitutions, substitution_variables, "DC_AUDIO_FORMAT"
-        )
-        audio_volume = self._get_substitution_string(
-            service_substitutions, substitution_variables, "DC_AUDIO_VOLUME"
-        )
-        audio_boost = self._get_substitution_string(
-            service_substitutions, substitution_variables, "DC_AUDIO_BOOST"
-        )
-        mixer_args = self._get_substitution_string(
-            service_substitutions, substitution_variables, "DC_MIXER_ARGS"
-        )
-        high_nav_rate = self._get_substitution_string(
-            service_substitutions, substitution_variables, "DC_HIGH_NAV_RATE"
-        )
-        send_interval = self._get_substitution_string(
-            service_substitutions, substitution_variables, "DC_SEND_INTERVAL"
+        service_specific_page_items: widget.PageItems = list()
+        index = self._build_substitution_index(
+            service_substitutions, substitution_variables
         )
 
+        device_path = self._get_substitution_string(index, "DC_DEVICE_PATH")
+        input_send_rate = self._get_substitution_string(index, "DC_INPUT_SEND_RATE")
+        output_enabled = self._get_substitution_string(index, "DC_OUTPUT_ENABLED")
+        output_frequency = self._get_substitution_string(index, "DC_OUTPUT_FREQUENCY")
+        baudrate = self._get_substitution_string(index, "DC_BAUDRATE")
+        listenonly = self._get_substitution_string(index, "DC_LISTENONLY")
+        interface = self._get_substitution_string(index, "DC_INTERFACE")
+        fd = self._get_substitution_string(index, "DC_FD")
+        dbitrate = self._get_substitution_string(index, "DC_DBITRATE")
+        fps = self._get_substitution_string(index, "DC_FPS")
+        width = self._get_substitution_string(index, "DC_WIDTH", with_unit=False)
+        height = self._get_substitution_string(index, "DC_HEIGHT", with_unit=False)
+        bitrate = self._get_substitution_string(index, "DC_BITRATE")
+        audio_format = self._get_substitution_string(index, "DC_AUDIO_FORMAT")
+        audio_volume = self._get_substitution_string(index, "DC_AUDIO_VOLUME")
+        audio_boost = self._get_substitution_string(index, "DC_AUDIO_BOOST")
+        mixer_args = self._get_substitution_string(index, "DC_MIXER_ARGS")
+        high_nav_rate = self._get_substitution_string(index, "DC_HIGH_NAV_RATE")
+        send_interval = self._get_substitution_string(index, "DC_SEND_INTERVAL")
+
         # NOTE: Currently, service identification is not implemented
         # so that it can be used for device connector services that will be added in the future.
 
@@ -1014,6 +1451,10 @@ class TerminalDisplayClient:
                 widget.PageItem("SendInterval", send_interval)
             )
 
+        self._service_page_items_cache_next[key] = (
+            substitution_variables,
+            service_specific_page_items,
+        )
         return service_specific_page_items
 
     def _collect_device_connector_page_contents(self, api_response: ApiResponse):
@@ -1021,6 +1462,9 @@ class TerminalDisplayClient:
 
         dcs = api_response.device_connectors()
 
+        # Keep only the entries of the device connectors seen in this cycle.
+        self._service_page_items_cache_next = {}
+
         for dc in dcs:
             id = dc.get("id")
             service_id = dc.get("service_id")
@@ -1058,6 +1502,8 @@ class TerminalDisplayClient:
 
             dc_page_contents.append((page, page_items))
 
+        self._service_page_items_cache = self._service_page_items_cache_next
+
         return dc_page_contents
 
     def _collect_hardware_info_page_contents(self, api_response: ApiResponse):
@@ -1110,87 +1556,386 @@ class TerminalDisplayClient:
 
         return hardware_info_page_contents
 
-    def _set_beep_flags(self, main_screen_content, list_screen):
-        if list_screen.is_error():
-            self._beep_flag_error = True
+    def _format_data_size(self, size) -> str:
+        if abs(size) > 1024 * 1024 * 1024:
+            return "{:.1f} GB".format(size / (1024 * 1024 * 1024))
+        elif abs(size) > 1024 * 1024:
+            return "{:.1f} MB".format(size / (1024 * 1024))
+        elif abs(size) > 0:
+            return "{:.1f} KB".format(size / 1024)
+        else:
+            return "0 Byte"
+
+    def _trend_page_items(self, stats, fmt, coarse, flat_slope, rising_is_worse):
+        page_items = widget.PageItems()
+
+        if not stats:
+            for key in ("Min", "Avg", "Max", "Trend"):
+                page_items.append(
+                    widget.PageItem(
+                        key, "none", widget.ListScreenValueColorEnum.DARKGREY
+                    )
+                )
+            return page_items
+
+        # NOTE: The values are rounded by coarse() so that the pages are not
+        # redrawn every cycle for the drift of the average and the slope.
+        page_items.append(widget.PageItem("Min", fmt(coarse(stats["min"]))))
+        page_items.append(widget.PageItem("Avg", fmt(coarse(stats["avg"]))))
+        page_items.append(widget.PageItem("Max", fmt(coarse(stats["max"]))))
+
+        slope = coarse(stats["slope"])
+        if abs(slope) < flat_slope:
+            trend = "flat"
+            color = widget.ListScreenValueColorEnum.GREEN
+        else:
+            sign = "+" if slope > 0 else "-"
+            trend = f"{sign}{fmt(abs(slope))}/min"
+            worse = slope > 0 if rising_is_worse else slope < 0
+            color = (
+                widget.ListScreenValueColorEnum.ORANGE
+                if worse
+                else widget.ListScreenValueColorEnum.GREEN
+            )
+        page_items.append(widget.PageItem("Trend", trend, color))
+
+        return page_items
+
+    def _collect_trend_page_contents(self, api_response: ApiResponse):
+        trend_page_contents: widget.PageContents = list()
+
+        metrics_trend = api_response.metrics_trend() or {}
+
+        page = widget.Page(widget.PageOptions("Trend CPU"))
+        page_items = self._trend_page_items(
+            metrics_trend.get("cpu_usage"),
+            "{:.0f}%".format,
+            lambda value: round_to_step(value, 5),
+            1.0,
+            True,
+        )
+        trend_page_contents.append((page, page_items))
+
+        page = widget.Page(widget.PageOptions("Trend RSSI"))
+        page_items = self._trend_page_items(
+            metrics_trend.get("rssi"),
+            "{:.0f}".format,
+            lambda value: round_to_step(value, 2),
+            1.0,
+            False,
+        )
+        trend_page_contents.append((page, page_items))
+
+        page = widget.Page(widget.PageOptions("Trend Queue"))
+        page_items = self._trend_page_items(
+            metrics_trend.get("pending_data_size"),
+            self._format_data_size,
+            round_significant,
+            1024,
+            True,
+        )
+        trend_page_contents.append((page, page_items))
+
+        return trend_page_contents
+
+    def _notify_beeps(self, main_screen_content, list_screen):
+        beeps = self._beep_scheduler
+        beeps.set_repeating("error", BEEP_ERROR if list_screen.is_error() else None)
 
         for icon in main_screen_content:
             if icon.type == widget.MainScreenIconType.MODE:
                 if icon.value == widget.MainScreenIconValueMode.RECOVER_ON:
-                    self._beep_flag_deferred_uploading = True
+                    beeps.set_repeating("deferred_uploading", BEEP_DEFERRED_UPLOADING)
                 else:
-                    self._beep_flag_deferred_uploading = False
+                    beeps.set_repeating("deferred_uploading", None)
 
             if icon.type == widget.MainScreenIconType.QUEUE:
                 if icon.value == widget.MainScreenIconValueQueue.SIZE_0B:
                     if self._queue_state == QueueState.SOME:
-                        self._beep_flag_deferred_upload_complete = True
+                        beeps.notify("deferred_upload_complete", BEEP_UPLOAD_COMPLETE)
                         self._queue_state = QueueState.EMPTY
                 elif icon.value != widget.MainScreenIconValueQueue.NONE:
                     self._queue_state = QueueState.SOME
 
+    def _publish_snapshot(self, api_response: ApiResponse):
+        if self._snapshot_server:
+            sections = api_response.sections()
+            ages = {name: api_response.age(name) for name in sections}
+            sections["circuit_breakers"] = self._backend.circuit_breakers()
+            self._snapshot_server.publish(sections, ages)
+
+    def _collect(self, name, api_response: ApiResponse):
+        versions = api_response.versions(COLLECTOR_ENDPOINTS[name])
+        cached = self._collector_cache.get(name)
+        if cached is not None and cached[0] == versions:
+            return cached[1]
+
+        with trace.span(name, "collector"):
+            result = getattr(self, name)(api_response)
+        self._collector_cache[name] = (versions, result)
+        return result
+
     def _send_thread(self):
         logging.info("start send_thread()")
 
         self._cmd_sender.version()
 
         self._cmd_sender.init()
+        self._select_encoding()
+        self._select_baudrate()
+
+        volume = self._config.get("m5stack", "volume")
+        logging.info("volume :" + volume)
+        self._cmd_sender.set_vol(volume)
 
         logging.info("get api responses")
-        api_response = ApiResponse(self._backend)
-        api_response.update()
+        if self._collector_process:
+            model = ScreenUpdate()
+            screens = self._build_screens_from_process(model)
+            while True:
+                self._run_cycle(self._refresh_cycle_from_process, model, *screens)
+
+        api_response = ApiResponse(
+            self._backend, self._stale_after_sec, self._fetch_timeout_sec
+        )
+        screens = self._build_screens(api_response)
+
+        while True:
+            self._run_cycle(self._refresh_cycle, api_response, *screens)
+
+    def _run_cycle(self, refresh_cycle, *args):
+        start = time.monotonic()
+        with trace.span("refresh_cycle", "cycle"):
+            refresh_cycle(*args)
+        self._cycle_done_at = time.monotonic()
+        elapsed = self._cycle_done_at - start
+
+        if not trace.enabled() or not self._trace_slow_cycle_sec:
+            return
+        if elapsed < self._trace_slow_cycle_sec:
+            return
+        if (
+            self._slow_cycle_traced is not None
+            and start - self._slow_cycle_traced < SLOW_CYCLE_TRACE_INTERVAL_SEC
+        ):
+            return
+        self._slow_cycle_traced = start
+        logging.warning(f"slow refresh cycle: {elapsed:.2f} sec")
+        self._profiler.dump_trace()
+
+    def _select_encoding(self):
+        # auto: the compact encoding if the display understands it
+        # text: always the text protocol
+        encoding = self._config.get("general", "encoding", fallback="auto")
+        if encoding == "auto" and BinaryEncoding.NAME in self._display_encodings:
+            self._cmd_sender.set_encoding(BinaryEncoding())
+
+    def _select_baudrate(self):
+        max_baudrate = self._config.getint(
+            "general", "max_baudrate", fallback=DEFAULT_BAUDRATE
+        )
+        baudrates = [
+            b for b in self._display_baudrates if DEFAULT_BAUDRATE < b <= max_baudrate
+        ]
+        if baudrates:
+            self._cmd_sender.set_baudrate(max(baudrates))
+
+    def _build_screens(self, api_response: ApiResponse):
+        api_response.update(MAIN_SCREEN_ENDPOINTS)
 
         # main screen
         main_screen = widget.MainScreen(self._cmd_sender)
-        main_screen_content = self._collect_main_screen_content(api_response)
+        self._main_screen = main_screen
+        main_screen_content = self._collect(
+            "_collect_main_screen_content", api_response
+        )
         main_screen.update(main_screen_content)
 
+        uptime = process_uptime()
+        if uptime is not None:
+            logging.info("first frame drawn %.2f sec after process start", uptime)
+
+        api_response.update(
+            [e for e in api_response.endpoints() if e not in MAIN_SCREEN_ENDPOINTS]
+        )
+        self._publish_snapshot(api_response)
+
         # list screen
         list_screen = widget.ListScreen(self._cmd_sender)
         top_page = widget.Page(widget.PageOptions("Top"))
-        list_screen.append_page(top_page, self._collect_top_page_items(api_response))
-        for page, items in self._collect_network_page_contents(api_response):
-            list_screen.append_page(page, items)
-        for page, items in self._collect_agent_page_contents(api_response):
-            list_screen.append_page(page, items)
-        for page, items in self._collect_device_connector_page_contents(api_response):
-            list_screen.append_page(page, items)
-        for page, items in self._collect_hardware_info_page_contents(api_response):
-            list_screen.append_page(page, items)
+        list_screen.append_page(
+            top_page, self._collect("_collect_top_page_items", api_response)
+        )
+        for name in LIST_SCREEN_COLLECTORS:
+            for page, items in self._collect(name, api_response):
+                list_screen.append_page(page, items)
         list_screen.build()
+        self._cycle_done_at = time.monotonic()
 
-        self._set_beep_flags(main_screen_content, list_screen)
+        self._notify_beeps(main_screen_content, list_screen)
 
-        while True:
-            api_response.update()
+        return main_screen, list_screen, top_page
 
-            main_screen_content = self._collect_main_screen_content(api_response)
-            main_screen.update(main_screen_content)
+    def _check_link(self):
+        # NOTE: exit() in the thread that found the link down (e.g. the ping
+        # thread) ends only that thread.
+        if self._cmd_sender.link_down():
+            logging.error("display link is down")
+            logging.error("exit()")
+            exit()
 
-            list_screen.update_page(
-                top_page, self._collect_top_page_items(api_response)
-            )
-            for page, items in self._collect_network_page_contents(api_response):
-                list_screen.update_page(page, items)
-            for page, items in self._collect_agent_page_contents(api_response):
-                list_screen.update_page(page, items)
-            for page, items in self._collect_device_connector_page_contents(
-                api_response
-            ):
-                list_screen.update_page(page, items)
-            for page, items in self._collect_hardware_info_page_contents(api_response):
-                list_screen.update_page(page, items)
-            list_screen.delete_unupdated_page_items()
+    def _refresh_cycle(self, api_response, main_screen, list_screen, top_page):
+        self._check_link()
+        self._profiler.check()
 
-            self._set_beep_flags(main_screen_content, list_screen)
+        # Catch up on the pages the display navigated to since the last cycle
+        # before fetching.
+        list_screen.set_visible_page(self._visible_page)
+        list_screen.refresh(lazy_pages=0)
 
-    def _recv_thread(self):
-        config = self._config
+        api_response.update()
+        self._publish_snapshot(api_response)
+
+        main_screen_content, pages = self._collect_screens(api_response, top_page)
+        self._draw_screens(main_screen, list_screen, main_screen_content, pages)
+
+    def _collect_screens(self, api_response: ApiResponse, top_page: widget.Page):
+        main_screen_content = self._collect(
+            "_collect_main_screen_content", api_response
+        )
+
+        pages = [(top_page, self._collect("_collect_top_page_items", api_response))]
+        for name in LIST_SCREEN_COLLECTORS:
+            pages.extend(self._collect(name, api_response))
+
+        return main_screen_content, pages
+
+    def _draw_screens(self, main_screen, list_screen, main_screen_content, pages):
+        main_screen.update(main_screen_content)
+
+        for page, items in pages:
+            list_screen.update_page(page, items)
+        list_screen.delete_unupdated_page_items()
+        list_screen.refresh()
+
+        self._notify_beeps(main_screen_content, list_screen)
+
+    def _build_screens_from_process(self, model: ScreenUpdate):
+        # Same steps as _build_screens(), with the contents collected by the
+        # collector process. Its first update has only the main screen.
+        collector = self._collector_process
+        collector.start()
+        collector.request()
+        model.apply(collector.receive())
+
+        main_screen = widget.MainScreen(self._cmd_sender)
+        self._main_screen = main_screen
+        main_screen.update(model.main_screen_content)
+
+        uptime = process_uptime()
+        if uptime is not None:
+            logging.info("first frame drawn %.2f sec after process start", uptime)
+
+        # NOTE: A collector process that has been restarted in between starts
+        # over with an update of only the main screen.
+        while model.titles is None:
+            collector.request()
+            model.apply(collector.receive())
+        # The collector process fetches the next update while this one is drawn.
+        collector.request()
+
+        # FIXME: Same as ListScreen.update_page(), pages that appear later are
+        # not shown.
+        list_screen = widget.ListScreen(self._cmd_sender)
+        pages = dict()
+        for title in model.titles:
+            pages[title] = widget.Page(widget.PageOptions(title))
+            list_screen.append_page(pages[title], model.pages[title])
+        list_screen.build()
+        self._cycle_done_at = time.monotonic()
+
+        self._notify_beeps(model.main_screen_content, list_screen)
+
+        return main_screen, list_screen, pages
+
+    def _refresh_cycle_from_process(self, model, main_screen, list_screen, pages):
+        self._check_link()
+        self._profiler.check()
+
+        list_screen.set_visible_page(self._visible_page)
+        list_screen.refresh(lazy_pages=0)
+
+        model.apply(self._collector_process.receive())
+        self._collector_process.request()
+
+        self._draw_screens(
+            main_screen,
+            list_screen,
+            model.main_screen_content,
+            [
+                (pages[title], model.pages[title])
+                for title in model.titles
+                if title in pages
+            ],
+        )
 
+    def _serve_screen_updates(self, conn):
+        """Collector process side of CollectorProcess: send a ScreenUpdate
+        for every request received on conn."""
+        api_response = ApiResponse(
+            self._backend, self._stale_after_sec, self._fetch_timeout_sec
+        )
+        top_page = widget.Page(widget.PageOptions("Top"))
+
+        # What the serial process has got so far.
+        sent = ScreenUpdate(titles=())
+
+        first = True
+        while True:
+            try:
+                conn.recv()
+            except (EOFError, OSError):
+                # The serial process is gone.
+                return
+            self._profiler.check()
+
+            update = ScreenUpdate()
+            with trace.span("collect", "cycle"):
+                if first:
+                    api_response.update(MAIN_SCREEN_ENDPOINTS)
+                    update.main_screen_content = self._collect(
+                        "_collect_main_screen_content", api_response
+                    )
+                    first = False
+                else:
+                    self._collect_screen_update(api_response, top_page, sent, update)
+            sent.apply(update)
+
+            try:
+                conn.send(update)
+            except OSError:
+                return
+
+    def _collect_screen_update(self, api_response, top_page, sent, update):
+        api_response.update()
+        self._publish_snapshot(api_response)
+        main_screen_content, pages = self._collect_screens(api_response, top_page)
+
+        # NOTE: The collectors return the same objects while their sections
+        # are unchanged (see _collect()), which is what keeps the updates small.
+        if main_screen_content is not sent.main_screen_content:
+            update.main_screen_content = main_screen_content
+        titles = tuple(page.get_title() for page, _ in pages)
+        if titles != sent.titles:
+            update.titles = titles
+        for page, items in pages:
+            if sent.pages.get(page.get_title()) is not items:
+                update.pages[page.get_title()] = items
+
+    def _recv_thread(self):
         logging.info("Start recv_thread()")
 
         # Config setting
-        store_volume_config = False
         section = "m5stack"
 
         while True:
@@ -1200,6 +1945,7 @@ class TerminalDisplayClient:
                 logging.debug("[READ ]: {}".format(data_str))
             except UnicodeDecodeError:
                 logging.error("detect UnicodeDecodeError. Skip")
+                continue
 
             # checking ACK responce
             if data == b'"ack"\r\n':
@@ -1212,20 +1958,37 @@ class TerminalDisplayClient:
                 self._restart_service_flg = True
             elif data == b'"volume":"3"\r\n':
                 logging.info("detect volume 3")
-                config.set(section, "volume", "3")
-                store_volume_config = True
+                self._config_persister.set(section, "volume", "3")
             elif data == b'"volume":"2"\r\n':
                 logging.info("detect volume 2")
-                config.set(section, "volume", "2")
-                store_volume_config = True
+                self._config_persister.set(section, "volume", "2")
             elif data == b'"volume":"1"\r\n':
                 logging.info("detect volume 1")
-                config.set(section, "volume", "1")
-                store_volume_config = True
+                self._config_persister.set(section, "volume", "1")
             elif data == b'"volume":"0"\r\n':
                 logging.info("detect volume 0")
-                config.set(section, "volume", "0")
-                store_volume_config = True
+                self._config_persister.set(section, "volume", "0")
+
+            # NOTE: Firmware that reports the shown page enables drawing the
+            # pages near it first (see ListScreen). Only record it here; the
+            # send thread draws.
+            match = re.match(r'"page":"(-?\d+)"', data_str)
+            if match:
+                self._visible_page = int(match.group(1))
+                logging.debug(f"visible page = {self._visible_page}")
+
+            # NOTE: Firmware that understands other command encodings or
+            # baud rates announces them before it acknowledges "version".
+            match = re.match(r'"encodings":"([^"]*)"', data_str)
+            if match:
+                self._display_encodings = tuple(match.group(1).split(","))
+                logging.info(f"display encodings = {self._display_encodings}")
+            match = re.match(r'"baudrates":"([\d,]*)"', data_str)
+            if match:
+                self._display_baudrates = tuple(
+                    int(b) for b in match.group(1).split(",") if b
+                )
+                logging.info(f"display baud rates = {self._display_baudrates}")
 
             # generate firmware version file
             match = re.search(r'"version":"(.*)"', data_str)
@@ -1241,55 +2004,177 @@ class TerminalDisplayClient:
                         + FW_VERSION_FILE_PATH
                     )
 
-            if store_volume_config:
-                try:
-                    config.write(open(self._config_file, "w"))
-                except:
-                    logging.error(
-                        "Error: Could not write to config file:" + self._config_file
-                    )
-                store_volume_config = False
-
     def _api_thread(self):
         logging.info("Start api_thread()")
         while True:
-            if self._recover_flg:
-                logging.info("stop agent streamer")
-                success = self._backend.post("stop_agent_streamer")
-                if success:
-                    self._cmd_sender.beep(3, 50, 1)
-                else:
-                    self._cmd_sender.beep(3, 50, 2)
-                logging.info(f"stop agent streamer is done. success = {success}")
-                self._recover_flg = False
-            elif self._restart_service_flg:
-                logging.info("restart agent streamer")
-                stop_success = self._backend.post("stop_agent_streamer")
-                start_success = self._backend.post("start_agent_streamer")
-                if stop_success and start_success:
-                    self._cmd_sender.beep(3, 50, 1)
-                else:
-                    self._cmd_sender.beep(3, 50, 2)
-                logging.info(
-                    f"restart agent streamer is done. stop_success = {stop_success}, start_success = {start_success}"
-                )
-                self._restart_service_flg = False
+            self._poll_action_job()
+            time.sleep(0.5)
+
+    def _poll_action_job(self):
+        job = self._action_job
+        if self._recover_flg or self._restart_service_flg:
+            restart = self._restart_service_flg
+            self._recover_flg = False
+            self._restart_service_flg = False
+
+            # NOTE: Operators press the button again when nothing seems to
+            # happen. Queueing another restart would only delay the first.
+            if job and job.running():
+                logging.info(f"{job.name} is in progress. ignore the button")
             else:
-                time.sleep(0.5)
+                job = self._action_job = self._start_action_job(restart)
+                self._action_job_shown = False
+
+        if not self._action_job_shown:
+            if job.result is not None or job.elapsed() >= job.TIMEOUT_SEC:
+                self._finish_action_job(job)
+                self._action_job_shown = True
+            else:
+                self._show_action_progress(job)
+
+    def _start_action_job(self, restart):
+        # NOTE: The job runs in a thread of its own, and self._backend belongs
+        # to the fetch worker. Requests sessions are not thread safe.
+        backend = Backend(self._base_uri)
+        if restart:
+            job = ActionJob(
+                "restart agent streamer",
+                backend,
+                ("stop_agent_streamer", "start_agent_streamer"),
+                lambda stream: stream.get("state") != "none",
+                widget.MainScreenIconValueMode.MEASURE_ON,
+            )
+        else:
+            job = ActionJob(
+                "stop agent streamer",
+                backend,
+                ("stop_agent_streamer",),
+                lambda stream: stream.get("state") == "none",
+                widget.MainScreenIconValueMode.RECOVER_OFF,
+            )
+        logging.info(job.name)
+        job.start()
+        self._show_action_progress(job)
+        return job
+
+    def _show_action_progress(self, job):
+        # The Mode icon flips between "off" and the state the job heads for
+        # every second while it runs.
+        if not self._main_screen:
+            return
+        if int(job.elapsed()) % 2:
+            value = job.mode
+        else:
+            value = widget.MainScreenIconValueMode.MEASURE_OFF
+        self._main_screen.set_override(widget.MainScreenIconType.MODE, value)
+
+    def _finish_action_job(self, job):
+        success = bool(job.result)
+        if job.result is None:
+            logging.error(f"{job.name} timed out after {job.TIMEOUT_SEC} sec")
+        if self._main_screen:
+            self._main_screen.clear_override(widget.MainScreenIconType.MODE)
+        if success:
+            self._beep_scheduler.notify("action", BEEP_ACTION_SUCCEEDED)
+        else:
+            self._beep_scheduler.notify("action", BEEP_ACTION_FAILED)
+        logging.info(
+            f"{job.name} is done in {job.elapsed():.1f} sec. success = {success}"
+        )
+
+    def _start_snapshot_server(self):
+        if self._snapshot_server:
+            try:
+                self._snapshot_server.start()
+            except OSError as e:
+                logging.error(f"can't start snapshot server: {e}")
+                self._snapshot_server = None
 
     def run(self):
+        # The main thread runs the send thread.
+        threading.current_thread().name = "send"
+        self._profiler.install()
+        self._start_snapshot_server()
+
         for th in self._th_list:
             th.start()
 
         self._send_thread()
 
 
+def run_collector_process(config_file, conn):
+    logging.basicConfig(level=logging.INFO, format=LOGGING_FORMAT_INFO)
+    logging.info("Start collector process")
+
+    threading.current_thread().name = "collector"
+    tdc = TerminalDisplayClient(config_file, collector_only=True)
+    tdc._profiler.install()
+    tdc._start_snapshot_server()
+    tdc._serve_screen_updates(conn)
+
+
+class CollectorProcess:
+    """Runs the API polling and the collectors in a child process.
+
+    Decoding large API responses and collecting the page contents hold the
+    GIL for long stretches, which delays the ACK handling of the serial link.
+    The child process sends back a ScreenUpdate for every request().
+    """
+
+    RESTART_DELAY_SEC = 1
+
+    def __init__(self, config_file):
+        # NOTE: Not fork; the serial process already runs threads.
+        self._context = multiprocessing.get_context("spawn")
+        self._config_file = config_file
+        self._process = None
+        self._conn = None
+
+    def start(self):
+        self._conn, child_conn = self._context.Pipe()
+        self._process = self._context.Process(
+            target=run_collector_process,
+            args=(self._config_file, child_conn),
+            name="collector",
+            daemon=True,
+        )
+        self._process.start()
+        child_conn.close()
+        logging.info(f"collector process started: pid {self._process.pid}")
+
+    def request(self):
+        try:
+            self._conn.send(None)
+        except OSError:
+            # Found out by receive().
+            pass
+
+    def receive(self) -> ScreenUpdate:
+        while True:
+            try:
+                return self._conn.recv()
+            except (EOFError, OSError):
+                self._process.join(self.RESTART_DELAY_SEC)
+                logging.error(
+                    f"collector process exited: {self._process.exitcode}. restart"
+                )
+                self._conn.close()
+                time.sleep(self.RESTART_DELAY_SEC)
+
+            # NOTE: A new collector process starts over with the main screen
+            # and then sends the whole model.
+            self.start()
+            self.request()
+
+
 def main(config_file):
     tdc = TerminalDisplayClient(config_file)
     tdc.run()
 
 
 if __name__ == "__main__":
+    from optparse import OptionParser
+
     logging.basicConfig(level=logging.INFO, format=LOGGING_FORMAT_INFO)
 
     parser = OptionParser(
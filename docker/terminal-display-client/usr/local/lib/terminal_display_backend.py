@@ -1,17 +1,292 @@
 #!/usr/bin/env python3
 # coding: utf-8
 
-import argparse
+from array import array
 from datetime import datetime
+import logging
+import math
+import random
 import re
-import requests
 import socket
-import urllib
+import threading
+import time
+
+import terminal_display_trace as trace
+
+# NOTE: requests, argparse and json are imported where they are used so that
+# importing this module as a library stays cheap.
+
+
+class MetricRingBuffer:
+    """時系列メトリクスを固定長のリングバッファに保持します。
+
+    サンプルごとのオブジェクトは生成せず、時刻と値を array に格納します。
+    集計は直近 window_sec 秒以内のサンプルのみを対象とします。
+    """
+
+    def __init__(self, capacity, window_sec):
+        self._capacity = capacity
+        self._window_sec = window_sec
+        self._times = array("d", bytes(8 * capacity))
+        self._values = array("d", bytes(8 * capacity))
+        self._head = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, value, ts=None):
+        self._times[self._head] = time.monotonic() if ts is None else ts
+        self._values[self._head] = value
+        self._head = (self._head + 1) % self._capacity
+        if self._count < self._capacity:
+            self._count += 1
+
+    def stats(self, now=None):
+        """直近 window_sec 秒以内のサンプルの統計値を取得します。
+
+        Returns
+        -------
+        obj or None
+            サンプルがない場合は None
+
+            * **min** (*float*)
+                最小値
+
+            * **avg** (*float*)
+                平均値
+
+            * **max** (*float*)
+                最大値
+
+            * **slope** (*float*)
+                最小二乗法による傾き（１分あたり）
+
+            * **samples** (*int*)
+                サンプル数
+        """
+        if now is None:
+            now = time.monotonic()
+        since = now - self._window_sec
+
+        n = 0
+        v_min = v_max = 0.0
+        sum_x = sum_y = sum_xx = sum_xy = 0.0
+        for i in range(self._count):
+            index = (self._head - 1 - i) % self._capacity
+            t = self._times[index]
+            if t < since:
+                break
+            v = self._values[index]
+            if n == 0 or v < v_min:
+                v_min = v
+            if n == 0 or v > v_max:
+                v_max = v
+            # x is relative to now to keep the sums small
+            x = t - now
+            sum_x += x
+            sum_y += v
+            sum_xx += x * x
+            sum_xy += x * v
+            n += 1
+
+        if n == 0:
+            return None
+
+        slope = 0.0
+        denominator = n * sum_xx - sum_x * sum_x
+        if n > 1 and denominator > 0:
+            slope = (n * sum_xy - sum_x * sum_y) / denominator * 60.0
+
+        return {
+            "min": v_min,
+            "avg": sum_y / n,
+            "max": v_max,
+            "slope": slope,
+            "samples": n,
+        }
+
+
+class DrainRateEstimator:
+    """送信待ちデータサイズの推移から遅延アップロードの完了までの時間を推定します。
+
+    送信待ちデータサイズの減少速度を時定数 time_constant_sec の
+    指数移動平均（EWMA）で平滑化します。
+    サンプル間隔が一定でないため、平滑化係数は経過時間から求めます。
+    """
+
+    def __init__(self, time_constant_sec=60):
+        self._time_constant_sec = time_constant_sec
+        self._last_size = None
+        self._last_ts = None
+        self.drain_rate = None
+
+    def update(self, pending_data_size, ts=None):
+        if ts is None:
+            ts = time.monotonic()
+
+        if self._last_ts is not None and ts > self._last_ts:
+            dt = ts - self._last_ts
+            rate = (self._last_size - pending_data_size) / dt
+            if self.drain_rate is None:
+                self.drain_rate = rate
+            else:
+                alpha = 1.0 - math.exp(-dt / self._time_constant_sec)
+                self.drain_rate += alpha * (rate - self.drain_rate)
+
+        self._last_size = pending_data_size
+        self._last_ts = ts
+
+    def time_to_empty(self):
+        """送信待ちデータが無くなるまでの推定時間を取得します。
+
+        Returns
+        -------
+        float or None
+            推定時間（秒）。減少していない、または推定できない場合は None
+        """
+        if self._last_size is None:
+            return None
+        if self._last_size <= 0:
+            return 0.0
+        if not self.drain_rate or self.drain_rate <= 0:
+            return None
+        return self._last_size / self.drain_rate
+
+
+class CircuitBreaker:
+    """API のエンドポイントごとのサーキットブレーカーです。
+
+    連続して failure_threshold 回失敗すると open になり、待ち時間が経過するまで
+    リクエストを送りません。待ち時間の経過後は half_open になり、１回だけ
+    リクエストを試します。成功すると closed に戻り、失敗すると再び open に
+    なります。待ち時間は open になるたびに base_delay_sec から倍になり
+    （最大 max_delay_sec）、± jitter の割合でばらつかせます。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name,
+        failure_threshold=3,
+        base_delay_sec=1.0,
+        max_delay_sec=60.0,
+        jitter=0.2,
+        clock=time.monotonic,
+    ):
+        self.name = name
+        self._failure_threshold = failure_threshold
+        self._base_delay_sec = base_delay_sec
+        self._max_delay_sec = max_delay_sec
+        self._jitter = jitter
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opens = 0
+        self.rejected = 0
+        self._retry_at = 0.0
+
+    def allow(self):
+        """リクエストを送ってよいかを判定します。
+
+        Returns
+        -------
+        bool
+            送ってよい場合は True
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and self._clock() >= self._retry_at:
+                self._set_state(self.HALF_OPEN)
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opens = 0
+            if self.state != self.CLOSED:
+                self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (
+                self.state == self.CLOSED and self.failures >= self._failure_threshold
+            ):
+                delay = min(self._max_delay_sec, self._base_delay_sec * 2**self.opens)
+                delay *= 1.0 + self._jitter * (2.0 * random.random() - 1.0)
+                self._retry_at = self._clock() + delay
+                self.opens += 1
+                self._set_state(self.OPEN, delay)
+
+    def stats(self):
+        """状態を取得します。
+
+        Returns
+        -------
+        obj
+            * **state** (*str*)
+                closed, open, half_open のいずれか
+
+            * **failures** (*int*)
+                連続失敗回数
+
+            * **opens** (*int*)
+                連続して open になった回数
+
+            * **rejected** (*int*)
+                open の間に送らなかったリクエストの累計
+
+            * **retry_in** (*float or None*)
+                open の場合、次に試すまでの秒数
+        """
+        with self._lock:
+            retry_in = None
+            if self.state == self.OPEN:
+                retry_in = round(max(0.0, self._retry_at - self._clock()), 1)
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "opens": self.opens,
+                "rejected": self.rejected,
+                "retry_in": retry_in,
+            }
+
+    def _set_state(self, state, delay=None):
+        self.state = state
+        if state == self.OPEN:
+            logging.warning(
+                "circuit breaker %s: open for %.1f sec after %d failures",
+                self.name,
+                delay,
+                self.failures,
+            )
+        elif state == self.HALF_OPEN:
+            logging.debug("circuit breaker %s: half_open", self.name)
+        else:
+            logging.info("circuit breaker %s: closed", self.name)
 
 
 class TerminalDisplayBackend:
-    def __init__(self, api_client):
+    METRICS_HISTORY_KEYS = ("cpu_usage", "memory_used", "rssi", "pending_data_size")
+
+    def __init__(self, api_client, metrics_window_sec=600):
         self.api_client = api_client
+        self.drain_rate_estimator = DrainRateEstimator()
+        # NOTE: One slot per second of the window. The getters are polled at
+        # most about once per second, so the buffer always covers the window.
+        capacity = max(int(metrics_window_sec), 1)
+        self.metrics_history = {
+            key: MetricRingBuffer(capacity, metrics_window_sec)
+            for key in self.METRICS_HISTORY_KEYS
+        }
 
     def __del__(self):
         None
@@ -231,6 +506,12 @@ class TerminalDisplayBackend:
             * **average_uploading_speed** (*int*)
                 遅延アップロードの平均アップロード速度（バイト／秒）
 
+            * **drain_rate** (*float or None*)
+                送信待ちデータサイズの平滑化された減少速度（バイト／秒）
+
+            * **time_to_empty** (*float or None*)
+                送信待ちデータが無くなるまでの推定時間（秒）。推定できない場合は None
+
             * **update_time** (*datetime or None*)
                 最終更新タイムスタンプ
 
@@ -253,6 +534,8 @@ class TerminalDisplayBackend:
         measurements = resp.json()
 
         pending_data_size = self._aggregate_pending_data_size(measurements)
+        self.metrics_history["pending_data_size"].append(pending_data_size)
+        self.drain_rate_estimator.update(pending_data_size)
 
         average_uploading_speed = 0
         bitrate = status[0].get("bitrate")
@@ -263,6 +546,8 @@ class TerminalDisplayBackend:
             "state": state,
             "pending_data_size": pending_data_size,
             "average_uploading_speed": average_uploading_speed,
+            "drain_rate": self.drain_rate_estimator.drain_rate,
+            "time_to_empty": self.drain_rate_estimator.time_to_empty(),
             "update_time": update_time,
         }, True
 
@@ -629,12 +914,14 @@ class TerminalDisplayBackend:
 
         resp = self.api_client.get_terminal_system_metrics()
         if resp.status_code != 200:
-            return 0
+            return {}, False
         metrics = resp.json()
 
         carrier = self._get_carrier(metrics)
         rssi = self._get_rssi(metrics)
         mode = self._get_mode(metrics)
+        if rssi != 0:
+            self.metrics_history["rssi"].append(rssi)
 
         resp = self.api_client.get_network_connections()
         if resp.status_code != 200:
@@ -718,6 +1005,9 @@ class TerminalDisplayBackend:
         else:
             return {}, False
 
+        self.metrics_history["cpu_usage"].append(cpu_usage)
+        self.metrics_history["memory_used"].append(memory_used)
+
         return {
             "hostname": hostname,
             "cpu_usage": cpu_usage,
@@ -729,6 +1019,55 @@ class TerminalDisplayBackend:
             "version": version,
         }, True
 
+    def get_metrics_trend(self):
+        """直近のメトリクスの統計値を取得します。
+
+        get_hardware_info, get_network_state, get_daemon_state の呼び出し時に
+        記録された値を集計します。
+
+        Returns
+        -------
+        obj
+            メトリクス名をキーとした統計値。サンプルがない場合は None
+            詳細は MetricRingBuffer.stats を参照
+
+            * **cpu_usage** (*obj or None*)
+                CPU使用率（％）
+
+            * **memory_used** (*obj or None*)
+                メモリ使用量（MB）
+
+            * **rssi** (*obj or None*)
+                RSSI
+
+            * **pending_data_size** (*obj or None*)
+                送信待ちデータサイズ（バイト）
+
+        bool
+            OK
+        """
+        now = time.monotonic()
+        return {
+            key: history.stats(now) for key, history in self.metrics_history.items()
+        }, True
+
+    def get_circuit_breakers(self):
+        """API のエンドポイントごとのサーキットブレーカーの状態を取得します。
+
+        Returns
+        -------
+        obj
+            エンドポイントのパスをキーとした状態
+            詳細は CircuitBreaker.stats を参照
+
+        bool
+            OK
+        """
+        circuit_breakers = getattr(self.api_client, "circuit_breakers", None)
+        if circuit_breakers is None:
+            return {}, True
+        return circuit_breakers(), True
+
     def get_events(self, level="WARN"):
         """エラーイベントのリストを取得します。
 
@@ -889,150 +1228,479 @@ class TerminalDisplayBackend:
         return dt
 
     def _is_measurement_auto_start(self):
-        compose = self.api_client.get_compose_measurement().json()
+        # NOTE: A compose that cannot be got (e.g. the synthetic 503 of an open
+        # circuit breaker, which has no body) is not started automatically.
+        resp = self.api_client.get_compose_measurement()
+        if resp.status_code != 200:
+            return False
+        compose = resp.json()
         return compose.get("boot_after") == "system"
 
 
+def preload_requests():
+    """Import requests in a background thread.
+
+    requests is by far the most expensive import. Started early, e.g. while
+    the serial port is opened, it is mostly done by the time the first
+    TerminalSystemAPIClient is created. An import of requests in another
+    thread meanwhile waits for this one to finish (the import lock of the
+    module), it does not import it twice.
+    """
+    threading.Thread(target=_import_requests, name="preload", daemon=True).start()
+
+
+def _import_requests():
+    import requests  # noqa: F401
+
+
 class TerminalSystemAPIClient:
+    # (connect, read) timeouts of every request. A request that does not get
+    # an answer in time fails like a connection error.
+    REQUEST_TIMEOUT_SEC = (3.05, 10.0)
+
     def __init__(self, base_url):
+        import requests
+
         self.base_url = base_url
+        # NOTE: Reuse connections to the API across calls (HTTP keep-alive).
+        self._session = requests.Session()
+        self._breakers = {}
+
+    def _request(self, method, path, endpoint=None, **kwargs):
+        # NOTE: Requests to an endpoint that keeps failing are not sent while
+        # its circuit breaker is open, so that a degraded API is not hammered.
+        # They and connection errors are answered with a synthetic 503.
+        import requests
+
+        if endpoint is None:
+            endpoint = path
+        breaker = self._breakers.get(endpoint)
+        if breaker is None:
+            breaker = self._breakers.setdefault(endpoint, CircuitBreaker(endpoint))
+
+        if not breaker.allow():
+            return self._unavailable(path, "circuit breaker open")
+
+        kwargs.setdefault("timeout", self.REQUEST_TIMEOUT_SEC)
+        try:
+            with trace.span(method, "http", path=path):
+                resp = self._session.request(method, self.base_url + path, **kwargs)
+        except requests.RequestException as e:
+            breaker.record_failure()
+            return self._unavailable(path, str(e))
+
+        if resp.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return resp
+
+    def _unavailable(self, path, reason):
+        import requests
+
+        resp = requests.Response()
+        resp.status_code = 503
+        resp.reason = reason
+        resp.url = self.base_url + path
+        resp._content = b""
+        return resp
+
+    def circuit_breakers(self):
+        return {name: breaker.stats() for name, breaker in self._breakers.items()}
 
     def get_terminal_system(self):
-        return requests.get(self.base_url + "/terminal_system")
+        return self._request("GET", "/terminal_system")
 
     def get_terminal_system_identification(self):
-        return requests.get(self.base_url + "/terminal_system/identification")
+        return self._request("GET", "/terminal_system/identification")
 
     def get_network_route(self, ip):
-        return requests.get(self.base_url + "/network/route/" + ip)
+        return self._request("GET", "/network/route/" + ip, "/network/route")
 
     def get_network_devices(self):
-        return requests.get(self.base_url + "/network_devices")
+        return self._request("GET", "/network_devices")
 
     def get_network_connections(self):
-        return requests.get(self.base_url + "/network_connections")
+        return self._request("GET", "/network_connections")
 
     def get_terminal_system_metrics(self):
-        return requests.get(self.base_url + "/terminal_system/metrics")
+        return self._request("GET", "/terminal_system/metrics")
 
     def get_connection(self):
-        return requests.get(self.base_url + "/agent/connection")
+        return self._request("GET", "/agent/connection")
 
     def list_upstream(self):
-        return requests.get(self.base_url + "/agent/upstreams")
+        return self._request("GET", "/agent/upstreams")
 
     def list_upstream_state(self):
         params = {"enabled": "true"}
-        return requests.get(self.base_url + "/agent/upstreams/-/state", params=params)
+        return self._request("GET", "/agent/upstreams/-/state", params=params)
 
     def list_downstream(self):
-        return requests.get(self.base_url + "/agent/downstreams")
+        return self._request("GET", "/agent/downstreams")
 
     def list_downstream_state(self):
         params = {"enabled": "true"}
-        return requests.get(self.base_url + "/agent/downstreams/-/state", params=params)
+        return self._request("GET", "/agent/downstreams/-/state", params=params)
 
     def get_deferred_upload(self):
-        return requests.get(self.base_url + "/agent/deferred_upload")
+        return self._request("GET", "/agent/deferred_upload")
 
     def get_deferred_upload_state(self):
-        return requests.get(self.base_url + "/agent/deferred_upload/state")
+        return self._request("GET", "/agent/deferred_upload/state")
 
     def list_measurements(self):
-        return requests.get(self.base_url + "/agent/measurements")
+        return self._request("GET", "/agent/measurements")
 
     def list_device_connectors_for_upstream(self):
-        return requests.get(self.base_url + "/agent/device_connectors_upstream")
+        return self._request("GET", "/agent/device_connectors_upstream")
 
     def list_device_connector_state_for_upstream(self):
         params = {"enabled": "true"}
-        return requests.get(
-            self.base_url + "/agent/device_connectors_upstream/-/state", params=params
+        return self._request(
+            "GET", "/agent/device_connectors_upstream/-/state", params=params
         )
 
     def list_device_connectors_for_downstream(self):
-        return requests.get(self.base_url + "/agent/device_connectors_downstream")
+        return self._request("GET", "/agent/device_connectors_downstream")
 
     def list_device_connector_state_for_downstream(self):
         params = {"enabled": "true"}
-        return requests.get(
-            self.base_url + "/agent/device_connectors_downstream/-/state", params=params
+        return self._request(
+            "GET", "/agent/device_connectors_downstream/-/state", params=params
         )
 
     def list_device_connectors(self):
-        return requests.get(self.base_url + "/device_connectors")
+        return self._request("GET", "/device_connectors")
 
     def list_device_connector_services(self):
-        return requests.get(self.base_url + "/device_connector_services")
+        return self._request("GET", "/device_connector_services")
 
     def list_events(self):
-        return requests.get(self.base_url + "/events")
+        return self._request("GET", "/events")
 
     def get_compose_measurement(self):
-        return requests.get(self.base_url + "/docker/composes/measurement")
+        return self._request("GET", "/docker/composes/measurement")
 
     def patch_compose_measurement(self, auto_start: bool):
         headers = {"Content-Type": "application/json"}
         data = '{{"boot_after":"{0}"}}'.format("system" if auto_start else "")
-        return requests.patch(
-            self.base_url + "/docker/composes/measurement", headers=headers, data=data
+        return self._request(
+            "PATCH", "/docker/composes/measurement", headers=headers, data=data
         )
 
     def start_compose_measurement(self):
-        return requests.post(self.base_url + "/docker/composes/measurement/start")
+        return self._request("POST", "/docker/composes/measurement/start")
 
     def stop_compose_measurement(self):
-        return requests.post(self.base_url + "/docker/composes/measurement/stop")
+        return self._request("POST", "/docker/composes/measurement/stop")
+
+
+CLI_GETTERS = {
+    "get_connection": lambda backend: backend.get_connection(),
+    "get_stream": lambda backend: backend.get_stream(),
+    "get_upstreams": lambda backend: backend.get_upstreams(),
+    "get_downstreams": lambda backend: backend.get_downstreams(),
+    "get_deferred_upload": lambda backend: backend.get_deferred_upload(),
+    "get_daemon_state": lambda backend: backend.get_daemon_state(),
+    "get_device_connectors": lambda backend: backend.get_device_connectors(),
+    "get_device_connector_gps_state": lambda backend: (
+        backend.get_device_connector_gps_state()
+    ),
+    "get_device_connector_can_state": lambda backend: (
+        backend.get_device_connector_can_state()
+    ),
+    "get_device_connector_camera_state": lambda backend: (
+        backend.get_device_connector_camera_state()
+    ),
+    "get_device_connector_other_state": lambda backend: (
+        backend.get_device_connector_other_state()
+    ),
+    "get_network_state": lambda backend: backend.get_network_state(),
+    "get_hardware_info": lambda backend: backend.get_hardware_info(),
+    "get_metrics_trend": lambda backend: backend.get_metrics_trend(),
+    "get_circuit_breakers": lambda backend: backend.get_circuit_breakers(),
+    "get_events": lambda backend: backend.get_events(),
+}
+
+
+# Sections published by the display client (see terminal_display_snapshot)
+# that hold the same result as the getter.
+SNAPSHOT_SECTIONS = {
+    "get_connection": "connection",
+    "get_stream": "stream",
+    "get_upstreams": "upstreams",
+    "get_downstreams": "downstreams",
+    "get_deferred_upload": "deferred_upload",
+    "get_daemon_state": "daemon",
+    "get_device_connectors": "device_connectors",
+    "get_device_connector_gps_state": "gps_state",
+    "get_device_connector_can_state": "can_state",
+    "get_device_connector_camera_state": "camera_state",
+    "get_network_state": "network",
+    "get_hardware_info": "hardware_info",
+    "get_metrics_trend": "metrics_trend",
+    "get_circuit_breakers": "circuit_breakers",
+}
+
+
+def _split_result(ret):
+    # Most getters return (obj, ok). get_events returns the list itself on
+    # success and the actions return a bool.
+    if isinstance(ret, tuple) and len(ret) == 2 and isinstance(ret[1], bool):
+        return ret
+    if isinstance(ret, bool):
+        return None, ret
+    return ret, True
+
+
+def _json_default(obj):
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    return str(obj)
+
+
+def _dump_json(obj):
+    import json
+
+    return json.dumps(obj, default=_json_default, ensure_ascii=False)
+
+
+class _CliContext:
+    def __init__(self, args):
+        self.args = args
+        self._backend = None
+
+    @property
+    def backend(self):
+        # NOTE: Created on first use so that answers served from the display
+        # client's snapshot do not pay for importing requests.
+        if self._backend is None:
+            self._backend = TerminalDisplayBackend(
+                TerminalSystemAPIClient(self.args.api_url)
+            )
+        return self._backend
 
+    def snapshot(self, getters):
+        """Fetch the sections for getters from the display client.
 
-if __name__ == "__main__":
-    backend = TerminalDisplayBackend(
-        TerminalSystemAPIClient("http://localhost:8081/api")
+        Returns
+        -------
+        obj
+            {getter: result}. Getters without a usable section are omitted.
+        """
+        sections = {SNAPSHOT_SECTIONS[g]: g for g in getters if g in SNAPSHOT_SECTIONS}
+        if self.args.no_snapshot or not sections:
+            return {}
+
+        import terminal_display_snapshot as snapshot
+
+        resp = snapshot.query("get " + " ".join(sections), self.args.socket)
+        if not resp or not resp.get("ok"):
+            return {}
+
+        # NOTE: The display client keeps the last good value of a section it
+        # fails to get, so the age of each section counts. An empty section
+        # means it has never got it.
+        snapshot_age = resp.get("age", float("inf"))
+        ages = resp.get("ages", {})
+        result = {}
+        for section, value in resp.get("sections", {}).items():
+            # a client without "ages" only tells the age of the snapshot
+            age = ages.get(section, snapshot_age)
+            if value and age is not None and age <= self.args.max_age:
+                result[sections[section]] = value
+        return result
+
+    def call(self, name, snapshot=None):
+        if snapshot is None:
+            snapshot = self.snapshot([name])
+
+        start = time.monotonic()
+        error = None
+        if name in snapshot:
+            result, ok, source = snapshot[name], True, "snapshot"
+        else:
+            import requests
+
+            source = "api"
+            try:
+                result, ok = _split_result(CLI_GETTERS[name](self.backend))
+            except requests.RequestException as e:
+                result, ok, error = None, False, str(e)
+        record = {
+            "getter": name,
+            "ok": ok,
+            "source": source,
+            "latency_ms": round((time.monotonic() - start) * 1000, 1),
+            "result": result,
+        }
+        if error:
+            record["error"] = error
+        return record
+
+
+def _print_result(ctx, ret):
+    if not ctx.args.json:
+        print(ret)
+        return
+    result, ok = _split_result(ret)
+    print(_dump_json({"ok": ok, "result": result}))
+
+
+def _cli_get(ctx, name):
+    snapshot = ctx.snapshot([name])
+    if name in snapshot:
+        _print_result(ctx, (snapshot[name], True))
+    else:
+        _print_result(ctx, CLI_GETTERS[name](ctx.backend))
+
+
+def _cli_all(ctx):
+    start = time.monotonic()
+    snapshot = ctx.snapshot(CLI_GETTERS)
+    results = {}
+    for name in CLI_GETTERS:
+        record = ctx.call(name, snapshot)
+        del record["getter"]
+        results[name] = record
+    print(
+        _dump_json(
+            {
+                "time": datetime.now().astimezone().isoformat(),
+                "latency_ms": round((time.monotonic() - start) * 1000, 1),
+                "results": results,
+            }
+        )
     )
 
+
+def _cli_watch(ctx):
+    args = ctx.args
+    getters = args.getters or list(CLI_GETTERS)
+    cycle = 0
+    next_time = time.monotonic()
+    while args.count <= 0 or cycle < args.count:
+        snapshot = ctx.snapshot(getters)
+        for name in getters:
+            record = ctx.call(name, snapshot)
+            record["time"] = datetime.now().astimezone().isoformat()
+            record["cycle"] = cycle
+            print(_dump_json(record), flush=True)
+        cycle += 1
+
+        next_time += args.interval
+        delay = next_time - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            # Fell behind; do not try to catch up with a burst of calls.
+            next_time = time.monotonic()
+
+
+def main():
+    import argparse
+
+    def _getter_name(name):
+        # NOTE: argparse rejects an empty nargs="*" list when choices is set.
+        if name not in CLI_GETTERS:
+            raise argparse.ArgumentTypeError(f"invalid getter: {name}")
+        return name
+
     parser = argparse.ArgumentParser(
         description="Terminal System API wrapper for Terminal Display"
     )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="print the result as JSON instead of a Python repr",
+    )
+    parser.add_argument(
+        "--api-url",
+        default="http://localhost:8081/api",
+        help="Terminal System API URL (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--socket",
+        default="/run/terminal-display/snapshot.sock",
+        help="snapshot socket of the display client (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--max-age",
+        type=float,
+        default=30.0,
+        help="maximum age in seconds of a snapshot section to use "
+        "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--no-snapshot",
+        action="store_true",
+        help="always call the Terminal System API directly",
+    )
     subparsers = parser.add_subparsers()
     subparsers.add_parser("get_stream").set_defaults(
-        sub_cmd=lambda _: print(backend.get_stream())
+        sub_cmd=lambda ctx: _cli_get(ctx, "get_stream")
     )
     subparsers.add_parser("enable_auto_start").set_defaults(
-        sub_cmd=lambda _: print(backend.enable_auto_start())
+        sub_cmd=lambda ctx: _print_result(ctx, ctx.backend.enable_auto_start())
     )
     subparsers.add_parser("disable_auto_start").set_defaults(
-        sub_cmd=lambda _: print(backend.disable_auto_start())
+        sub_cmd=lambda ctx: _print_result(ctx, ctx.backend.disable_auto_start())
     )
     subparsers.add_parser("start_agent_streamer").set_defaults(
-        sub_cmd=lambda _: print(backend.start_agent_streamer())
+        sub_cmd=lambda ctx: _print_result(ctx, ctx.backend.start_agent_streamer())
     )
     subparsers.add_parser("stop_agent_streamer").set_defaults(
-        sub_cmd=lambda _: print(backend.stop_agent_streamer())
+        sub_cmd=lambda ctx: _print_result(ctx, ctx.backend.stop_agent_streamer())
     )
     subparsers.add_parser("get_daemon_state").set_defaults(
-        sub_cmd=lambda _: print(backend.get_daemon_state())
-    )
-    subparsers.add_parser("get_device_connector_gps_state").set_defaults(
-        sub_cmd=lambda _: print(backend.get_device_connector_gps_state())
-    )
-    subparsers.add_parser("get_device_connector_can_state").set_defaults(
-        sub_cmd=lambda _: print(backend.get_device_connector_can_state())
+        sub_cmd=lambda ctx: _cli_get(ctx, "get_daemon_state")
     )
-    subparsers.add_parser("get_device_connector_can_state").set_defaults(
-        sub_cmd=lambda _: print(backend.get_device_connector_can_state())
-    )
-    subparsers.add_parser("get_device_connector_camera_state").set_defaults(
-        sub_cmd=lambda _: print(backend.get_device_connector_camera_state())
-    )
-    subparsers.add_parser("get_device_connector_other_state").set_defaults(
-        sub_cmd=lambda _: print(backend.get_device_connector_other_state())
-    )
-    subparsers.add_parser("get_network_state").set_defaults(
-        sub_cmd=lambda _: print(backend.get_network_state())
+    sub = subparsers.add_parser("get_upload_eta")
+    sub.add_argument(
+        "-n",
+        "--samples",
+        type=int,
+        default=6,
+        help="number of get_daemon_state samples",
     )
-    subparsers.add_parser("get_hardware_info").set_defaults(
-        sub_cmd=lambda _: print(backend.get_hardware_info())
+    sub.add_argument(
+        "-i",
+        "--interval",
+        type=float,
+        default=5.0,
+        help="interval between samples in seconds",
     )
+
+    def get_upload_eta(ctx):
+        # The display client keeps a long-running estimate.
+        daemon = ctx.snapshot(["get_daemon_state"]).get("get_daemon_state")
+        if daemon is None:
+            for i in range(max(ctx.args.samples, 2)):
+                if i:
+                    time.sleep(ctx.args.interval)
+                daemon, ok = ctx.backend.get_daemon_state()
+                if not ok:
+                    return daemon, ok
+        return {
+            "pending_data_size": daemon["pending_data_size"],
+            "drain_rate": daemon["drain_rate"],
+            "time_to_empty": daemon["time_to_empty"],
+        }, True
+
+    sub.set_defaults(sub_cmd=lambda ctx: _print_result(ctx, get_upload_eta(ctx)))
+    for name in (
+        "get_device_connector_gps_state",
+        "get_device_connector_can_state",
+        "get_device_connector_camera_state",
+        "get_device_connector_other_state",
+        "get_network_state",
+        "get_hardware_info",
+        "get_circuit_breakers",
+    ):
+        subparsers.add_parser(name).set_defaults(
+            sub_cmd=lambda ctx, name=name: _cli_get(ctx, name)
+        )
     sub = subparsers.add_parser("get_events")
     sub.add_argument(
         "-l",
@@ -1040,10 +1708,47 @@ if __name__ == "__main__":
         default="WARN",
         help="event level (TRACE|DEBUG|INFO|WARN|ERROR|FATAL)",
     )
-    sub.set_defaults(sub_cmd=lambda args: print(backend.get_events(args.level)))
+    sub.set_defaults(
+        sub_cmd=lambda ctx: _print_result(ctx, ctx.backend.get_events(ctx.args.level))
+    )
+    subparsers.add_parser(
+        "all", help="fetch every getter once and print a single JSON snapshot"
+    ).set_defaults(sub_cmd=_cli_all)
+    sub = subparsers.add_parser(
+        "watch", help="poll getters at an interval and print NDJSON records"
+    )
+    sub.add_argument(
+        "getters",
+        nargs="*",
+        type=_getter_name,
+        metavar="getter",
+        help="getters to poll (default: all). choices: " + ", ".join(CLI_GETTERS),
+    )
+    sub.add_argument(
+        "-i",
+        "--interval",
+        type=float,
+        default=5.0,
+        help="polling interval in seconds",
+    )
+    sub.add_argument(
+        "-n",
+        "--count",
+        type=int,
+        default=0,
+        help="number of polling cycles (default: 0, run forever)",
+    )
+    sub.set_defaults(sub_cmd=_cli_watch)
 
     args = parser.parse_args()
     if hasattr(args, "sub_cmd"):
-        args.sub_cmd(args)
+        try:
+            args.sub_cmd(_CliContext(args))
+        except KeyboardInterrupt:
+            pass
     else:
         parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,41 +3,553 @@
 
 import threading
 import time
+from collections import OrderedDict
+from dataclasses import dataclass
 from datetime import datetime, timezone
+from enum import IntEnum
 import logging
 
 import terminal_display_serial as serial
+import terminal_display_trace as trace
+
+
+class Opcode(IntEnum):
+    ERROR = 0x01
+    PING = 0x02
+    INIT = 0x03
+    PROGRESS = 0x04
+    SET_PAGE_NUM = 0x05
+    SET_PAGE = 0x06
+    CLR_PAGE = 0x07
+    EDIT_PAGE = 0x08
+    EDIT_END = 0x09
+    SET_KEY = 0x0A
+    SETUP_END = 0x0B
+    ICON = 0x0C
+    UPDATE = 0x0D
+    SET_VOL = 0x0E
+    BEEP = 0x0F
+    CTRL_LED = 0x10
+    VERSION = 0x11
+    SET_BAUD = 0x12
+
+
+class TextEncoding:
+    """The text protocol, understood by every firmware.
+
+    A command is a JSON-like string followed by "@<cmd_id>".
+    """
+
+    NAME = "text"
+
+    TEMPLATES = {
+        Opcode.ERROR: '"error":{{"time":"{0}","log":"{1}"}}',
+        Opcode.PING: '"ping"',
+        Opcode.INIT: '"init"',
+        Opcode.PROGRESS: '"progress":"{0}"',
+        Opcode.SET_PAGE_NUM: '"setpagenum":"{0}"',
+        Opcode.SET_PAGE: '"setpage":{{"page":"{0}","title":"{1}"}}',
+        Opcode.CLR_PAGE: '"clrpageline":"{0}"',
+        Opcode.EDIT_PAGE: '"edit_page":"{0}"',
+        Opcode.EDIT_END: '"edit_end":"{0}"',
+        Opcode.SET_KEY: '"setkey":{{"page":"{0}","key":"{1}","value":"{2}","color":"{3}"}}',
+        Opcode.SETUP_END: '"setup_end"',
+        Opcode.ICON: '"{0}":"{1}"',
+        Opcode.UPDATE: 'update:"page":"{0}","key":"{1}","value":"{2}","color":"{3}"',
+        Opcode.SET_VOL: '"set_vol":"{0}"',
+        Opcode.BEEP: '"beep":{{"dur":"{0}","tone":"{1}","cnt":"{2}"}}',
+        Opcode.CTRL_LED: '"ctrl_led":{{"type":"{0}","led":"{1}","on":"{2}"}}',
+        Opcode.VERSION: '"version"',
+        Opcode.SET_BAUD: '"set_baud":"{0}"',
+    }
+
+    def encode(self, cmd_id, opcode, fields):
+        return (self.TEMPLATES[opcode].format(*fields) + "@" + str(cmd_id)).encode()
+
+
+class BinaryEncoding:
+    """Compact binary frames, for firmware that announces "bin1".
+
+    Frame: STX, length of the rest (uint16 BE), cmd_id, opcode, fields.
+    Fields: B = uint8, H = uint16 BE, L = uint32 BE, s = UTF-8 string
+    prefixed with its length (uint8), C = color code, I = icon code.
+
+    encode() returns None for a command it can't represent (e.g. an unknown
+    color); the sender sends that one as text.
+    """
+
+    NAME = "bin1"
+
+    STX = 0x02
+    MAX_STR_LEN = 255
+
+    FIELDS = {
+        Opcode.ERROR: "ss",
+        Opcode.PING: "",
+        Opcode.INIT: "",
+        Opcode.PROGRESS: "B",
+        Opcode.SET_PAGE_NUM: "B",
+        Opcode.SET_PAGE: "Bs",
+        Opcode.CLR_PAGE: "B",
+        Opcode.EDIT_PAGE: "B",
+        Opcode.EDIT_END: "B",
+        Opcode.SET_KEY: "BssC",
+        Opcode.SETUP_END: "",
+        Opcode.ICON: "IB",
+        Opcode.UPDATE: "BssC",
+        Opcode.SET_VOL: "B",
+        Opcode.BEEP: "HBB",
+        Opcode.CTRL_LED: "sss",
+        Opcode.VERSION: "",
+        Opcode.SET_BAUD: "L",
+    }
+    COLORS = {
+        "green": 0,
+        "red": 1,
+        "orange": 2,
+        "yellow": 3,
+        "white": 4,
+        "blue": 5,
+        "darkgrey": 6,
+    }
+    ICONS = {
+        "mode": 0,
+        "queue": 1,
+        "network": 2,
+        "gps": 3,
+        "can": 4,
+        "camera": 5,
+    }
+
+    def encode(self, cmd_id, opcode, fields):
+        body = bytearray((cmd_id, opcode))
+        try:
+            for kind, value in zip(self.FIELDS[opcode], fields, strict=True):
+                if kind == "B":
+                    body.append(int(value))
+                elif kind == "H":
+                    body += int(value).to_bytes(2, "big")
+                elif kind == "L":
+                    body += int(value).to_bytes(4, "big")
+                elif kind == "s":
+                    data = str(value).encode()
+                    if len(data) > self.MAX_STR_LEN:
+                        data = data[: self.MAX_STR_LEN].decode(errors="ignore").encode()
+                    body.append(len(data))
+                    body += data
+                elif kind == "C":
+                    body.append(self.COLORS[value])
+                elif kind == "I":
+                    body.append(self.ICONS[value])
+        except (KeyError, ValueError, OverflowError):
+            return None
+
+        return bytes((self.STX,)) + len(body).to_bytes(2, "big") + body
+
+
+TEXT_ENCODING = TextEncoding()
+
+
+class ErrorReporter:
+    """Sends error_log commands for CommandSender without holding up the
+    screen updates.
+
+    Every key (e.g. a page item) may report BURST errors at once and then one
+    every REFILL_SEC seconds. The reports in between are counted and sent as
+    one, e.g. "CAN: disconnected x12 in 60s". At most MAX_PENDING reports
+    wait to be sent, the oldest are dropped beyond that.
+    """
+
+    BURST = 2
+    REFILL_SEC = 30.0
+    MAX_PENDING = 8
+    # Reports wait for a gap in the screen updates, but not longer than this.
+    IDLE_SEC = 0.3
+    MAX_DELAY_SEC = 5.0
+
+    def __init__(self, sender):
+        self._sender = sender
+        self._cond = threading.Condition()
+        # key: [tokens, time of the last refill]
+        self._buckets = {}
+        # key: [message, count, time of the first report]
+        self._pending = OrderedDict()
+        self._suppressed = {}
+        self._thread = None
+
+    def report(self, key, message):
+        """Queue message for key. Never blocks on the serial link."""
+        with self._cond:
+            now = time.monotonic()
+            if key in self._pending:
+                self._merge(self._pending, key, message, now)
+            elif self._take_token(key, now):
+                self._merge(self._pending, key, message, now)
+                self._drop_overflow()
+            else:
+                self._merge(self._suppressed, key, message, now)
+            self._cond.notify()
+
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="error_reporter", daemon=True
+                )
+                self._thread.start()
+
+    @staticmethod
+    def _merge(reports, key, message, now):
+        report = reports.get(key)
+        if report is None:
+            reports[key] = [message, 1, now]
+        else:
+            report[0] = message
+            report[1] += 1
+
+    def _take_token(self, key, now):
+        tokens, last = self._buckets.get(key, (self.BURST, now))
+        tokens = min(self.BURST, tokens + (now - last) / self.REFILL_SEC)
+        if tokens < 1:
+            self._buckets[key] = (tokens, now)
+            return False
+        self._buckets[key] = (tokens - 1, now)
+        return True
+
+    def _drop_overflow(self):
+        while len(self._pending) > self.MAX_PENDING:
+            key, (message, count, _) = self._pending.popitem(last=False)
+            logging.warning(f"error report dropped: {message} ({count})")
+
+    def _release_suppressed(self, now):
+        for key in list(self._suppressed):
+            if key not in self._pending and self._take_token(key, now):
+                self._pending[key] = self._suppressed.pop(key)
+        self._drop_overflow()
+
+        # A full bucket is the same as none.
+        for key in list(self._buckets):
+            tokens, last = self._buckets[key]
+            if (
+                key not in self._suppressed
+                and tokens + (now - last) / self.REFILL_SEC >= self.BURST
+            ):
+                del self._buckets[key]
+
+    def _next_report(self):
+        """The next message to send, or None.
+
+        Returns
+        -------
+        tuple
+            (message, seconds to wait) where the message may be None.
+        """
+        now = time.monotonic()
+        self._release_suppressed(now)
+        if not self._pending:
+            if self._suppressed:
+                # until the first suppressed key gets a token again
+                return None, max(
+                    0.01,
+                    min(
+                        (1 - self._buckets[key][0]) * self.REFILL_SEC
+                        - (now - self._buckets[key][1])
+                        for key in self._suppressed
+                    ),
+                )
+            return None, None
+
+        key, (message, count, first) = next(iter(self._pending.items()))
+        idle = self._sender.idle_time()
+        waited = now - first
+        if idle < self.IDLE_SEC and waited < self.MAX_DELAY_SEC:
+            return None, min(self.IDLE_SEC - idle, self.MAX_DELAY_SEC - waited)
+
+        del self._pending[key]
+        if count > 1:
+            message = f"{message} x{count} in {max(1, round(waited))}s"
+        return message, 0
+
+    def _run(self):
+        while True:
+            with self._cond:
+                message, wait = self._next_report()
+                if message is None:
+                    self._cond.wait(wait)
+                    continue
+            self._sender.error_log(message)
+
+
+@dataclass(frozen=True)
+class BeepPattern:
+    """A beep the display plays by itself from a single command."""
+
+    count: int
+    dur: int
+    tone: int
+    # Played again every repeat_sec seconds while it is set, see
+    # BeepScheduler.set_repeating().
+    repeat_sec: float = None
+
+
+class BeepScheduler:
+    """Plays BeepPatterns on the display from a thread of its own.
+
+    notify() plays a pattern once; asking for it again before it has been
+    played changes nothing. set_repeating() plays a pattern at once and then
+    every repeat_sec seconds until it is unset. Patterns are at least GAP_SEC
+    seconds apart so that they don't run into each other.
+    """
+
+    GAP_SEC = 1.0
+
+    def __init__(self, sender):
+        self._sender = sender
+        self._cond = threading.Condition()
+        # name: pattern to play once
+        self._pending = OrderedDict()
+        # name: [pattern, time it is due]
+        self._repeating = {}
+        self._thread = None
+
+    def notify(self, name, pattern: BeepPattern):
+        with self._cond:
+            if name not in self._pending:
+                self._pending[name] = pattern
+                self._wake()
+
+    def set_repeating(self, name, pattern: BeepPattern):
+        """Play pattern now and then every pattern.repeat_sec seconds. Pass
+        None to stop it."""
+        with self._cond:
+            if pattern is None:
+                self._repeating.pop(name, None)
+            elif self._repeating.get(name, (None,))[0] != pattern:
+                self._repeating[name] = [pattern, time.monotonic()]
+                self._wake()
+
+    def _wake(self):
+        self._cond.notify()
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="beep_scheduler", daemon=True
+            )
+            self._thread.start()
+
+    def _next_beep(self):
+        """The pattern to play now, or None.
+
+        Returns
+        -------
+        tuple
+            (pattern, seconds to wait) where the pattern may be None.
+        """
+        if self._pending:
+            _, pattern = self._pending.popitem(last=False)
+            return pattern, 0
+
+        now = time.monotonic()
+        due = [entry for entry in self._repeating.values() if entry[1] <= now]
+        if due:
+            entry = min(due, key=lambda entry: entry[1])
+            entry[1] = now + entry[0].repeat_sec
+            return entry[0], 0
+        if self._repeating:
+            return None, min(entry[1] for entry in self._repeating.values()) - now
+        return None, None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                pattern, wait = self._next_beep()
+                if pattern is None:
+                    self._cond.wait(wait)
+                    continue
+            self._sender.beep(pattern.count, pattern.dur, pattern.tone)
+            time.sleep(self.GAP_SEC)
 
 
 class CommandSender:
+    # NOTE: At a negotiated baud rate the display goes back to the rate the
+    # link was opened at when it has not received a command for 10 seconds
+    # (the ping timeout). After failing to send at a negotiated rate, the
+    # sender goes back too and retries long enough to cover that.
+    FALLBACK_RETRIES = 6
+
+    # The ACK timeout follows the measured round trip like TCP's
+    # retransmission timeout (RFC 6298), within these bounds.
+    # NOTE: Against the fake display of the benchmarks the round trip is
+    # ~10 ms idle, but up to ~0.8 sec on a single CPU shared with CPU hogs
+    # while another thread holds the GIL. The timeout adapts too slowly to
+    # such a spike after a quiet spell, hence RFC 6298's minimum of 1 sec.
+    MIN_ACK_TIMEOUT = 1.0
+    MAX_ACK_TIMEOUT = 2.0
+    # Pause after each acknowledged command, with the lock released so that
+    # the other threads (e.g. pings and beeps) get their turn.
+    COMMAND_INTERVAL_SEC = 0.1
+
     def __init__(self, serial_option: serial.SerialOption, tz):
         self._serial = serial.Serial(serial_option)
         self._lock = threading.Lock()
         self._receive_ok = True
         self._cmd_id = 0
         self._tz = tz
+        self._encoding = TEXT_ENCODING
+        self._base_baudrate = serial_option.baudrate
+        # Smoothed ACK round trip and its variation, in seconds.
+        self._srtt = None
+        self._rttvar = None
+        self._last_ack = time.monotonic()
+        self._link_down = False
+        self._error_reporter = ErrorReporter(self)
+
+    def set_encoding(self, encoding):
+        """Switch the encoding of the following commands.
+
+        Call it only once the display has announced that it understands
+        encoding, e.g. in reply to "version".
+        """
+        with self._lock:
+            self._encoding = encoding
+        logging.info(f"command encoding: {encoding.NAME}")
+
+    def _encode(self, opcode, fields):
+        data = self._encoding.encode(self._cmd_id, opcode, fields)
+        if data is None:
+            data = TEXT_ENCODING.encode(self._cmd_id, opcode, fields)
+        return data
+
+    def _send_command(self, opcode, *fields):
+        with self._lock, trace.span(opcode.name, "serial"):
+            sent = self._deliver(opcode, fields)
+        if sent:
+            time.sleep(self.COMMAND_INTERVAL_SEC)
+            return True
+
+        logging.error("Can't send command")
+        logging.error("exit()")
+        exit()
+
+    def _deliver(self, opcode, fields):
+        if self._transmit(opcode, fields):
+            return True
+        if self._fall_back_baudrate() and self._transmit(
+            opcode, fields, self.FALLBACK_RETRIES, self.MAX_ACK_TIMEOUT
+        ):
+            return True
+        if self._reconnect() and self._transmit(
+            opcode, fields, self.FALLBACK_RETRIES, self.MAX_ACK_TIMEOUT
+        ):
+            return True
+        self._link_down = True
+        return False
+
+    def _transmit(self, opcode, fields, retries=3, ack_timeout=None):
+        retry = 0
+        # Send a command with cmd_id for retransmission control.
+        data = self._encode(opcode, fields)
+
+        while retry < retries:
+            logging.debug("[SEND]%s", data)
+            self._serial.write(data)
+            self._receive_ok = False  # Waiting to receive 'ACK' frm Display
+
+            sent = time.monotonic()
+            deadline = sent + (ack_timeout or self.ack_timeout())
+            while True:
+                if self._receive_ok:
+                    now = time.monotonic()
+                    self._last_ack = now
+                    # Karn's algorithm: a resent command's round trip is
+                    # ambiguous.
+                    if retry == 0:
+                        self._update_rtt(now - sent)
+                    self._cmd_id = (self._cmd_id + 1) % 10
+                    return True
+                elif self._serial.write_error() is not None:
+                    # Resending to a port that fails to write is no use.
+                    return False
+                elif time.monotonic() >= deadline:
+                    break
+                else:
+                    time.sleep(0.01)
+
+            retry += 1
+            logging.error("Timeout, try to resend")
+        return False
+
+    def _update_rtt(self, rtt):
+        if self._srtt is None:
+            self._srtt = rtt
+            self._rttvar = rtt / 2
+        else:
+            self._rttvar = 0.75 * self._rttvar + 0.25 * abs(self._srtt - rtt)
+            self._srtt = 0.875 * self._srtt + 0.125 * rtt
+
+    def ack_timeout(self):
+        """How long to wait for an ACK before resending, in seconds."""
+        if self._srtt is None:
+            return self.MAX_ACK_TIMEOUT
+        return min(
+            max(self._srtt + 4 * self._rttvar, self.MIN_ACK_TIMEOUT),
+            self.MAX_ACK_TIMEOUT,
+        )
+
+    def idle_time(self):
+        """Seconds since the display acknowledged a command."""
+        return time.monotonic() - self._last_ack
+
+    def link_down(self):
+        """True once a command could not be delivered, even after reopening
+        the serial port."""
+        return self._link_down
+
+    def _reconnect(self):
+        # e.g. the USB serial adapter has been re-enumerated
+        logging.error("no ACK from the display. reopen the serial port")
+        return self._serial.reopen()
+
+    def _fall_back_baudrate(self):
+        # A port that fails to write is reopened instead.
+        if (
+            self._serial.baudrate == self._base_baudrate
+            or self._serial.write_error() is not None
+        ):
+            return False
+
+        logging.error(
+            f"no ACK at {self._serial.baudrate} baud. "
+            f"fall back to {self._base_baudrate} baud"
+        )
+        self._serial.set_baudrate(self._base_baudrate)
+        return True
 
-    def _send_command(self, command):
+    def set_baudrate(self, baudrate):
+        """Move the link to baudrate.
+
+        The display switches after acknowledging "set_baud". The rate is kept
+        only if a ping is acknowledged at it, otherwise the link goes back to
+        the rate it was opened at.
+
+        Returns
+        -------
+        bool
+            True if the link runs at baudrate.
+        """
         with self._lock:
-            retry = 0
-            # Send a command with @cmd_id for retransmission control.
-            command = command + "@" + str(self._cmd_id)
-
-            while retry < 3:
-                logging.debug("[SEND]" + str(command))
-                self._serial.write(str(command).encode())
-                self._receive_ok = False  # Waiting to receive 'ACK' frm Display
-
-                for i in range(200):
-                    if self._receive_ok:
-                        self._cmd_id = (self._cmd_id + 1) % 10
-                        time.sleep(0.1)  # Make time to unlock the other thread
-                        return True
-                    else:
-                        time.sleep(0.01)
-
-                retry += 1
-                logging.error("Timeout, try to resend")
+            if self._transmit(Opcode.SET_BAUD, (baudrate,), retries=1):
+                # The display switches once it has sent the ACK.
+                time.sleep(self.COMMAND_INTERVAL_SEC)
+                self._serial.set_baudrate(baudrate)
+                if self._transmit(Opcode.PING, (), retries=2):
+                    return True
+                self._fall_back_baudrate()
+
+            # If the display has switched anyway (e.g. its ACK was lost), it
+            # comes back by itself.
+            if self._transmit(
+                Opcode.PING, (), self.FALLBACK_RETRIES, self.MAX_ACK_TIMEOUT
+            ):
+                return False
+            self._link_down = True
 
         logging.error("Can't send command")
         logging.error("exit()")
@@ -54,39 +566,43 @@ class CommandSender:
 
     def error_log(self, message):
         ts = datetime.now(self._tz).strftime("%H:%M:%S")
-        command = '"error":{"time":"' + ts + '","log":"' + str(message) + '"}'
-        self._send_command(command)
+        self._send_command(Opcode.ERROR, ts, str(message))
+
+    def report_error(self, key, message):
+        """error_log() from a background thread, rate limited per key.
+
+        Unlike error_log() it returns at once.
+        """
+        self._error_reporter.report(key, message)
 
     def ping(self):
-        return self._send_command('"ping"')
+        return self._send_command(Opcode.PING)
 
     def init(self):
-        return self._send_command('"init"')
+        return self._send_command(Opcode.INIT)
 
     def progress(self, current, all):
         percent = int(float(current / all) * 100)
-        return self._send_command('"progress":"{0}"'.format(percent))
+        return self._send_command(Opcode.PROGRESS, percent)
 
     def set_page_num(self, page_num):
-        return self._send_command('"setpagenum":"{0}"'.format(page_num))
+        return self._send_command(Opcode.SET_PAGE_NUM, page_num)
 
     def set_page(self, index, title):
         max_len = 28
         if len(title) > max_len:
-            logging.debug(f"title is too long. strip title. {title}")
+            logging.debug("title is too long. strip title. %s", title)
             title = title[:max_len]
-        return self._send_command(
-            '"setpage":{{"page":"{0}","title":"{1}"}}'.format(index, title)
-        )
+        return self._send_command(Opcode.SET_PAGE, index, title)
 
     def clr_page(self, index):
-        return self._send_command('"clrpageline":"{0}"'.format(index))
+        return self._send_command(Opcode.CLR_PAGE, index)
 
     def edit_page(self, index):
-        return self._send_command('"edit_page":"{0}"'.format(index))
+        return self._send_command(Opcode.EDIT_PAGE, index)
 
     def edit_end(self, index):
-        return self._send_command('"edit_end":"{0}"'.format(index))
+        return self._send_command(Opcode.EDIT_END, index)
 
     def set_key(self, page, key, value, color):
         if not value:
@@ -94,44 +610,31 @@ class CommandSender:
 
         max_len = 24
         if len(key) + 1 + len(value) > max_len:
-            logging.debug(f"key and value are too long. strip value. {key}:{value}")
+            logging.debug("key and value are too long. strip value. %s:%s", key, value)
             value_len_strip = max_len - len(key) - 1
             value = value[:value_len_strip]
-        return self._send_command(
-            '"setkey":{{"page":"{0}","key":"{1}","value":"{2}","color":"{3}"}}'.format(
-                page, key, value, color
-            )
-        )
+        return self._send_command(Opcode.SET_KEY, page, key, value, color)
 
     def setup_end(self):
-        self._send_command('"setup_end"')
+        self._send_command(Opcode.SETUP_END)
 
     def icon(self, key, value):
-        return self._send_command(f'"{key}":"{value}"')
+        return self._send_command(Opcode.ICON, key, value)
 
     def update_cmd(self, page, key, value, color):
-        cmd = 'update:"page":"{0}","key":"{1}","value":"{2}","color":"{3}"'.format(
-            page, key, value, color
-        )
-        self._send_command(cmd)
+        self._send_command(Opcode.UPDATE, page, key, value, color)
 
     def set_vol(self, vol):
-        return self._send_command('"set_vol":"{}"'.format(vol))
+        return self._send_command(Opcode.SET_VOL, vol)
 
     def beep(self, count, dur, tone):
-        return self._send_command(
-            '"beep":{{"dur":"{0}","tone":"{1}","cnt":"{2}"}}'.format(dur, tone, count)
-        )
+        return self._send_command(Opcode.BEEP, dur, tone, count)
 
     def ctrl_led(self, led_type, led, on):
-        return self._send_command(
-            '"ctrl_led":{{"type":"{0}","led":"{1}","on":"{2}"}}'.format(
-                led_type, led, on
-            )
-        )
+        return self._send_command(Opcode.CTRL_LED, led_type, led, on)
 
     def version(self):
-        return self._send_command('"version"')
+        return self._send_command(Opcode.VERSION)
 
 
 class CommandReceiver:
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import errno
+import io
+import logging
+import os
+import threading
+import time
+
+
+class ConfigPersister:
+    """Save changes to a ConfigParser in the background.
+
+    set() only changes the config in memory. The config file is rewritten
+    once no change has come for debounce_sec seconds, with write_atomic().
+    """
+
+    DEBOUNCE_SEC = 2.0
+
+    def __init__(self, config, path, debounce_sec=DEBOUNCE_SEC):
+        self._config = config
+        self._path = path
+        self._debounce_sec = debounce_sec
+        self._cond = threading.Condition()
+        # time of the last unsaved change
+        self._changed_at = None
+        self._thread = None
+
+    def set(self, section, option, value):
+        """Change the config and save it later. Returns at once."""
+        with self._cond:
+            if self._config.get(section, option, fallback=None) == value:
+                return
+            self._config.set(section, option, value)
+            self._changed_at = time.monotonic()
+            self._cond.notify()
+
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="config_persister", daemon=True
+                )
+                self._thread.start()
+
+    def flush(self):
+        """Save the unsaved changes now.
+
+        Returns
+        -------
+        bool
+            False if they could not be saved.
+        """
+        with self._cond:
+            if self._changed_at is None:
+                return True
+            text = self._serialize()
+            self._changed_at = None
+        return self._save(text)
+
+    def _serialize(self):
+        buf = io.StringIO()
+        self._config.write(buf)
+        return buf.getvalue()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._changed_at is None:
+                    self._cond.wait()
+                wait = self._changed_at + self._debounce_sec - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                text = self._serialize()
+                self._changed_at = None
+            self._save(text)
+
+    def _save(self, text):
+        try:
+            write_atomic(self._path, text)
+            return True
+        except OSError as e:
+            logging.error(f"Error: Could not write to config file:{self._path} {e}")
+            return False
+
+
+def write_atomic(path, text):
+    """Replace the content of the file at path with text.
+
+    The text is written to a temporary file next to it, synced and renamed
+    over it, so that readers see either the old or the new content, also
+    after a power loss.
+
+    NOTE: This is not atomic for a file that is bind-mounted on its own, as
+    the config file of the display client is: it can't be renamed over
+    (EBUSY). It is then rewritten in place, and a power loss meanwhile can
+    leave it truncated. The synced temporary file with the new content is
+    kept until the rewrite is synced. Mount its directory instead to get an
+    atomic write.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    tmp_path = os.path.join(directory, f".{os.path.basename(path)}.tmp")
+    try:
+        _write_synced(tmp_path, text)
+    except OSError as e:
+        _remove(tmp_path)
+        # The directory is read-only, only the file itself can be written.
+        if e.errno not in (errno.EACCES, errno.EROFS):
+            raise
+        _write_synced(path, text)
+        return
+
+    try:
+        os.replace(tmp_path, path)
+    except OSError as e:
+        if e.errno not in (errno.EBUSY, errno.EXDEV):
+            _remove(tmp_path)
+            raise
+        _write_synced(path, text)
+        _remove(tmp_path)
+        return
+
+    # Make the rename itself durable.
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_synced(path, text):
+    with open(path, "w") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _remove(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
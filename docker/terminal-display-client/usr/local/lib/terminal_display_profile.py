@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import cProfile
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+
+import terminal_display_trace as trace
+
+DEFAULT_PROFILE_DIR = "/run/terminal-display/profile"
+DEFAULT_PROFILE_SEC = 30
+
+# Usage on a running client (the collector process of api_process = yes has
+# handlers of its own):
+#
+#   kill -USR1 <pid>   sample the stacks of all the threads for profile_sec
+#                      seconds, written as <name>-<pid>-<time>.collapsed
+#                      (one "thread;outer;...;inner <count>" line per stack,
+#                      for flamegraph.pl or speedscope)
+#   kill -USR2 <pid>   cProfile the main thread for profile_sec seconds (up
+#                      to the next refresh cycle after that), written as
+#                      <name>-<pid>-<time>.pstats
+#
+# NOTE: cProfile only sees the thread it is enabled in (before Python 3.12),
+# i.e. the main thread, which runs the refresh cycle.
+
+SAMPLE_INTERVAL_SEC = 0.01
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return (
+        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    )
+
+
+class StackSampler:
+    """Samples the stacks of all the other threads from a thread of its own."""
+
+    def __init__(self, interval=SAMPLE_INTERVAL_SEC):
+        self._interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+
+    def sample(self):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        me = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            self.stacks[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def run(self, duration):
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            self.sample()
+            time.sleep(self._interval)
+
+    def write(self, path):
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class Profiler:
+    """Profiling on demand, see the usage above.
+
+    install() sets the signal handlers; call it from the main thread. The
+    main thread has to call check() regularly to end a cProfile capture.
+    """
+
+    def __init__(
+        self, name, directory=DEFAULT_PROFILE_DIR, duration=DEFAULT_PROFILE_SEC
+    ):
+        self._name = name
+        self._directory = directory
+        self._duration = duration
+        self._sampling = False
+        self._profile = None
+        self._profile_until = None
+
+    def install(self):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: self.start_sampling())
+        signal.signal(signal.SIGUSR2, lambda signum, frame: self.start_profile())
+
+    def _path(self, suffix):
+        os.makedirs(self._directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        return os.path.join(
+            self._directory, f"{self._name}-{os.getpid()}-{stamp}.{suffix}"
+        )
+
+    def start_sampling(self):
+        if self._sampling:
+            logging.info("stack sampling is already running")
+            return
+        self._sampling = True
+        logging.info(f"sample the stacks for {self._duration} sec")
+        threading.Thread(target=self._sample, name="profile", daemon=True).start()
+
+    def _sample(self):
+        try:
+            sampler = StackSampler()
+            sampler.run(self._duration)
+            path = self._path("collapsed")
+            sampler.write(path)
+            logging.info(f"{sampler.samples} stack samples written to {path}")
+        except OSError as e:
+            logging.error(f"can't write the stack samples: {e}")
+        finally:
+            self._sampling = False
+
+    def start_profile(self):
+        """Start a cProfile capture of the calling thread."""
+        if self._profile:
+            logging.info("cProfile is already running")
+            return
+        logging.info(f"cProfile for {self._duration} sec")
+        self._profile = cProfile.Profile()
+        self._profile_until = time.monotonic() + self._duration
+        self._profile.enable()
+
+    def check(self):
+        """End the cProfile capture once it is due. Call it from the thread
+        that started it."""
+        if not self._profile or time.monotonic() < self._profile_until:
+            return
+        profile = self._profile
+        profile.disable()
+        self._profile = None
+        try:
+            path = self._path("pstats")
+            profile.dump_stats(path)
+            logging.info(f"cProfile written to {path}")
+        except OSError as e:
+            logging.error(f"can't write the cProfile: {e}")
+
+    def dump_trace(self):
+        """Write the spans of terminal_display_trace as
+        <name>-<pid>-<time>.trace.json."""
+        try:
+            path = self._path("trace.json")
+            trace.dump(path)
+            logging.info(f"trace written to {path}")
+        except OSError as e:
+            logging.error(f"can't write the trace: {e}")
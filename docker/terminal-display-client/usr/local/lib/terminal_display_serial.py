@@ -2,9 +2,11 @@
 # coding: utf-8
 
 import serial
+import termios
 import threading
 import time
 import logging
+from collections import deque
 from dataclasses import dataclass
 
 
@@ -28,10 +30,43 @@ class SingletonMeta(type):
 
 
 class Serial(metaclass=SingletonMeta):
+    # The writer thread holds back while the driver still has more than this
+    # many bytes queued, so a slow or stalled tty never grows the kernel buffer.
+    OUT_WAITING_HIGH_WATER = 256
+    OUT_WAITING_POLL_SEC = 0.002
+    # Frames from the display end with CRLF. Bytes that do not form a frame
+    # within this length (e.g. the ESP32 boot log after a reset) are dropped.
+    FRAME_DELIMITER = b"\r\n"
+    MAX_FRAME_LEN = 1024
+    # Pause of the reader after a read error, until the port is reopened.
+    READ_ERROR_SEC = 0.5
+
     def __init__(self, option: SerialOption):
+        self._option = option
         self._ser = serial.Serial(option.port, option.baudrate, timeout=option.timeout)
-        self._write_lock = threading.Lock()
         self._read_lock = threading.Lock()
+        self._read_buf = bytearray()
+        self._frames = deque()
+        # Set when the baud rate changes; the partial frame read so far is
+        # garbage.
+        self._discard_read_buf = False
+
+        # Outgoing bytes are appended by producers and drained by the writer
+        # thread. Everything queued while the previous write() was in progress
+        # is coalesced into a single write() call.
+        # NOTE: CommandSender waits for the ACK of a command before it sends
+        # the next one, so its commands reach the buffer one at a time and
+        # are not coalesced. The thread keeps the out_waiting flow control
+        # and a driver write() that blocks away from the sender.
+        self._write_buf = bytearray()
+        self._write_cond = threading.Condition()
+        self._writing = False
+        # The error of the last failed write, until the port is reopened.
+        self._write_error = None
+        self._writer = threading.Thread(
+            target=self._writer_thread, name="serial_writer", daemon=True
+        )
+        self._writer.start()
 
     def reset(self):
         self._ser.setDTR(False)
@@ -39,12 +74,143 @@ class Serial(metaclass=SingletonMeta):
         self._ser.setRTS(False)
         self._ser.rtscts = False
 
+    @property
+    def baudrate(self):
+        return self._ser.baudrate
+
+    def set_baudrate(self, baudrate):
+        """Change the baud rate once everything queued has been sent."""
+        self.flush()
+        # Wait until the driver has sent the last byte at the old rate.
+        self._ser.flush()
+        self._ser.baudrate = baudrate
+        self._ser.reset_input_buffer()
+        self._discard_read_buf = True
+        logging.info("baud rate: %d", baudrate)
+
+    def reopen(self):
+        """Close the port and open it again at the initial baud rate.
+
+        Returns
+        -------
+        bool
+            False if the port can't be opened.
+        """
+        self.flush()
+        old = self._ser
+        try:
+            self._ser = serial.Serial(
+                self._option.port, self._option.baudrate, timeout=self._option.timeout
+            )
+        except (serial.SerialException, OSError) as e:
+            logging.error("can't reopen %s: %s", self._option.port, e)
+            return False
+        self._discard_read_buf = True
+        self._write_error = None
+        # NOTE: A read() blocked on the old port fails; the reader goes on
+        # with the new one.
+        old.close()
+        logging.info("reopened %s", self._option.port)
+        return True
+
     def write(self, data):
-        with self._write_lock:
-            logging.debug(f"write: {data}")
-            self._ser.write(data)
+        """Queue data for the writer thread and return without touching the tty."""
+        with self._write_cond:
+            self._write_buf += data
+            self._write_cond.notify()
+        logging.debug("write: %s", data)
+
+    def write_error(self):
+        """The error of the last failed write since the port was opened, or
+        None. The bytes queued at that time are dropped."""
+        return self._write_error
+
+    def flush(self, timeout=None):
+        """Wait until every queued byte has been handed to the driver.
+
+        Returns
+        -------
+        bool
+            False if the timeout expired first.
+        """
+        with self._write_cond:
+            return self._write_cond.wait_for(
+                lambda: not self._write_buf and not self._writing, timeout
+            )
 
     def readline(self):
+        """Return the next frame from the display, including the CRLF.
+
+        Blocks until a complete frame has been received, unless a timeout is
+        set in SerialOption, in which case b"" is returned when it expires.
+        """
         with self._read_lock:
-            logging.debug(f"readline")
-            return self._ser.readline()
+            while not self._frames:
+                if not self._read_frames():
+                    return b""
+            return self._frames.popleft()
+
+    def _read_frames(self):
+        # Take everything the driver has in one read() instead of pyserial's
+        # byte-by-byte readline(), or wait for the next byte if there is none.
+        port = self._ser
+        try:
+            data = port.read(max(1, port.in_waiting))
+        except (serial.SerialException, OSError, TypeError) as e:
+            # pyserial fails with TypeError when the port is closed under it.
+            if port is self._ser:
+                logging.error("serial read failed: %s", e)
+                time.sleep(self.READ_ERROR_SEC)
+            return True
+        if not data:
+            return False
+        logging.debug("read: %s", data)
+
+        buf = self._read_buf
+        if self._discard_read_buf:
+            self._discard_read_buf = False
+            buf.clear()
+        buf += data
+        end = buf.rfind(self.FRAME_DELIMITER)
+        if end >= 0:
+            frames = bytes(buf[:end]).split(self.FRAME_DELIMITER)
+            del buf[: end + len(self.FRAME_DELIMITER)]
+            self._frames.extend(frame + self.FRAME_DELIMITER for frame in frames)
+
+        if len(buf) > self.MAX_FRAME_LEN:
+            logging.warning("drop %d bytes without a frame delimiter", len(buf))
+            buf.clear()
+        return True
+
+    def _wait_out_waiting(self):
+        # out_waiting is not available on every platform; without it the
+        # driver's own blocking write() is the only flow control.
+        try:
+            while self._ser.out_waiting > self.OUT_WAITING_HIGH_WATER:
+                time.sleep(self.OUT_WAITING_POLL_SEC)
+        except (AttributeError, NotImplementedError, serial.SerialException):
+            pass
+
+    def _writer_thread(self):
+        while True:
+            with self._write_cond:
+                self._write_cond.wait_for(lambda: self._write_buf)
+                data = bytes(self._write_buf)
+                self._write_buf.clear()
+                self._writing = True
+
+            error = None
+            try:
+                self._wait_out_waiting()
+                self._ser.write(data)
+            except (serial.SerialException, OSError, termios.error) as e:
+                # e.g. the USB serial adapter has been unplugged
+                logging.error("serial write failed: %s", e)
+                error = e
+            finally:
+                with self._write_cond:
+                    if error is not None:
+                        self._write_error = error
+                        self._write_buf.clear()
+                    self._writing = False
+                    self._write_cond.notify_all()
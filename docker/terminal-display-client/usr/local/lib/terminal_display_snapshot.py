@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+import time
+from datetime import datetime
+
+import terminal_display_trace as trace
+
+DEFAULT_SOCKET_PATH = "/run/terminal-display/snapshot.sock"
+
+# Query protocol (one request and one response per connection, both a single
+# line terminated by LF):
+#
+#   request:  "get" [section ...]     all sections if none is given
+#             "list"                  names of the published sections
+#             "trace"                 spans of terminal_display_trace
+#
+#   response: {"ok": true, "update_time": <unix time>, "age": <sec>,
+#              "sections": {<section>: <value>, ...},
+#              "ages": {<section>: <sec>, ...}}
+#             {"ok": true, "update_time": ..., "age": ..., "names": [...]}
+#             {"ok": true, ..., "trace": {"traceEvents": [...]}}
+#             {"ok": false, "error": "<message>"}
+#
+# Sections that are not published are returned as null. "age" is the time
+# since the last publish. The client keeps a section's last good value when
+# fetching it fails, so "ages" tells for each section the time since it was
+# last fetched successfully: null if it never was or is not published.
+
+MAX_REQUEST_LEN = 1024
+
+
+def _json_default(obj):
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    return str(obj)
+
+
+class SnapshotServer:
+    """Publish the latest per-cycle API responses over a Unix domain socket."""
+
+    def __init__(self, path=DEFAULT_SOCKET_PATH):
+        self._path = path
+        self._lock = threading.Lock()
+        self._sections = {}
+        # section: unix time it was last fetched successfully
+        self._section_update_times = {}
+        self._update_time = None
+        self._server = None
+
+    def publish(self, sections: dict, ages: dict = None):
+        """Publish sections. ages maps a section to the seconds since it was
+        fetched successfully, or None if it never was; a section without an
+        age counts as fetched now."""
+        # NOTE: The values are not copied. The client replaces them on every
+        # update and never modifies them in place.
+        now = time.time()
+        ages = ages or {}
+        update_times = {}
+        for name in sections:
+            age = ages.get(name, 0)
+            update_times[name] = None if age is None else now - age
+        with self._lock:
+            self._sections = dict(sections)
+            self._section_update_times = update_times
+            self._update_time = now
+
+    def start(self):
+        try:
+            os.unlink(self._path)
+        except FileNotFoundError:
+            pass
+
+        snapshot = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            timeout = 1.0
+
+            def handle(self):
+                try:
+                    line = self.rfile.readline(MAX_REQUEST_LEN)
+                except (OSError, socket.timeout):
+                    return
+                response = snapshot._respond(line.decode(errors="replace").split())
+                try:
+                    self.wfile.write(response.encode() + b"\n")
+                except OSError:
+                    pass
+
+        self._server = socketserver.ThreadingUnixStreamServer(self._path, Handler)
+        self._server.daemon_threads = True
+        threading.Thread(
+            target=self._server.serve_forever, name="snapshot_server", daemon=True
+        ).start()
+        logging.info("snapshot server listening on %s", self._path)
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        try:
+            os.unlink(self._path)
+        except FileNotFoundError:
+            pass
+
+    def _respond(self, request):
+        with self._lock:
+            sections = self._sections
+            section_update_times = self._section_update_times
+            update_time = self._update_time
+
+        now = time.time()
+        response = {"ok": True}
+        if update_time is not None:
+            response["update_time"] = update_time
+            response["age"] = round(now - update_time, 3)
+
+        if not request:
+            response = {"ok": False, "error": "empty request"}
+        elif request[0] == "get":
+            names = request[1:] or list(sections)
+            response["sections"] = {name: sections.get(name) for name in names}
+            response["ages"] = {}
+            for name in names:
+                section_update_time = section_update_times.get(name)
+                response["ages"][name] = (
+                    None
+                    if section_update_time is None
+                    else round(now - section_update_time, 3)
+                )
+        elif request[0] == "list":
+            response["names"] = list(sections)
+        elif request[0] == "trace":
+            response["trace"] = trace.chrome_trace()
+        else:
+            response = {"ok": False, "error": f"unknown request: {request[0]}"}
+
+        return json.dumps(response, default=_json_default, ensure_ascii=False)
+
+
+def query(request, path=DEFAULT_SOCKET_PATH, timeout=2.0):
+    """Send a request to a SnapshotServer.
+
+    Returns
+    -------
+    obj or None
+        The decoded response, or None if no server is listening on path.
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(path)
+            sock.sendall(request.encode() + b"\n")
+            chunks = []
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+    except OSError:
+        return None
+
+    try:
+        return json.loads(b"".join(chunks))
+    except ValueError:
+        return None
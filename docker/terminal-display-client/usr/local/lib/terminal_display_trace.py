@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import os
+import threading
+import time
+from collections import deque
+
+# Spans of the refresh pipeline (backend getters, HTTP calls, collectors,
+# screen updates and serial commands) kept in a ring of the latest ones, for
+# the Chrome trace viewer (chrome://tracing) or https://ui.perfetto.dev.
+#
+# Disabled (the default) span() costs a function call:
+#
+#   with trace.span("get", "backend", endpoint=endpoint):
+#       ...
+
+# Ring of (name, category, start ns, duration ns, thread id, args), or None
+# while disabled.
+_spans = None
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("_name", "_cat", "_args", "_start")
+
+    def __init__(self, name, cat, args):
+        self._name = name
+        self._cat = cat
+        self._args = args
+
+    def __enter__(self):
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter_ns()
+        spans = _spans
+        if spans is not None:
+            spans.append(
+                (
+                    self._name,
+                    self._cat,
+                    self._start,
+                    end - self._start,
+                    threading.get_ident(),
+                    self._args,
+                )
+            )
+        return False
+
+
+def enable(capacity):
+    """Keep the latest capacity spans. 0 disables tracing."""
+    global _spans
+    _spans = deque(maxlen=capacity) if capacity > 0 else None
+
+
+def enabled():
+    return _spans is not None
+
+
+def span(name, cat="", **args):
+    """Context manager that records the time spent in its block."""
+    if _spans is None:
+        return _NULL_SPAN
+    return _Span(name, cat, args)
+
+
+def chrome_trace():
+    """The spans in the Chrome trace event format.
+
+    Returns
+    -------
+    dict
+        {"traceEvents": [...]} with one complete ("X") event per span and
+        the names of the threads.
+    """
+    spans = list(_spans or ())
+    pid = os.getpid()
+    # perf_counter_ns() has no fixed origin; start at the first span.
+    origin = min((start for _, _, start, _, _, _ in spans), default=0)
+
+    events = []
+    for thread in threading.enumerate():
+        events.append(
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": thread.ident,
+                "args": {"name": thread.name},
+            }
+        )
+    for name, cat, start, duration, tid, args in spans:
+        events.append(
+            {
+                "name": name,
+                "cat": cat,
+                "ph": "X",
+                "ts": (start - origin) / 1000,
+                "dur": duration / 1000,
+                "pid": pid,
+                "tid": tid,
+                "args": args,
+            }
+        )
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def dump(path):
+    """Write chrome_trace() to path."""
+    import json
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(chrome_trace(), f, default=str)
@@ -1,13 +1,14 @@
 #!/usr/bin/env python3
 # coding: utf-8
 
-import hashlib
-from dataclasses import dataclass, asdict, field
+from dataclasses import dataclass, field
 from typing import List, Tuple
 import logging
+import threading
 from enum import Enum, IntEnum
 
 import terminal_display_command as cmd
+import terminal_display_trace as trace
 
 #
 # Main Screen
@@ -128,7 +129,11 @@ class ListScreenValueColor:
         )
 
 
-@dataclass
+# NOTE: The widget model is slotted to keep it small. The client builds it on
+# every cycle and the screens keep a copy of what has been drawn.
+
+
+@dataclass(slots=True)
 class PageItem:
     key: str
     value: str
@@ -138,41 +143,67 @@ class PageItem:
     def is_error(self):
         return self.color == ListScreenValueColorEnum.RED
 
+    def same_as(self, other: "PageItem"):
+        # Same as ==, without building a tuple of the fields.
+        return (
+            self.key == other.key
+            and self.value == other.value
+            and self.color is other.color
+            and self.error_msg == other.error_msg
+        )
 
-@dataclass
+    def assign(self, other: "PageItem"):
+        self.key = other.key
+        self.value = other.value
+        self.color = other.color
+        self.error_msg = other.error_msg
+
+
+@dataclass(slots=True)
 class PageItems:
     page_items: List[PageItem] = field(default_factory=list)
 
     def __iter__(self):
-        yield from self.page_items
-
-    def md5sum(self):
-        page_items_dict = [asdict(item) for item in self.page_items]
-        page_items_str = str(page_items_dict).encode()
-        return hashlib.md5(page_items_str).hexdigest()
+        return iter(self.page_items)
 
     def append(self, page_item: PageItem):
         self.page_items.append(page_item)
 
-
-@dataclass
+    def same_as(self, page_items):
+        n = 0
+        for n, item in enumerate(page_items, 1):
+            if n > len(self.page_items) or not self.page_items[n - 1].same_as(item):
+                return False
+        return n == len(self.page_items)
+
+    def assign(self, page_items):
+        """Copy page_items into this object, reusing its PageItem objects."""
+        n = 0
+        for n, item in enumerate(page_items, 1):
+            if n <= len(self.page_items):
+                self.page_items[n - 1].assign(item)
+            else:
+                self.page_items.append(
+                    PageItem(item.key, item.value, item.color, item.error_msg)
+                )
+        del self.page_items[n:]
+
+
+@dataclass(slots=True)
 class MainScreenIcon:
     type: MainScreenIconType
     value: int
     page_item: PageItem
 
 
-@dataclass
+@dataclass(slots=True)
 class MainScreenContent:
     icons: List[MainScreenIcon] = field(default_factory=list)
+    # The icons are out of date; they are shown as NONE.
+    stale: bool = False
 
     def __iter__(self):
-        yield from self.icons
-
-    def md5sum(self):
-        icons_dict = [asdict(icon) for icon in self.icons]
-        icons_str = str(icons_dict).encode()
-        return hashlib.md5(icons_str).hexdigest()
+        return iter(self.icons)
 
     def append(self, icon: MainScreenIcon):
         self.icons.append(icon)
@@ -181,20 +212,67 @@ class MainScreenContent:
 class MainScreen:
     def __init__(self, cmd_send: cmd.CommandSender):
         self._cmd_send = cmd_send
-        self.hash = None
+        # icon type -> value currently shown on the display
+        self._drawn = dict()
+        self._content = None
+        # icon type -> value shown instead of the collected one
+        self._overrides = dict()
+        # Set by the client when the contents have not been refreshed for long.
+        self._stale = False
+        # NOTE: Overrides and staleness are set from other threads than the
+        # updates.
+        self._lock = threading.Lock()
 
     def update(self, content: MainScreenContent):
         if not content:
             return
 
-        hash = content.md5sum()
-        if self.hash == hash:
+        # NOTE: The client passes the same object again if nothing has changed.
+        if content is self._content:
             return
 
-        for icon in content:
-            self._cmd_send.icon(icon.type.value, icon.value)
-
-        self.hash = hash
+        with self._lock, trace.span("MainScreen.update", "screen"):
+            self._content = content
+            self._draw_content()
+
+    def set_override(self, icon_type: MainScreenIconType, value: int):
+        """Show value for icon_type at once, whatever is collected (also
+        when stale), until clear_override()."""
+        with self._lock:
+            self._overrides[icon_type] = value
+            self._draw_icon(icon_type, value)
+
+    def clear_override(self, icon_type: MainScreenIconType):
+        with self._lock:
+            if self._overrides.pop(icon_type, None) is None:
+                return
+            self._draw_content()
+
+    def set_stale(self, stale: bool):
+        """Show the collected icons as NONE while stale."""
+        with self._lock:
+            if stale == self._stale:
+                return
+            self._stale = stale
+            self._draw_content()
+
+    def _draw_content(self):
+        if self._content is None:
+            return
+        stale = self._stale or self._content.stale
+        for icon in self._content:
+            if icon.type in self._overrides:
+                value = self._overrides[icon.type]
+            elif stale:
+                value = 0  # NONE of every icon
+            else:
+                value = icon.value
+            self._draw_icon(icon.type, value)
+
+    def _draw_icon(self, icon_type, value):
+        if self._drawn.get(icon_type) != value:
+            self._cmd_send.icon(icon_type.value, value)
+            self._drawn[icon_type] = value
 
 
 #
@@ -202,7 +280,7 @@ class MainScreen:
 #
 
 
-@dataclass
+@dataclass(slots=True)
 class PageOptions:
     title: str
     index: int = 0
@@ -211,7 +289,10 @@ class PageOptions:
 class Page:
     def __init__(self, options: PageOptions):
         self._options = options
-        self.hash = None
+        # Copy of the items currently shown on the display, updated in place.
+        self._drawn = None
+        self._page_items = None
+        self._cleared = False
         self.error_reported_flags = dict()
 
     def set_index(self, index):
@@ -231,7 +312,10 @@ class Page:
                 else:
                     error_msg = f"{self._options.title}: {item.key} = {item.value}"
 
-                cmd_send.error_log(error_msg)
+                # NOTE: A flapping item is reported again on every change to
+                # RED, so the reports are rate limited and sent in the
+                # background.
+                cmd_send.report_error(f"{self._options.title}: {item.key}", error_msg)
                 self.error_reported_flags[item.key] = True
         else:
             self.error_reported_flags[item.key] = False
@@ -240,25 +324,47 @@ class Page:
         if not page_items:
             return
 
-        hash = page_items.md5sum()
-        if self.hash == hash:
+        # NOTE: The client passes the same object again if nothing has changed.
+        if page_items is self._page_items and self._drawn is not None:
             return
+        self._page_items = page_items
 
-        logging.debug(f"UPDATE {self._options.title} page = {page_items}")
-        cmd_send.edit_page(self._options.index)
-        for item in page_items:
-            cmd_send.set_key(
-                self._options.index, item.key, item.value, item.color.value
-            )
-            self._check_error_report(cmd_send, item)
-        cmd_send.edit_end(self._options.index)
+        if self._drawn is not None and self._drawn.same_as(page_items):
+            return
 
-        self.hash = hash
+        logging.debug(f"UPDATE {self._options.title} page = {page_items}")
+        with trace.span("Page.update", "screen", title=self._options.title):
+            cmd_send.edit_page(self._options.index)
+            for item in page_items:
+                cmd_send.set_key(
+                    self._options.index, item.key, item.value, item.color.value
+                )
+                self._check_error_report(cmd_send, item)
+            cmd_send.edit_end(self._options.index)
+
+        if self._drawn is None:
+            self._drawn = PageItems()
+        self._drawn.assign(page_items)
+        self._cleared = False
+
+        # Forget the items that are no longer on the page.
+        if len(self.error_reported_flags) > len(self._drawn.page_items):
+            keys = {item.key for item in self._drawn}
+            self.error_reported_flags = {
+                key: flag
+                for key, flag in self.error_reported_flags.items()
+                if key in keys
+            }
 
     def clear(self, cmd_send: cmd.CommandSender):
+        if self._cleared:
+            return
+
         cmd_send.edit_page(self._options.index)
         cmd_send.clr_page(self._options.index)
         cmd_send.edit_end(self._options.index)
+        self._drawn = None
+        self._cleared = True
 
 
 PageContents = List[Tuple[Page, PageItems]]
@@ -266,18 +372,28 @@ PageContents = List[Tuple[Page, PageItems]]
 UpdatedFlag = bool
 
 
-@dataclass
+@dataclass(slots=True)
 class Collection:
     page: Page
     page_items: PageItems
     updated: bool
+    # Not drawn yet because the page is not near the visible page.
+    dirty: bool = False
+    clear: bool = False
 
 
 class ListScreen:
+    # NOTE: Once the display reports the page it shows, only that page and
+    # its neighbors are drawn as soon as they change. The other pages are
+    # drawn a few per refresh(), or when the display navigates close to them.
+    LAZY_PAGES_PER_REFRESH = 1
+
     def __init__(self, cmd_send: cmd.CommandSender):
         self._cmd_send = cmd_send
         self._collections: List[Collection] = list()
         self._page_num = 0
+        self._visible_page = None
+        self._lazy_index = 0
 
     def get_collections(self):
         return self._collections
@@ -308,21 +424,62 @@ class ListScreen:
         self._cmd_send.setup_end()
         self._cmd_send.beep(1, 200, 1)
 
+    def set_visible_page(self, index):
+        """Set the page shown on the display, or None if it is unknown."""
+        self._visible_page = index
+
+    def _is_near_visible(self, index):
+        if self._visible_page is None:
+            return True
+        # NOTE: The main screen is reported as -1. Page 0 is the next one.
+        visible = max(self._visible_page, 0)
+        page_num = len(self._collections)
+        return min((index - visible) % page_num, (visible - index) % page_num) <= 1
+
     def update_page(self, update_page: Page, page_items: PageItems):
         for i, collection in enumerate(self._collections):
             # FIXME: Supports dynamically adding pages
             # Currently, only pages that exist at the time of build() execution can be updated.
             # If a page does not exist at the time of addition, we would like to support updating the page number before updating the page.
             if collection.page.get_title() == update_page.get_title():
-                collection.page.update(self._cmd_send, page_items)
-                self._collections[i].page_items = page_items
-                self._collections[i].updated = True
+                collection.page_items = page_items
+                collection.updated = True
+                collection.clear = False
+                collection.dirty = True
+                if self._is_near_visible(i):
+                    self._draw(collection)
 
     def delete_unupdated_page_items(self):
         for i, collection in enumerate(self._collections):
             if not collection.updated:
-                collection.page.clear(self._cmd_send)
-            self._collections[i].updated = False
+                collection.clear = True
+                collection.dirty = True
+                if self._is_near_visible(i):
+                    self._draw(collection)
+            collection.updated = False
+
+    def refresh(self, lazy_pages=LAZY_PAGES_PER_REFRESH):
+        """Draw the pending pages near the visible page and up to lazy_pages
+        of the others."""
+        for i, collection in enumerate(self._collections):
+            if collection.dirty and self._is_near_visible(i):
+                self._draw(collection)
+
+        for _ in range(len(self._collections)):
+            if lazy_pages <= 0:
+                break
+            collection = self._collections[self._lazy_index]
+            self._lazy_index = (self._lazy_index + 1) % len(self._collections)
+            if collection.dirty:
+                self._draw(collection)
+                lazy_pages -= 1
+
+    def _draw(self, collection: Collection):
+        if collection.clear:
+            collection.page.clear(self._cmd_send)
+        else:
+            collection.page.update(self._cmd_send, collection.page_items)
+        collection.dirty = False
 
     def is_error(self) -> bool:
         for collection in self.get_collections():